@@ -1,15 +1,33 @@
 #Divide the file_links.csv file into smaller files for easier processing.
+import argparse
+import csv
 
-import pandas as pd
+parser = argparse.ArgumentParser(description="Divide scraper/file_links.csv into batches or load it into a work queue.")
+parser.add_argument("--queue", help="add the documents to this SQLite work queue instead of writing CSV batches; "
+                                    "workers claim them with 2_download_and_process_pdf_files.py --queue")
+args = parser.parse_args()
 
-# Load the file_links.csv file
-df = pd.read_csv("scraper/file_links.csv")
+# Load the file_links.csv file (the csv module, pandas alone would take longer to import than the split takes)
+with open("scraper/file_links.csv", newline="", encoding="utf-8") as file:
+    reader = csv.DictReader(file)
+    fieldnames = reader.fieldnames
+    rows = list(reader)
 
-# Split the data into chunks of 250 rows each
-chunks = [df.iloc[i:i+250] for i in range(0, len(df), 250)]
+if args.queue:
+    from utils.work_queue import WorkQueue, format_progress
 
-# Save each chunk to a separate CSV file
-for i, chunk in enumerate(chunks):
-    chunk.to_csv(f"doctorates_{i+1}.csv", index=False)
+    work_queue = WorkQueue(args.queue)
+    work_queue.add(rows)
+    print(format_progress(work_queue.progress()))
+else:
+    # Split the data into chunks of 250 rows each
+    chunks = [rows[i:i+250] for i in range(0, len(rows), 250)]
 
-print(f"Data divided into {len(chunks)} files.")
\ No newline at end of file
+    # Save each chunk to a separate CSV file
+    for i, chunk in enumerate(chunks):
+        with open(f"doctorates_{i+1}.csv", "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=fieldnames, lineterminator="\n")
+            writer.writeheader()
+            writer.writerows(chunk)
+
+    print(f"Data divided into {len(chunks)} files.")
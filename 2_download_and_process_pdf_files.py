@@ -1,70 +1,119 @@
 # Program for removing XML parts from the xml files scraped from the Polish Medical Thesis database.
+import argparse
 import glob
+import json
+import multiprocessing
 import os
 import re
 import shutil
 import socket
-import sys
-import urllib.request as URL
-import pandas as pd
-import IPython.display as display
-import subprocess
-from PyPDF2 import PdfReader
-from concurrent.futures import ThreadPoolExecutor
-import spacy
-from spacy.cli import download
-from spacy.language import Language
-from spacy_langdetect import LanguageDetector
-from utils.Labeling_text import training
-
-@Language.factory("language_detector")
-def create_language_detector(nlp, name):
-    return LanguageDetector()
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import utils.prefilter
+import utils.tei
+import utils.text_filter
+import utils.text_layer
+from utils.Labeling_text import MODEL_CONFIG, build_model
+from utils.artifacts import ARTIFACT_CONFIG, ArtifactStore, open_artifact
+from utils.corpus import CORPUS_CONFIG, CorpusWriter
+from utils.downloader import DOWNLOAD_CONFIG, Downloader
+from utils.grobid import GrobidClient
+from utils.manifest import Manifest, code_version, file_hash, text_hash
+from utils.metrics import METRICS, METRICS_CONFIG, profile_slow
+from utils.pdf_check import PdfValidator, sha256_of, sidecar_path
+from utils.pipeline import Stage, run_pipeline
+from utils.prefilter import PREFILTER_CONFIG, format_report
+from utils.tei import iter_paragraphs
+from utils.text_layer import TEXT_LAYER_CONFIG, read_paragraphs, route_pdf
+from utils.text_filter import HIERARCHY_CONFIG, filter_documents, is_kept, load_pipeline
+from utils.verdict_cache import CACHE_CONFIG, model_fingerprint, open_cache
+from utils.work_queue import QUEUE_CONFIG, Heartbeat, WorkQueue, format_progress, worker_name
 
-def filters_list(text):
-    doc = nlp(text)
-    return (doc._.language['language'] == "pl" and
-        doc.cats["Other"] > 0.40)
+# Defaults for the "nlp" section of config.json
+NLP_CONFIG = {
+    "batch_size": 256,  # sentences per nlp.pipe batch
+    "n_process": 1  # worker processes used by nlp.pipe
+}
 
+# Defaults for the "pipeline" section of config.json
+PIPELINE_CONFIG = {
+    "download_workers": 8,  # threads downloading PDFs
+    "grobid_workers": None,  # requests sent to Grobid at the same time, defaults to grobid.concurrency
+    "nlp_processes": 4,  # processes cleaning the text, 0 cleans in the main process
+    "queue_size": 16  # documents waiting in front of each stage
+}
 
-def filter_paragraphs(paragraphs):
-    filtered_text = " ".join([f'{p}\n' for p in paragraphs if filters_list(p)])
-    return filtered_text
+# Versions of the stages stored in the manifest, a stage is recomputed when its version changes
+GROBID_VERSION = None  # hash of the Grobid request settings, set in __main__
+ROUTE_VERSION = None  # hash of the text-layer code and settings, set in __main__
+CLEAN_VERSION = None  # hash of the cleaning code, the model and the filter settings, set in __main__
 
-def filter_sentences(paragraphs):
-    text = (" ".join(paragraphs)).split(". ")
-    filtered_text = "".join([f"{s}. " for s in text if filters_list(s)])
-    return filtered_text
+# Process pool of the cleaning stage, created in __main__
+NLP_POOL = None
+# Without the pool, documents are cleaned one at a time by the pipeline of this process
+NLP_LOCK = threading.Lock()
 
-def is_pdf_valid(file_path):
-    try:
-        with open(file_path, 'rb') as f:
-            reader = PdfReader(f)
-            _ = reader.pages[0]
-        return True
-    except Exception as e:
-        return False
+# Number of sentences decided by each tier of the classifier
+TIER_STATS = Counter()
 
-def remove_xml_parts(file_path):
-    """Remove XML parts from the given XML file."""
-    # save title of file
-    with open(file_path, "r", encoding="utf-8") as file:
-        content = file.read()
+# Verdicts of sentences classified in previous runs, opened once the model is loaded
+VERDICT_CACHE = None
 
-    # remove all citations and references in <ref> tags (and whitespaces in front of them)
-    content = re.sub(r'<ref[^>]*/>', '', content, flags=re.S)
-    content = re.sub(r'<ref[^>]*>.*?</ref>', '', content, flags=re.S)
-    content = re.sub(r'<p[^>]*>Tabela.*?/div>', '</div>>', content, flags=re.S)
+# Sections of config.json merged with their defaults (see load_config), set in __main__ and init_nlp_worker
+NLP_SETTINGS = NLP_CONFIG
+PREFILTER_SETTINGS = PREFILTER_CONFIG
+HIERARCHY_SETTINGS = HIERARCHY_CONFIG
+TEXT_LAYER_SETTINGS = TEXT_LAYER_CONFIG
+PIPELINE_SETTINGS = PIPELINE_CONFIG
+QUEUE_SETTINGS = QUEUE_CONFIG
 
-    # Step 1: Extract only the <p> content
-    p_matches = re.findall(r'<p>(.*?)</p>', content, re.S)
 
-    # Step 2: Remove any remaining XML tags inside the paragraphs
-    clean_paragraphs = [re.sub(r'<[^>]+>', '', p).strip() for p in p_matches]
+def load_config(path="config.json"):
+    with open(path, "r") as f:
+        config = json.load(f)
+    config["nlp"] = {**NLP_CONFIG, **config.get("nlp", {})}
+    config["prefilter"] = {**PREFILTER_CONFIG, **config.get("prefilter", {})}
+    config["hierarchy"] = {**HIERARCHY_CONFIG, **config.get("hierarchy", {})}
+    config["cache"] = {**CACHE_CONFIG, **config.get("cache", {})}
+    config["download"] = {**DOWNLOAD_CONFIG, **config.get("download", {})}
+    config["pipeline"] = {**PIPELINE_CONFIG, **config.get("pipeline", {})}
+    config["queue"] = {**QUEUE_CONFIG, **config.get("queue", {})}
+    config["corpus"] = {**CORPUS_CONFIG, **config.get("corpus", {})}
+    config["model"] = {**MODEL_CONFIG, **config.get("model", {})}
+    config["text_layer"] = {**TEXT_LAYER_CONFIG, **config.get("text_layer", {})}
+    config["artifacts"] = {**ARTIFACT_CONFIG, **config.get("artifacts", {})}
+    config["metrics"] = {**METRICS_CONFIG, **config.get("metrics", {})}
+    return config
 
-    # Step 3: Remove fragments in English and join the paragraphs into one text
-    final_text = filter_sentences(clean_paragraphs)
 
+def filters_list(text):
+    return is_kept(nlp(text))
+
+
+def filter_sentences(paragraphs):
+    return filter_many_sentences([paragraphs])[0]
+
+def filter_many_sentences(documents):
+    return filter_documents(nlp, documents, NLP_SETTINGS["batch_size"], NLP_SETTINGS["n_process"],
+                            PREFILTER_SETTINGS, TIER_STATS, VERDICT_CACHE, HIERARCHY_SETTINGS)
+
+def is_pdf_valid(file_path):
+    return PDF_VALIDATOR.is_valid(file_path)
+
+def extract_paragraphs(file_path):
+    """Stream the clean text of <p> tags from the given XML file (references, tables and figures removed),
+    or the paragraphs of a PDF text layer written by the fast path."""
+    if ".text_layer.txt" in file_path:
+        yield from read_paragraphs(file_path)
+        return
+    with open_artifact(file_path) as file:
+        yield from iter_paragraphs(file)
+
+
+def clean_filtered_text(final_text):
+    """Remove leftovers (repository footer, multi dots, bibliography references) from the filtered text."""
     # Remove "Downloaded" sentence
     clean_text = re.sub(r'Pobrano z .*?/ Downloaded from Repository of Polish Platform of Medical Research .*? ', '', final_text)
 
@@ -77,101 +126,501 @@ def remove_xml_parts(file_path):
     return clean_text
 
 
-def doctorate_execute(doc, i):
-    print("Processing document ", i + 1, "/", len(doc))
-    title = re.sub(r'[<>:"/\\|?*]', '_', doc["Title"][i])
-    title = re.sub(r'\s+', ' ', title).strip().replace(' ', '_')[:255]
+def remove_xml_parts(file_path):
+    """Remove XML parts from the given XML file."""
+    # Step 3: Remove fragments in English and join the paragraphs into one text
+    return clean_filtered_text(filter_sentences(extract_paragraphs(file_path)))
+
 
-    try:
-        if not os.path.exists(f"doct/{title}/doc.grobid.tei.xml"):
-            try:
-                os.makedirs(f"doct/{title}")
-            except FileExistsError:
-                pass
+def clean_source(source):
+    """Clean text of an extracted file (TEI or text-layer paragraphs) or of a list of paragraphs."""
+    if isinstance(source, str):
+        return remove_xml_parts(source)
+    return clean_filtered_text(filter_sentences(source))
 
-            try:
-                subprocess.run(
-                    [sys.executable, "-m", "grobid_client.grobid_client", "--input", f".\\doct\\{title}",
-                     "processFulltextDocument"],
-                    cwd=os.getcwd())
-            except Exception as e:
-                print(f"grobid error: {e}")
 
-            if not is_pdf_valid(f"doct/{title}/doc.pdf"):
-                print(f"{title}.pdf is not valid")
-                shutil.rmtree(f"doct/{title}")
+def doctorate_title(title):
+    """Directory name used for the files of the document with the given title."""
+    title = re.sub(r'[<>:"/\\|?*]', '_', title)
+    return re.sub(r'\s+', ' ', title).strip().replace(' ', '_')[:255]
 
+
+def legacy_grobid_is_fresh(title, pdf_hash):
+    """True if doct/{title} (from before the artifact store) has Grobid output of this PDF with the current settings."""
+    if not os.path.exists(f"doct/{title}/doc.grobid.tei.xml"):
+        return False
+    record = MANIFEST.get(title, "grobid")
+    if record is None:
+        # Grobid output from before the manifest existed, keep it
+        return True
+    return record["version"] == GROBID_VERSION and record["input_hash"] == pdf_hash
+
+
+def extracted_path(pdf_hash):
+    """Stored file the text of the PDF is cleaned from (text-layer paragraphs or Grobid TEI), None if stale."""
+    if (TEXT_LAYER_SETTINGS["enabled"] and MANIFEST.is_fresh(pdf_hash, "route", pdf_hash, ROUTE_VERSION, "text_layer")
+            and STORE.has(pdf_hash, "text_layer")):
+        return STORE.get(pdf_hash, "text_layer")
+    if MANIFEST.is_fresh(pdf_hash, "grobid", pdf_hash, GROBID_VERSION) and STORE.has(pdf_hash, "grobid"):
+        return STORE.get(pdf_hash, "grobid")
+    return None
+
+
+def cleaned_path(pdf_hash):
+    """Cleaned text of the PDF; documents listing the same PDF share it, documents with the same title do not."""
+    return f"output/{pdf_hash}.txt"
+
+
+def clean_is_fresh(pdf_hash, tei_hash):
+    """True if the text exists and was produced from the current extracted text with the current code and model."""
+    return os.path.exists(cleaned_path(pdf_hash)) and MANIFEST.is_fresh(pdf_hash, "clean", tei_hash, CLEAN_VERSION)
+
+
+def legacy_text_is_fresh(title, tei_hash):
+    """True if output/{title}.txt (from before the text was keyed by PDF) was cleaned from this extracted text."""
+    return os.path.exists(f"output/{title}.txt") and MANIFEST.is_fresh(title, "clean", tei_hash, CLEAN_VERSION)
+
+
+def adopt_legacy_text(title, pdf_hash, tei_hash):
+    """Move the up to date output/{title}.txt to the path of the PDF (remove it if another document moved it)."""
+    if not legacy_text_is_fresh(title, tei_hash):
+        return
+    if os.path.exists(cleaned_path(pdf_hash)):
+        os.remove(f"output/{title}.txt")
+    else:
+        MANIFEST.record(pdf_hash, "clean", tei_hash, CLEAN_VERSION, MANIFEST.get(title, "clean")["output_hash"])
+        os.replace(f"output/{title}.txt", cleaned_path(pdf_hash))
+
+
+def adopt_legacy(title, pdf_hash):
+    """Move the up to date Grobid output of doct/{title} into the store and remove the old directory."""
+    if legacy_grobid_is_fresh(title, pdf_hash) and not STORE.has(pdf_hash, "grobid"):
+        MANIFEST.record(pdf_hash, "grobid", pdf_hash, GROBID_VERSION, file_hash(f"doct/{title}/doc.grobid.tei.xml"))
+        STORE.put(pdf_hash, "grobid", f"doct/{title}/doc.grobid.tei.xml")
+        print(f"{title}.grobid.tei.xml moved to the artifact store")
+    shutil.rmtree(f"doct/{title}", ignore_errors=True)
+
+
+def download_doctorate(item):
+    """Pipeline stage: download the PDF into the store unless the store has it or the text extracted from it."""
+    # rows with the same file wait for the first one and find its PDF in the store
+    with STORE.exclusive(item["file"]):
+        return download_once(item)
+
+
+def download_once(item):
+    title = item["title"]
+    doc_id = item["row"]["ID"]
+    pdf_hash = STORE.lookup(doc_id, item["file"])
+    if pdf_hash is not None and (extracted_path(pdf_hash) is not None or STORE.has(pdf_hash, "pdf")):
+        # the same PDF may be listed under another ID or licence search
+        STORE.link(doc_id, title, item["file"], pdf_hash)
+        item["pdf_hash"] = pdf_hash
+        return item
+
+    item["pdf_hash"] = None
+    scratch = STORE.scratch_path(f"{doc_id}.pdf")
+    if os.path.exists(f"doct/{title}/doc.pdf") and is_pdf_valid(f"doct/{title}/doc.pdf"):
+        # downloaded before the artifact store existed
+        item["pdf_hash"] = STORE.add_pdf(doc_id, title, item["file"], f"doct/{title}/doc.pdf")
+    else:
+        print(f"{title}.pdf download")
+        if not DOWNLOADER.download(item["file"], scratch):
+            print(f"{title}.pdf download failed")
+        elif not is_pdf_valid(scratch):
+            print(f"{title}.pdf is not valid")
+            METRICS.inc("invalid_pdfs_total")
+            os.remove(scratch)
         else:
-            print(f"{title}.grobid.tei.xml exists")
-    except Exception as e:
-        print(f"??? {e}")
-
-    if not os.path.exists(f"output/{title}.txt"):
-        try:
-            os.mkdir(f"output")
-        except Exception as e:
-            pass
-
-        print(f"Processing {title}.grobid.tei.xml")
-        doc.at[i, "Text"] = remove_xml_parts(f"doct/{title}/doc.grobid.tei.xml")
-        with open(f"output/{title}.txt", "w", encoding="utf-8") as file:
-            file.write(doc.at[i, "Text"])
+            item["pdf_hash"] = STORE.add_pdf(doc_id, title, item["file"], scratch)
+        if os.path.exists(sidecar_path(scratch)):
+            os.remove(sidecar_path(scratch))
+    if item["pdf_hash"] is not None and os.path.isdir(f"doct/{title}"):
+        adopt_legacy(title, item["pdf_hash"])
+    return item
+
+
+def route_doctorate(title, pdf_hash, pdf_path):
+    """Score the text layer of the PDF and record the route; True if the text-layer paragraphs were stored."""
+    if MANIFEST.is_fresh(pdf_hash, "route", pdf_hash, ROUTE_VERSION, "grobid"):
+        return False
+    scratch = STORE.scratch_path(f"{pdf_hash}.text_layer.txt")
+    route, metrics = route_pdf(pdf_path, scratch, TEXT_LAYER_SETTINGS)
+    if route == "text_layer":
+        STORE.put(pdf_hash, "text_layer", scratch)
+    MANIFEST.record(pdf_hash, "route", pdf_hash, ROUTE_VERSION, route)
+    print(f"{title}.pdf routed to {route} (text layer score {metrics.get('score', 0):.2f})")
+    return route == "text_layer"
+
+
+def grobid_doctorate(item):
+    """Pipeline stage: extract born-digital PDFs locally and the rest with Grobid, unless the text is up to date."""
+    if item.get("pdf_hash") is None:
+        item["route"] = "missing"
     else:
+        # documents of the same PDF wait for the first one and find its text in the store
+        with STORE.exclusive(item["pdf_hash"]):
+            item["route"] = extract_once(item["title"], item["pdf_hash"])
+    METRICS.inc("documents_routed_total", route=item["route"])
+    return item
+
+
+def extract_once(title, pdf_hash):
+    """Extract the PDF unless its text is up to date, returning the route."""
+    if extracted_path(pdf_hash) is not None:
+        print(f"{title} text already extracted")
+        return "cached"
+    if (pdf_path := STORE.get(pdf_hash, "pdf")) is None:
+        print(f"{title}.pdf is missing from the store")
+        return "missing"
+    if TEXT_LAYER_SETTINGS["enabled"] and route_doctorate(title, pdf_hash, pdf_path):
+        return "text_layer"
+    scratch = STORE.scratch_path(f"{pdf_hash}.grobid.tei.xml")
+    if not GROBID.process(pdf_path, scratch):
+        return "grobid_failed"
+    MANIFEST.record(pdf_hash, "grobid", pdf_hash, GROBID_VERSION, file_hash(scratch))
+    STORE.put(pdf_hash, "grobid", scratch)
+    return "grobid"
+
+
+def doctorate_execute(item):
+    """Pipeline stage: clean the extracted text (in the NLP process pool) or read the up to date text."""
+    print("Processing document ", item["index"] + 1, "/", item["count"])
+    title = item["title"]
+    pdf_hash = item.get("pdf_hash")
+    source = extracted_path(pdf_hash) if pdf_hash else None
+    tei_hash = file_hash(source) if source else None
+    if tei_hash is not None:
+        adopt_legacy_text(title, pdf_hash, tei_hash)
+
+    # without the extracted text (evicted from the store) the last cleaned text of the PDF is used
+    cleaned = cleaned_path(pdf_hash) if pdf_hash else None
+    if cleaned and (clean_is_fresh(pdf_hash, tei_hash) or (tei_hash is None and os.path.exists(cleaned))):
         print(f"Reading and copying {title}.txt")
-        with open(f"output/{title}.txt", "r", encoding="utf-8") as file:
-            doc.at[i, "Text"] = file.read()
-
-def download_doctorates(doc, i):
-    title = re.sub(r'[<>:"/\\|?*]', '_', doc["Title"][i])
-    title = re.sub(r'\s+', ' ', title).strip().replace(' ', '_')[:255]
-    timeout_counter = 5
-    while timeout_counter > 0:
-        timeout_counter -= 1
-        try:
-            if not os.path.exists(f"doct/{title}/doc.grobid.tei.xml") and not is_pdf_valid(f"doct/{title}/doc.pdf"):
-                try:
-                    os.makedirs(f"doct/{title}")
-                except FileExistsError:
-                    pass
-
-                try:
-                    print(f"{title}.pdf download")
-                    URL.urlretrieve(doc["File"][i], filename=f"doct/{title}/doc.pdf")
-                except Exception as e:
-                    print(f"url error: {e}")
-        except Exception:
-            pass
+        with open(cleaned, "r", encoding="utf-8") as file:
+            item["text"] = file.read()
+        return item
+
+    if tei_hash is None:
+        print(f"{title}.grobid.tei.xml is missing")
+        return None
+
+    print(f"Processing {title} ({os.path.basename(source)})")
+    item["text"], item["sentences"] = clean_document(source, title)
+    item["new"] = True
+    item["tei_hash"] = tei_hash
+    return item
+
+
+def clean_document(source, title):
+    """Clean the source (see clean_source) in the NLP process pool, or here; returns the text and its sentences."""
+    if NLP_POOL is not None:
+        text, stats = NLP_POOL.submit(clean_in_worker, source, title).result()
+        TIER_STATS.update(stats)
+    else:
+        with NLP_LOCK:
+            before = Counter(TIER_STATS)
+            text = clean_source(source)
+            stats = TIER_STATS - before
+    return text, record_clean_metrics(stats)
+
+
+def record_clean_metrics(stats):
+    """Count the sentences (by tier), paragraphs and verdict cache lookups of one cleaned document."""
+    sentences = {tier: count for tier, count in stats.items() if not tier.startswith("paragraph_")}
+    for tier, count in sentences.items():
+        METRICS.inc("sentences_classified_total", count, tier=tier)
+    for verdict in ("keep", "drop", "split"):
+        if stats.get(f"paragraph_{verdict}"):
+            METRICS.inc("paragraphs_classified_total", stats[f"paragraph_{verdict}"], verdict=verdict)
+    if VERDICT_CACHE is not None:
+        hits = sentences.get("cache", 0)
+        METRICS.inc("verdict_cache_lookups_total", hits, result="hit")
+        METRICS.inc("verdict_cache_lookups_total", sum(sentences.values()) - hits, result="miss")
+    return sum(sentences.values())
+
+
+def pending_stages(row):
+    """Stages that would run for the document, used by --dry-run."""
+    title = doctorate_title(row["Title"])
+    pdf_hash = STORE.lookup(row["ID"], row["File"])
+    source = extracted_path(pdf_hash) if pdf_hash else None
+    if source is None:
+        stages = ["grobid", "clean"]
+        if (pdf_hash is None or not STORE.has(pdf_hash, "pdf")) and not os.path.exists(f"doct/{title}/doc.pdf"):
+            stages.insert(0, "download")
+        return stages
+    tei_hash = file_hash(source)
+    if not clean_is_fresh(pdf_hash, tei_hash) and not legacy_text_is_fresh(title, tei_hash):
+        return ["clean"]
+    return []
+
+
+def dry_run(rows):
+    pending = Counter()
+    rows = list(rows)
+    for row in rows:
+        pending.update(pending_stages(row))
+    print(f"Pending work for {len(rows)} documents: download {pending['download']}, grobid {pending['grobid']}, "
+          f"clean {pending['clean']}")
+    return pending
+
+
+def init_nlp_worker(config, model_path):
+    """Initializer of the NLP processes: every process loads its own pipeline and cache connection."""
+    global nlp, NLP_SETTINGS, PREFILTER_SETTINGS, HIERARCHY_SETTINGS, VERDICT_CACHE
+    # only the slow document profiler runs in the workers, the counters are kept by the main process
+    METRICS.configure(config["metrics"], f"{worker_name()}-nlp", export=False)
+    start = time.perf_counter()
+    nlp = load_pipeline(model_path)
+    print(f"NLP worker {os.getpid()} loaded the pipeline in {time.perf_counter() - start:.2f}s", flush=True)
+    NLP_SETTINGS = {**config["nlp"], "n_process": 1}
+    PREFILTER_SETTINGS = config["prefilter"]
+    HIERARCHY_SETTINGS = config["hierarchy"]
+    VERDICT_CACHE = open_cache(config["cache"], model_path, PREFILTER_SETTINGS)
+
+
+def clean_in_worker(source, title):
+    TIER_STATS.clear()
+    with profile_slow("clean", title):
+        text = clean_source(source)
+    return text, dict(TIER_STATS)
+
+
+def process_documents(items, on_done=None, on_drop=None):
+    """Run documents through the download -> Grobid -> clean -> write pipeline, returning the finished ones.
+
+    PDFs and the text extracted from them are kept in the artifact store, keyed by the sha256 of the PDF.
+    The write stage appends every finished document to the corpus; the text is dropped from the returned items.
+    """
+    os.makedirs("output", exist_ok=True)
+
+    def write_doctorate(item):
+        hashed = text_hash(item["text"])
+        if item.get("new"):
+            # the clean stage may be reading the text of the same PDF for another document
+            part = f"{cleaned_path(item['pdf_hash'])}.part"
+            with open(part, "w", encoding="utf-8") as file:
+                file.write(item["text"])
+            os.replace(part, cleaned_path(item["pdf_hash"]))
+            MANIFEST.record(item["pdf_hash"], "clean", item["tei_hash"], CLEAN_VERSION, hashed)
+        row = item["row"]
+        timings = item.get("timings", {})
+        sentences = item.get("sentences", 0)
+        METRICS.inc("documents_written_total")
+        METRICS.event("document", id=str(row["ID"]), title=item["title"], route=item.get("route"),
+                      new=bool(item.get("new")), characters=len(item["text"]), sentences=sentences,
+                      sentences_per_second=sentences / timings["clean"] if timings.get("clean") else None,
+                      timings=timings)
+        CORPUS.append({"ID": row["ID"], "Title": row["Title"], "URL": row["URL"], "License": row["License"],
+                       "text": item.pop("text")}, hashed)
+        if on_done is not None:
+            on_done(item)
+        # keep the scratch space of the worker within its budget
+        METRICS.inc("artifacts_evicted_bytes_total", STORE.evict())
+        return item
+
+    queue_size = PIPELINE_SETTINGS["queue_size"]
+    return run_pipeline(items, [
+        Stage("download", download_doctorate, PIPELINE_SETTINGS["download_workers"], queue_size),
+        Stage("grobid", grobid_doctorate, PIPELINE_SETTINGS["grobid_workers"] or GROBID.settings["concurrency"],
+              queue_size),
+        # documents cleaned in the NLP processes are profiled there, this stage only waits for them
+        Stage("clean", doctorate_execute, max(1, PIPELINE_SETTINGS["nlp_processes"]), queue_size, NLP_POOL is None),
+        Stage("write", write_doctorate, 1, queue_size)
+    ], on_drop)
+
+
+def extract_pdf(pdf_path):
+    """Store the PDF like a downloaded one and extract it (text layer or Grobid), reusing earlier extractions.
+
+    Returns the extracted file, or None, and the route.
+    """
+    if not is_pdf_valid(pdf_path):
+        return None, "invalid"
+    pdf_hash = sha256_of(pdf_path)
+    if not STORE.has(pdf_hash, "pdf"):
+        scratch = STORE.scratch_path(f"{pdf_hash}.pdf")
+        shutil.copyfile(pdf_path, scratch)
+        STORE.put(pdf_hash, "pdf", scratch)
+    item = grobid_doctorate({"title": os.path.splitext(os.path.basename(pdf_path))[0], "pdf_hash": pdf_hash})
+    return extracted_path(pdf_hash), item["route"]
+
+
+def serve_request(request):
+    """Answer a request of the resident worker: {"pdf": path}, {"tei": path} or {"text": text} (see utils/service.py).
+
+    Documents are cleaned with the same code, model and settings as the batch runs; nothing is written to the
+    corpus.
+    """
+    start = time.perf_counter()
+    if "pdf" in request:
+        title = os.path.basename(request["pdf"])
+        source, route = extract_pdf(request["pdf"])
+        if source is None:
+            return {"error": f"{title} could not be extracted ({route})", "route": route}
+    elif "tei" in request:
+        title, source, route = os.path.basename(request["tei"]), request["tei"], "tei"
+    elif "text" in request:
+        # paragraphs are separated by blank lines, the lines of a paragraph are joined
+        title, route = request.get("name", "text"), "text"
+        source = [" ".join(paragraph.split()) for paragraph in re.split(r"\n\s*\n", request["text"])
+                  if paragraph.strip()]
+    else:
+        return {"error": "expected a pdf, tei or text field"}
+    text, sentences = clean_document(source, title)
+    seconds = time.perf_counter() - start
+    METRICS.event("served", title=title, route=route, sentences=sentences, characters=len(text), seconds=seconds)
+    return {"text": text, "route": route, "sentences": sentences, "seconds": seconds}
+
 
 def process_one(file_path):
+    import pandas as pd
+    from IPython.display import display
+
     df_doc = pd.read_csv(file_path)
-    display.display(df_doc)
+    display(df_doc)
     doctorate_count = len(df_doc)
 
-    for i in range(doctorate_count):
-        download_doctorates(df_doc, i)
+    items = ({"index": i, "count": doctorate_count, "title": doctorate_title(row["Title"]), "file": row["File"],
+              "row": row} for i, row in enumerate(df_doc.to_dict("records")))
+    finished = process_documents(items)
+    print(f"{file_path}: {len(finished)}/{doctorate_count} documents written to {CORPUS.directory}")
+    print(format_report(TIER_STATS))
+
+
+def process_queue(queue_path):
+    """Claim documents one at a time from the shared work queue until it is empty.
 
-    for i in range(doctorate_count):
-        doctorate_execute(df_doc, i)
+    A document is claimed only when fewer than queue.max_claimed are in flight, so the leases held by this worker
+    are of documents it is working on, not of ones waiting in the pipeline queues while other workers are idle.
+    The worker stops once nothing is pending and no document is leased: a dropped document goes back to the queue
+    and is claimed again (up to queue.max_attempts), here or by another worker.
+    """
+    work_queue = WorkQueue(queue_path, QUEUE_SETTINGS["lease_seconds"], QUEUE_SETTINGS["max_attempts"])
+    worker = worker_name()
+    total = sum(work_queue.progress().values())
+    grobid_workers = PIPELINE_SETTINGS["grobid_workers"] or GROBID.settings["concurrency"]
+    slots = threading.Semaphore(QUEUE_SETTINGS["max_claimed"]
+                                or PIPELINE_SETTINGS["download_workers"] + grobid_workers
+                                + max(1, PIPELINE_SETTINGS["nlp_processes"]))
 
-    df_doc = df_doc.dropna(subset=["Text"])
-    output_file = file_path.replace("doctorates_", "doctorates_with_text_")
-    df_doc.to_csv(output_file, sep='|', index=False)
+    # notified whenever a document of this worker leaves the pipeline
+    released = threading.Condition()
+
+    def claimed_items():
+        index = 0
+        while True:
+            slots.acquire()
+            if (row := work_queue.claim(worker)) is None:
+                slots.release()
+                if not work_queue.progress()["leased"]:
+                    return
+                # documents in flight, here or at other workers, may still be given back to the queue
+                with released:
+                    released.wait(QUEUE_SETTINGS["poll_seconds"])
+                continue
+            yield {"index": index, "count": total, "title": doctorate_title(row["Title"]), "file": row["File"],
+                   "row": row, "claimed": True}
+            index += 1
+
+    def release(item):
+        # a document leaves the pipeline once, written or dropped
+        if item.pop("claimed", False):
+            slots.release()
+            with released:
+                released.notify_all()
+
+    def on_done(item):
+        work_queue.complete(item["row"]["ID"], worker)
+        release(item)
+        print(format_progress(work_queue.progress()))
+
+    def on_drop(item):
+        work_queue.fail(item["row"]["ID"], worker)
+        release(item)
+
+    with Heartbeat(work_queue, worker, QUEUE_SETTINGS["heartbeat_seconds"]):
+        finished = process_documents(claimed_items(), on_done, on_drop)
+
+    print(f"{len(finished)} documents written to {CORPUS.directory}")
+    print(format_report(TIER_STATS))
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the PDFs, process them with Grobid and clean the text.")
+    parser.add_argument("--queue", help="claim documents from this work queue (see 1_divide_scraped_csv_into_batches.py)"
+                                        " instead of processing the doctorates_*.csv batches")
+    parser.add_argument("--dry-run", action="store_true", help="only report how many documents need each stage")
+    parser.add_argument("--serve", action="store_true", help="keep the pipeline loaded and clean the documents sent "
+                                                              "with python -m utils.service")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
     socket.setdefaulttimeout(60)
+    config = load_config()
+    METRICS.configure(config["metrics"], worker_name())
+    NLP_SETTINGS = config["nlp"]
+    PREFILTER_SETTINGS = config["prefilter"]
+    HIERARCHY_SETTINGS = config["hierarchy"]
+    TEXT_LAYER_SETTINGS = config["text_layer"]
+    DOWNLOADER = Downloader(config["download"], workers=config["pipeline"]["download_workers"])
+    GROBID = GrobidClient(config)
     #spacy.require_gpu()
-    #download("pl_core_news_sm")
-    #download("en_core_web_lg")
-    try:
-        nlp = spacy.load("./spacy")
-    except Exception:
-        nlp = spacy.load("pl_core_news_sm")
-        nlp.add_pipe("sentencizer")
-        nlp.add_pipe("language_detector", last=True)
-        nlp = training(nlp)
-        nlp.to_disk("./spacy")
-
-    csv_files = glob.glob("./doctorates_*.csv")
-    for file in csv_files:
-        process_one(file)
+    #spacy.cli.download("pl_core_news_sm")
+    #spacy.cli.download("en_core_web_lg")
+    # the trained pipeline is keyed by a hash of the dataset and the training settings, it is trained only once
+    start = time.perf_counter()
+    MODEL_PATH = build_model(config["model"])
+    built = time.perf_counter()
+    nlp = load_pipeline(MODEL_PATH)
+    print(f"Pipeline {MODEL_PATH} ready in {time.perf_counter() - start:.2f}s "
+          f"(build {built - start:.2f}s, load {time.perf_counter() - built:.2f}s)")
+    VERDICT_CACHE = open_cache(config["cache"], MODEL_PATH, PREFILTER_SETTINGS)
+    MANIFEST = Manifest(config.get("manifest", "manifest.sqlite"))
+    PDF_VALIDATOR = PdfValidator(config.get("pdf_checks", "cache/pdf_checks.sqlite"))
+    STORE = ArtifactStore(config["artifacts"])
+    CORPUS = CorpusWriter(config["corpus"]["directory"], worker_name(), config["corpus"]["max_shard_bytes"])
+    GROBID_VERSION = code_version(json.dumps(GROBID.request_data(), sort_keys=True))
+    ROUTE_VERSION = code_version(utils.text_layer, json.dumps(TEXT_LAYER_SETTINGS, sort_keys=True))
+    CLEAN_VERSION = code_version(clean_filtered_text, utils.tei, utils.text_filter, utils.prefilter,
+                                 model_fingerprint(MODEL_PATH), json.dumps(PREFILTER_SETTINGS, sort_keys=True),
+                                 json.dumps(HIERARCHY_SETTINGS, sort_keys=True))
+    PIPELINE_SETTINGS = config["pipeline"]
+    QUEUE_SETTINGS = config["queue"]
+    if PIPELINE_SETTINGS["nlp_processes"] > 0:
+        # forking a process that already runs threads (metrics exporter, Grobid session) can deadlock the child,
+        # the workers start from a fresh interpreter and set everything up in init_nlp_worker
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        NLP_POOL = ProcessPoolExecutor(PIPELINE_SETTINGS["nlp_processes"], multiprocessing.get_context(start_method),
+                                       initializer=init_nlp_worker, initargs=(config, MODEL_PATH))
+
+    # doctorates_with_text_*.csv are outputs of older versions of this script
+    csv_files = [file for file in glob.glob("./doctorates_*.csv") if "doctorates_with_text_" not in file]
+    if args.serve:
+        from utils.service import SERVICE_CONFIG, serve
+
+        if NLP_POOL is not None:
+            # start every NLP process now, the first requests should not wait for the pipeline to load
+            for future in [NLP_POOL.submit(os.getpid) for _ in range(PIPELINE_SETTINGS["nlp_processes"])]:
+                future.result()
+        print(f"Worker ready in {time.perf_counter() - started:.2f}s", flush=True)
+        serve(serve_request, {**SERVICE_CONFIG, **config.get("service", {})})
+    elif args.dry_run:
+        if args.queue:
+            dry_run(WorkQueue(args.queue).rows())
+        else:
+            import pandas as pd
+
+            for file in csv_files:
+                dry_run(pd.read_csv(file).to_dict("records"))
+    elif args.queue:
+        process_queue(args.queue)
+    else:
+        for file in csv_files:
+            process_one(file)
+    if NLP_POOL is not None:
+        NLP_POOL.shutdown()
+    CORPUS.close()
+    STORE.close()
+    METRICS.close()
@@ -0,0 +1,151 @@
+# Generated inputs of the benchmarks: TEI documents, sentence corpora and PDFs, all deterministic and offline.
+import glob
+import json
+import os
+from random import Random
+from xml.sax.saxutils import escape
+
+# Sentences that are not Polish, the filter has to drop them
+ENGLISH = [
+    "The aim of the study was to assess the effect of lymphatic drainage on tissue insulin resistance.",
+    "Sixty overweight patients who attended the outpatient clinic were included in the study.",
+    "Obesity is one of the most common diseases of civilisation and its prevalence keeps growing.",
+    "The results indicate a statistically significant improvement of insulin sensitivity after the therapy."
+]
+
+# Licence texts as they appear in the tooltips of the search results
+LICENSE_TEXTS = [
+    "Licencja: CC BY 4.0", "Creative Commons CC-BY-NC-SA 4.0 International", "cc_by_nc_nd", "CC BY-ND 3.0 PL",
+    "Licencja: CC BY SA", "Wszelkie prawa zastrzeżone", "CC-BY-NC 4.0", "Dostęp ograniczony, brak licencji",
+    "Creative Commons Uznanie autorstwa (CC BY)", "Licence: cc by-nc-nd 4.0 (https://creativecommons.org)"
+]
+
+# Documents generated for the TEI benchmarks: (name, count, paragraphs per document, share of table content)
+TEI_SIZES = [("small", 5, 20, 0.05), ("medium", 3, 200, 0.05), ("large", 1, 1000, 0.05), ("tables", 3, 200, 0.5)]
+PDF_PAGES = [4, 12, 40] * 4
+
+
+def dataset_sentences(pattern="utils/dataset/*.json"):
+    """Labelled texts of the training set: Polish prose, TOC lines and lists of numbers."""
+    texts = []
+    for jfile in sorted(glob.glob(pattern)):
+        with open(jfile, "r", encoding="utf-8") as file:
+            texts.extend(cell["text"] for cell in json.load(file))
+    return texts
+
+
+def prose(texts):
+    return [text for text in texts if "...." not in text and sum(char.isdigit() for char in text) < len(text) / 4]
+
+
+def make_paragraph(random, texts):
+    """A paragraph of a thesis: mostly Polish sentences, with some English ones and references."""
+    sentences = [random.choice(ENGLISH) if random.random() < 0.1 else random.choice(texts)
+                 for _ in range(random.randint(2, 6))]
+    paragraph = " ".join(escape(sentence.replace("\n", " ")) for sentence in sentences)
+    if random.random() < 0.3:
+        paragraph += f' <ref type="bibr" target="#b{random.randint(0, 99)}">[{random.randint(1, 99)}]</ref>'
+    return paragraph
+
+
+def make_table(random):
+    rows = "".join(f"<row>{''.join(f'<cell>{random.randint(0, 999)}</cell>' for _ in range(6))}</row>"
+                   for _ in range(random.randint(5, 20)))
+    return (f'<figure type="table"><head>Tabela {random.randint(1, 50)}</head><table>{rows}</table></figure>'
+            f"<p>Tabela {random.randint(1, 50)}. Wyniki pomiarów</p><p>{random.randint(0, 99)} {random.randint(0, 99)}"
+            f"</p>")
+
+
+def make_tei(paragraphs, table_share, seed, texts):
+    """Grobid-like TEI with the given number of paragraphs in sections, tables and figures mixed in."""
+    random = Random(seed)
+    texts = prose(texts)
+    body = []
+    for section in range(0, paragraphs, 10):
+        parts = [f"<head>Rozdział {section // 10 + 1}</head>"]
+        for _ in range(min(10, paragraphs - section)):
+            parts.append(make_table(random) if random.random() < table_share else
+                         f"<p>{make_paragraph(random, texts)}</p>")
+        body.append(f"<div>{''.join(parts)}</div>")
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader/><text '
+            f'xml:lang="pl"><body>{"".join(body)}</body><back><div type="references"><listBibl/></div></back>'
+            "</text></TEI>\n")
+
+
+# Polish letters reachable through the /Differences encoding of the standard Helvetica font
+PDF_GLYPHS = {"ą": "aogonek", "ć": "cacute", "ę": "eogonek", "ł": "lslash", "ń": "nacute", "ó": "oacute",
+              "ś": "sacute", "ź": "zacute", "ż": "zdotaccent", "Ą": "Aogonek", "Ć": "Cacute", "Ę": "Eogonek",
+              "Ł": "Lslash", "Ń": "Nacute", "Ó": "Oacute", "Ś": "Sacute", "Ź": "Zacute", "Ż": "Zdotaccent"}
+PDF_CODES = {char: 161 + i for i, char in enumerate(PDF_GLYPHS)}
+
+
+def pdf_string(text):
+    data = bytearray()
+    for char in text:
+        if char in PDF_CODES:
+            data.append(PDF_CODES[char])
+        elif char in "()\\":
+            data += b"\\" + char.encode()
+        else:
+            data += char.encode("latin-1", "replace")
+    return bytes(data)
+
+
+def make_pdf(pages, seed, texts):
+    """Born-digital PDF with a text layer: the given number of pages of wrapped prose."""
+    random = Random(seed)
+    texts = prose(texts)
+    differences = " ".join(f"{PDF_CODES[char]} /{name}" for char, name in PDF_GLYPHS.items())
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding << /Type /Encoding /BaseEncoding "
+               b"/WinAnsiEncoding /Differences [" + differences.encode() + b"] >> >>"]
+    kids = []
+    for page in range(pages):
+        lines, line = [], ""
+        for word in " ".join(random.choice(texts).replace("\n", " ") for _ in range(12)).split():
+            if len(line) + len(word) > 85:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}".strip()
+        lines.append(line)
+        lines.append(str(page + 1))
+        stream = b"BT /F1 10 Tf 12 TL 50 800 Td " + b" ".join(b"(" + pdf_string(text) + b") Tj T*"
+                                                             for text in lines) + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> "
+                       b">> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = (b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % kid for kid in kids) +
+                  b"] /Count %d >>" % len(kids))
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(data)
+
+
+def write_fixtures(directory):
+    """Write the TEI documents and PDFs to the directory; returns {"tei": {size: [paths]}, "pdf": [paths]}."""
+    texts = dataset_sentences()
+    fixtures = {"tei": {}, "pdf": []}
+    seed = 0
+    for name, count, paragraphs, table_share in TEI_SIZES:
+        fixtures["tei"][name] = []
+        for i in range(count):
+            path = os.path.join(directory, f"{name}_{i}.grobid.tei.xml")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(make_tei(paragraphs, table_share, seed, texts))
+            fixtures["tei"][name].append(path)
+            seed += 1
+    for i, pages in enumerate(PDF_PAGES):
+        path = os.path.join(directory, f"pdf_{i}_{pages}_pages.pdf")
+        with open(path, "wb") as file:
+            file.write(make_pdf(pages, seed + i, texts))
+        fixtures["pdf"].append(path)
+    return fixtures
@@ -0,0 +1,251 @@
+# Offline benchmarks of the processing hot paths, compared against a stored baseline.
+import importlib.util
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Defaults for the "benchmark" section of config.json
+BENCHMARK_CONFIG = {
+    "baseline": "benchmarks/baseline.json",
+    "repeat": 3,  # samples of every benchmark, the median is reported
+    "min_time": 0.5,  # a sample runs the benchmark again and again for at least this many seconds
+    "max_regression": 0.25,  # fail when a throughput drops by more than this share of the baseline
+    "max_memory_regression": 0.5  # fail when a peak RSS grows by more than this share of the baseline
+}
+
+
+def load_pipeline_script(model_path, config):
+    """Import 2_download_and_process_pdf_files.py and set up its globals like its __main__ does."""
+    from utils.text_filter import load_pipeline
+
+    spec = importlib.util.spec_from_file_location("pipeline_script", "2_download_and_process_pdf_files.py")
+    script = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(script)
+    config = script.load_config(config)
+    script.nlp = load_pipeline(model_path)
+    script.NLP_SETTINGS = config["nlp"]
+    script.PREFILTER_SETTINGS = config["prefilter"]
+    script.HIERARCHY_SETTINGS = config["hierarchy"]
+    script.VERDICT_CACHE = None  # measure the classifier, not the cache
+    return script
+
+
+def each(function, items):
+    """Benchmark body calling the function on every item, returning the number of items."""
+    def run():
+        for item in items:
+            function(item)
+        return len(items)
+    return run
+
+
+def tei_paragraphs(context):
+    from utils.tei import iter_paragraphs
+
+    paths = [path for paths in context["fixtures"]["tei"].values() for path in paths]
+    return each(lambda path: list(iter_paragraphs(path)), paths), "documents"
+
+
+def remove_xml_parts(context):
+    script = load_pipeline_script(context["model"], context["config"])
+    paths = [path for paths in context["fixtures"]["tei"].values() for path in paths]
+    return each(script.remove_xml_parts, paths), "documents"
+
+
+def remove_xml_parts_tables(context):
+    script = load_pipeline_script(context["model"], context["config"])
+    return each(script.remove_xml_parts, context["fixtures"]["tei"]["tables"]), "documents"
+
+
+def filter_sentences(context):
+    from utils.text_filter import split_sentences
+
+    script = load_pipeline_script(context["model"], context["config"])
+    paragraphs = context["sentences"]
+    count = len(split_sentences(paragraphs))
+
+    def run():
+        script.filter_sentences(paragraphs)
+        return count
+    return run, "sentences"
+
+
+def filters_list(context):
+    script = load_pipeline_script(context["model"], context["config"])
+    return each(script.filters_list, context["sentences"][:200]), "sentences"
+
+
+def is_pdf_valid(context):
+    from utils.pdf_check import PdfValidator
+
+    paths = context["fixtures"]["pdf"]
+
+    def run():
+        # a new verdict cache every run, so the checks are measured and not the cache
+        with tempfile.TemporaryDirectory() as directory:
+            validator = PdfValidator(os.path.join(directory, "pdf_checks.sqlite"))
+            assert all(validator.is_valid(path) for path in paths)
+            validator.close()
+        return len(paths)
+    return run, "documents"
+
+
+def is_pdf_valid_cached(context):
+    from utils.pdf_check import PdfValidator
+
+    paths = context["fixtures"]["pdf"]
+    validator = PdfValidator(os.path.join(context["directory"], "pdf_checks.sqlite"))
+    validator.is_valid(paths[0])
+    return each(validator.is_valid, paths * 50), "documents"
+
+
+def text_layer(context):
+    from utils.text_layer import route_pdf
+
+    paths = context["fixtures"]["pdf"]
+    output = os.path.join(context["directory"], "text_layer.txt")
+    return each(lambda path: route_pdf(path, output), paths), "documents"
+
+
+def licenses(context):
+    sys.path.insert(0, "scraper")
+    from common import ALL_LICENSES, is_license_allowed, normalize_license
+
+    from benchmarks.fixtures import LICENSE_TEXTS
+
+    def check(text):
+        is_license_allowed(text, ALL_LICENSES)
+        normalize_license(text)
+    return each(check, LICENSE_TEXTS * 1000), "licences"
+
+
+BENCHMARKS = {
+    "tei_paragraphs": tei_paragraphs,
+    "remove_xml_parts": remove_xml_parts,
+    "remove_xml_parts_tables": remove_xml_parts_tables,
+    "filter_sentences": filter_sentences,
+    "filters_list": filters_list,
+    "is_pdf_valid": is_pdf_valid,
+    "is_pdf_valid_cached": is_pdf_valid_cached,
+    "text_layer": text_layer,
+    "licenses": licenses
+}
+
+
+def run_benchmark(name, context, settings, profile=False):
+    """Set up and run one benchmark (in its own process, so its peak RSS is its own)."""
+    run, unit = BENCHMARKS[name](context)
+    run()  # warm up: lazy loading, caches of the parsers
+    times = []
+    profiler = None
+    if profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+    rates = []
+    for _ in range(settings["repeat"]):
+        if profiler is not None:
+            profiler.enable()
+        units = 0
+        start = time.perf_counter()
+        while not units or time.perf_counter() - start < settings["min_time"]:
+            units += run()
+        times.append(time.perf_counter() - start)
+        rates.append(units / times[-1])
+        if profiler is not None:
+            profiler.disable()
+    result = {"unit": unit, "rate": statistics.median(rates), "seconds": statistics.median(times),
+              "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    if profiler is not None:
+        import io
+        import pstats
+
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(15)
+        result["profile"] = stream.getvalue()
+    return result
+
+
+def compare(results, baseline, settings):
+    """Regressions of the results against the baseline, as messages."""
+    failures = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        slowdown = 1 - result["rate"] / old["rate"]
+        if slowdown > settings["max_regression"]:
+            failures.append(f"{name}: {result['rate']:.1f} {result['unit']}/s is {slowdown:.0%} below the baseline "
+                            f"{old['rate']:.1f}")
+        growth = result["peak_rss_mb"] / old["peak_rss_mb"] - 1
+        if growth > settings["max_memory_regression"]:
+            failures.append(f"{name}: peak RSS {result['peak_rss_mb']:.0f} MB is {growth:.0%} above the baseline "
+                            f"{old['peak_rss_mb']:.0f} MB")
+    return failures
+
+
+if __name__ == "__main__":
+    # python -m benchmarks.run [--only name ...] [--save] [--profile] [--model path]
+    import argparse
+
+    from utils.Labeling_text import MODEL_CONFIG, build_model
+    from utils.text_filter import split_sentences
+
+    from benchmarks.fixtures import dataset_sentences, write_fixtures
+
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths without Grobid, Chrome or network.")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--profile", action="store_true", help="print the slowest functions of every benchmark")
+    parser.add_argument("--model", help="trained pipeline, by default the one built from the current dataset")
+    parser.add_argument("--results", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    with open("config.json", "r") as f:
+        config = json.load(f)
+    settings = {**BENCHMARK_CONFIG, **config.get("benchmark", {})}
+    model = args.model or build_model({**MODEL_CONFIG, **config.get("model", {})})
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        texts = dataset_sentences()
+        context = {"directory": directory, "fixtures": write_fixtures(directory), "model": model,
+                   "config": "config.json", "sentences": split_sentences(texts)}
+        spawn = multiprocessing.get_context("spawn")
+        for name in args.only or BENCHMARKS:
+            with ProcessPoolExecutor(1, mp_context=spawn) as executor:
+                result = executor.submit(run_benchmark, name, context, settings, args.profile).result()
+            if "profile" in result:
+                print(result.pop("profile"))
+            results[name] = result
+            print(f"{name:24} {result['rate']:10.1f} {result['unit']}/s  peak RSS {result['peak_rss_mb']:.0f} MB",
+                  flush=True)
+
+    if args.results:
+        with open(args.results, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.save:
+        baseline = {}
+        if os.path.exists(settings["baseline"]):
+            with open(settings["baseline"], "r") as file:
+                baseline = json.load(file)
+        with open(settings["baseline"], "w") as file:
+            json.dump({**baseline, **results}, file, indent=2, sort_keys=True)
+        print(f"Baseline saved to {settings['baseline']}")
+    elif os.path.exists(settings["baseline"]):
+        with open(settings["baseline"], "r") as file:
+            failures = compare(results, json.load(file), settings)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            sys.exit(1)
+        print(f"No regression above {settings['max_regression']:.0%} (time) / "
+              f"{settings['max_memory_regression']:.0%} (memory) of {settings['baseline']}")
+    else:
+        print(f"No baseline at {settings['baseline']}, run with --save to store one")
@@ -0,0 +1,67 @@
+# Startup time of the scripts and tools, every command is run in a fresh interpreter.
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+# Name -> command; the --help runs import everything the script imports at module level and stop there
+COMMANDS = {
+    "python": [sys.executable, "-c", "pass"],
+    "divide_batches": [sys.executable, "1_divide_scraped_csv_into_batches.py", "--help"],
+    "process_pdfs": [sys.executable, "2_download_and_process_pdf_files.py", "--help"],
+    "extract_texts": [sys.executable, "-c", "import runpy; runpy.run_path('3_extract_csv_to_txt_files.py')"],
+    "service_client": [sys.executable, "-m", "utils.service", "--help"],
+    "corpus": [sys.executable, "-m", "utils.corpus", "--help"],
+    "import_pandas": [sys.executable, "-c", "import pandas"],
+    "import_spacy": [sys.executable, "-c", "import spacy"]
+}
+
+
+def measure(command, repeat):
+    """Median wall time (seconds) of running the command."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def slowest_imports(command, count=10):
+    """Modules with the largest cumulative import time (-X importtime, at least 1 ms) when running the command."""
+    result = subprocess.run([command[0], "-X", "importtime"] + command[1:], stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        # top-level imports only, their cumulative time includes what they import
+        if match and len(match.group(2)) == 1 and int(match.group(1)) >= 1000:
+            imports.append((int(match.group(1)) / 1e6, match.group(3)))
+    return sorted(imports, reverse=True)[:count]
+
+
+if __name__ == "__main__":
+    # python -m benchmarks.startup [--only name ...] [--repeat N] [--imports] [--results file.json]
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure how long the scripts take to start.")
+    parser.add_argument("--only", nargs="+", choices=sorted(COMMANDS), help="measure only these commands")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of every command, the median is reported")
+    parser.add_argument("--imports", action="store_true", help="also list the slowest imports of every command")
+    parser.add_argument("--results", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    results = {}
+    for name in args.only or COMMANDS:
+        results[name] = measure(COMMANDS[name], args.repeat)
+        print(f"{name:16} {results[name] * 1000:8.0f} ms", flush=True)
+        if args.imports:
+            for seconds, module in slowest_imports(COMMANDS[name]):
+                print(f"{'':16} {seconds * 1000:8.0f} ms  import {module}")
+    if args.results:
+        with open(args.results, "w") as file:
+            json.dump(results, file, indent=2)
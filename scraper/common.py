@@ -0,0 +1,101 @@
+# Licence matching and CSV output shared by the scraping engines.
+import csv
+import os
+import re
+import sys
+
+# The scraper runs from its own folder, the metrics registry is the one of the PDF pipeline in utils/
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.metrics import METRICS  # noqa: E402
+
+ALL_LICENSES = ["CC BY-SA", "CC BY-NC", "CC BY-NC-SA", "CC BY", "CC BY-ND", "CC BY-NC-ND"]
+
+METADATA_FIELDS = ["ID", "Title", "URL", "License"]
+FILE_LINK_FIELDS = ["Title", "URL", "License", "ID", "File"]
+
+
+def normalize_license(text):
+    # Replace -, _, or whitespace with a single space
+    text = re.sub(r"[-_\s]+", " ", text.strip())
+    # Remove extra spaces and normalize to match list
+    return text.upper()
+
+
+def find_license(license_text):
+    # Build regex to find something starting with CC
+    pattern = r"(CC[-_\s]*BY([-_\s]*(NC|ND))?([-_\s]*SA)?([-_\s]*ND)?)"
+    match = re.search(pattern, license_text, re.IGNORECASE)
+    if not match:
+        return None
+
+    found = match.group(0)
+    normalized = normalize_license(found)
+
+    # Try to match normalized against ALL_LICENSES
+    for lic in ALL_LICENSES:
+        if normalize_license(lic) == normalized:
+            return lic  # Return the canonical form
+
+    return None  # No match found
+
+
+def is_license_allowed(license_text, allowed_licenses):
+    license_found = find_license(license_text)
+    if not license_found:
+        return False, None
+
+    allowed = license_found in allowed_licenses
+    return allowed, license_found
+
+
+def save_doctorates_to_csv(doctorates, fieldnames, file_path):
+    """Upsert the doctorates by URL: rows of known URLs are replaced, new ones appended."""
+    rows = {}
+    if os.path.isfile(file_path) and os.path.getsize(file_path) > 0:
+        with open(file_path, newline='', encoding='utf-8') as file:
+            rows = {row["URL"]: row for row in csv.DictReader(file)}
+    for doc in doctorates:
+        rows[doc["URL"]] = {key: doc.get(key, "") for key in fieldnames}
+
+    # Write to a temporary file first, so an interrupted run never leaves a truncated CSV
+    with open(file_path + ".part", mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows.values())
+    os.replace(file_path + ".part", file_path)
+
+    print(f"Metadata saved")
+
+
+def load_url_ids(file_path="doctorates_metadata.csv"):
+    """URL -> ID of the doctorates already saved, so every doctorate keeps its ID across runs."""
+    if not os.path.isfile(file_path) or os.path.getsize(file_path) == 0:
+        return {}
+    with open(file_path, newline='', encoding='utf-8') as file:
+        return {row["URL"]: int(row["ID"]) for row in csv.DictReader(file) if row.get("ID")}
+
+
+def assign_ids(doctorates, url_ids):
+    """Set the ID of every doctorate: known URLs keep theirs, new ones get the next free IDs in the given order."""
+    next_id = max(url_ids.values(), default=0) + 1
+    for doc in doctorates:
+        if doc["URL"] not in url_ids:
+            url_ids[doc["URL"]] = next_id
+            next_id += 1
+        doc["ID"] = url_ids[doc["URL"]]
+    return doctorates
+
+
+def configure_metrics(config, worker):
+    """Export the scraper metrics of this process to METRICS_DIRECTORY as <worker>.prom and <worker>.jsonl."""
+    METRICS.configure({"enabled": bool(config.get("METRICS", 1)),
+                       "directory": config.get("METRICS_DIRECTORY", "metrics"),
+                       "export_seconds": config.get("METRICS_EXPORT_SECONDS", 30)}, worker)
+
+
+def record_page(engine, page_number, seconds, rows, doctorates):
+    """Latency of one scraped result page, its rows (those not skipped as known) and the doctorates kept."""
+    METRICS.observe("scraper_page_seconds", seconds, engine=engine)
+    METRICS.inc("scraper_rows_total", rows, engine=engine)
+    METRICS.inc("scraper_doctorates_total", doctorates, engine=engine)
+    METRICS.event("page", engine=engine, page=page_number, seconds=seconds, rows=rows, doctorates=doctorates)
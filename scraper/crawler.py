@@ -0,0 +1,169 @@
+# Parallel crawl with the Selenium engine: the page range is split across several browsers.
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from common import (FILE_LINK_FIELDS, METADATA_FIELDS, METRICS, assign_ids, configure_metrics, load_url_ids,
+                    record_page, save_doctorates_to_csv)
+from known_index import KnownIndex
+
+CHECKPOINT_DIR = "crawl"
+ATTEMPTS = 3  # a page whose worker crashed is given to a new worker this many times
+
+
+def page_shards(pages, workers):
+    """Split the pages into contiguous ranges, one per worker, so every worker can move on with "Next"."""
+    size = -(-len(pages) // max(1, workers))
+    return [pages[i:i + size] for i in range(0, len(pages), size)]
+
+
+def checkpoint_path(directory, page_number):
+    return os.path.join(directory, f"page_{page_number:05d}.json")
+
+
+def read_checkpoint(directory, page_number):
+    try:
+        with open(checkpoint_path(directory, page_number), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_checkpoint(directory, page_number, doctorates, empty_doctorates, seen):
+    path = checkpoint_path(directory, page_number)
+    with open(path + ".part", "w", encoding="utf-8") as file:
+        json.dump({"page": page_number, "doctorates": doctorates, "empty": empty_doctorates, "seen": seen}, file,
+                  ensure_ascii=False)
+    os.replace(path + ".part", path)
+
+
+def crawl_pages(url, pages, allowed_licenses, config, known=None):
+    """Worker process: scrape the pages with its own browser, writing a checkpoint after every page.
+
+    With a known index ({URL: file link}), known theses are skipped and the worker stops after
+    STOP_AFTER_KNOWN_PAGES pages in a row without anything new (new theses are listed first).
+    """
+    import scraper
+    from selenium.common.exceptions import StaleElementReferenceException
+
+    directory = config.get("CHECKPOINT_DIR", CHECKPOINT_DIR)
+    pending = [page for page in pages if read_checkpoint(directory, page) is None]
+    if not pending:
+        return 0
+
+    configure_metrics(config, f"crawler-{os.getpid()}")
+    scraper.BULK_EXTRACTION = config.get("BULK_EXTRACTION", 1)
+    scraper.PAGE_TIMEOUT = config.get("PAGE_TIMEOUT", 60)
+    driver = scraper.new_driver(config.get("HEADLESS_BROWSER", 1))
+    scraper.set_driver(driver)
+    current_page = None
+    known_pages = 0
+
+    def skip_rest(page_number):
+        for later_page in pending[pending.index(page_number):]:
+            write_checkpoint(directory, later_page, [], 0, [])
+
+    def open_page(page_number):
+        driver.get(url)
+        scraper.wait_for_rows_change(None)
+        # the search URL opens the first page
+        return page_number == 1 or scraper.navigate_to_page(page_number)
+
+    try:
+        for page_number in pending:
+            start = time.perf_counter()
+            for attempt in range(ATTEMPTS):
+                try:
+                    if current_page is not None and page_number == current_page + 1 and attempt == 0:
+                        if not scraper.next_page():
+                            logging.info("Reached the last page. No more pages to scrape.")
+                            skip_rest(page_number)
+                            return len(pending)
+                    elif not open_page(page_number):
+                        continue
+                    current_page = page_number
+                    doctorates, empty_doctorates, seen = scraper.scrape_current_page(allowed_licenses, known)
+                    break
+                except StaleElementReferenceException:
+                    logging.warning(f"Stale element encountered on page {page_number}, loading it again.")
+                    METRICS.inc("scraper_errors_total", engine="selenium")
+                    current_page = None
+            else:
+                raise RuntimeError(f"page {page_number} could not be scraped")
+            record_page("selenium", page_number, time.perf_counter() - start, len(seen), len(doctorates))
+
+            write_checkpoint(directory, page_number, doctorates, empty_doctorates, seen)
+            logging.info(f"Saved page {page_number} ({len(doctorates)} doctorates)")
+
+            known_pages = known_pages + 1 if known is not None and not seen else 0
+            if known_pages >= config.get("STOP_AFTER_KNOWN_PAGES", 2) and page_number != pending[-1]:
+                logging.info(f"{known_pages} pages without new theses, stopping at page {page_number}.")
+                skip_rest(pending[pending.index(page_number) + 1])
+                return len(pending)
+        return len(pending)
+    finally:
+        driver.quit()
+        METRICS.export()
+
+
+def crawl(url, doctorates, empty_doctorates, allowed_licenses, start_page, end_page, config):
+    """Scrape pages start_page..end_page - 1 with config["WORKERS"] browsers and merge them into the CSVs.
+
+    Pages that already have a checkpoint are not scraped again, so a crashed crawl resumes where it stopped.
+    Doctorates get IDs from the URL -> ID map of doctorates_metadata.csv, new ones the next free IDs, and are
+    upserted into the CSVs. With INCREMENTAL, theses seen by earlier runs (known.sqlite) are skipped.
+    """
+    directory = config.get("CHECKPOINT_DIR", CHECKPOINT_DIR)
+    os.makedirs(directory, exist_ok=True)
+    pages = list(range(start_page, end_page))
+    workers = max(1, config.get("WORKERS", 1))
+    logging.info(f"Scraping results from: {url} with {workers} browsers")
+    # every run updates the index, only incremental runs skip what it knows
+    known_index = KnownIndex(config.get("KNOWN_INDEX", "known.sqlite"))
+    known_index.seed("file_links.csv")
+    known = None
+    if config.get("INCREMENTAL", 0):
+        known = known_index.load()
+        logging.info(f"Incremental crawl, {len(known)} theses are known")
+
+    for attempt in range(ATTEMPTS):
+        pending = [page for page in pages if read_checkpoint(directory, page) is None]
+        if not pending:
+            break
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(crawl_pages, url, shard, allowed_licenses, config, known)
+                       for shard in page_shards(pending, workers)]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"Crawler worker failed, its remaining pages are retried: {e}")
+
+    # Merge the pages in order, so new doctorates are numbered in the order of the search results
+    url_ids = load_url_ids("doctorates_metadata.csv")
+    complete = True
+    seen = []
+    for page_number in pages:
+        checkpoint = read_checkpoint(directory, page_number)
+        if checkpoint is None:
+            logging.error(f"Page {page_number} was not scraped, run the scraper again to resume")
+            complete = False
+            continue
+        page_doctorates = assign_ids(checkpoint["doctorates"], url_ids)
+        empty_doctorates += checkpoint["empty"]
+        seen.extend(checkpoint.get("seen", []))
+        for doc in page_doctorates:
+            logging.info(f"Added doctorate {doc['ID']}: {doc['Title']} - {doc['File']}")
+        doctorates.extend(page_doctorates)
+    save_doctorates_to_csv(doctorates, METADATA_FIELDS, "doctorates_metadata.csv")
+    save_doctorates_to_csv(doctorates, FILE_LINK_FIELDS, "file_links.csv")
+    known_index.record(seen)
+    known_index.close()
+
+    if complete:
+        # everything is in the CSVs, the next run is a new crawl
+        for page_number in pages:
+            os.remove(checkpoint_path(directory, page_number))
+    return empty_doctorates
@@ -0,0 +1,294 @@
+# Browserless scraping engine: fetches the search result pages and the PrimeFaces paging requests over HTTP.
+import logging
+import re
+import time
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
+from urllib.parse import parse_qs, urlencode, urljoin, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from common import (FILE_LINK_FIELDS, METADATA_FIELDS, METRICS, assign_ids, is_license_allowed, load_url_ids,
+                    record_page,
+                    save_doctorates_to_csv)
+from known_index import KnownIndex
+
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track",
+             "wbr"}
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+
+class Node:
+    """Element of the parsed HTML: tag, attributes and children (nodes and strings)."""
+
+    def __init__(self, tag, attrs, parent=None):
+        self.tag = tag
+        self.attrs = dict(attrs)
+        self.parent = parent
+        self.children = []
+
+    def has_class(self, name):
+        return name in (self.attrs.get("class") or "").split()
+
+    def iter(self):
+        for child in self.children:
+            if isinstance(child, Node):
+                yield child
+                yield from child.iter()
+
+    def find_all(self, class_name=None, tag=None):
+        return [node for node in self.iter()
+                if (class_name is None or node.has_class(class_name)) and (tag is None or node.tag == tag)]
+
+    def find(self, class_name=None, tag=None):
+        found = self.find_all(class_name, tag)
+        return found[0] if found else None
+
+    def ancestor(self, predicate):
+        node = self.parent
+        while node is not None and not predicate(node):
+            node = node.parent
+        return node
+
+    def text(self):
+        parts = [child if isinstance(child, str) else child.text() for child in self.children]
+        return re.sub(r"\s+", " ", "".join(parts)).strip()
+
+
+class TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = self.current = Node("document", {})
+
+    def handle_starttag(self, tag, attrs):
+        node = Node(tag, attrs, self.current)
+        self.current.children.append(node)
+        if tag not in VOID_TAGS:
+            self.current = node
+
+    def handle_startendtag(self, tag, attrs):
+        self.current.children.append(Node(tag, attrs, self.current))
+
+    def handle_endtag(self, tag):
+        # close the innermost open element with this tag (browsers are just as forgiving with broken markup)
+        node = self.current
+        while node is not None and node.tag != tag:
+            node = node.parent
+        if node is not None and node.parent is not None:
+            self.current = node.parent
+
+    def handle_data(self, data):
+        self.current.children.append(data)
+
+
+def parse_html(html):
+    builder = TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+def get_license(row, file_element, allowed_licenses):
+    """Licence of the file from its tooltip (rendered hidden in the page), or None if it is not allowed, and
+    whether the page had a licence text for it at all."""
+    tooltips = [tooltip.text() for tooltip in row.find_all("fileInfoTooltip") if tooltip.text()]
+    license_text = tooltips[0] if tooltips else file_element.attrs.get("title") or ""
+    allowed, license_name = is_license_allowed(license_text, allowed_licenses)
+    return (license_name if allowed else None), bool(license_text)
+
+
+def parse_entries(root, base_url, allowed_licenses):
+    """Title, URL, file link and licence of every result row; the link or licence is None when missing.
+
+    "complete" is False for a file without a licence text, the row is then not recorded as known.
+    """
+    entries = []
+    for row in root.find_all("entities-table-row"):
+        title_container = row.find("entity-row-title")
+        title_elem = title_container.find(tag="a") if title_container is not None else None
+        if title_elem is None:
+            continue
+        # the first file, whether it is linked directly or listed in the multi file overlay panel
+        file_element = row.find("fileDownloadLink", "a")
+        file_link = license = None
+        complete = True
+        if file_element is not None and file_element.attrs.get("href"):
+            file_link = urljoin(base_url, file_element.attrs["href"])
+            license, complete = get_license(row, file_element, allowed_licenses)
+        entries.append({"Title": title_elem.text(), "URL": urljoin(base_url, title_elem.attrs.get("href", "")),
+                        "File": file_link, "License": license, "complete": complete})
+    return entries
+
+
+def page_url(url, page_number):
+    """The search URL with its page number (pn) parameter set."""
+    parts = urlsplit(url)
+    query = parse_qs(parts.query, keep_blank_values=True)
+    query["pn"] = [str(page_number)]
+    return urlunsplit(parts._replace(query=urlencode(query, doseq=True)))
+
+
+def page_size(url):
+    return int(parse_qs(urlsplit(url).query).get("ps", ["100"])[0])
+
+
+class PpmSession:
+    """Pooled HTTP session keeping the JSF view state needed for the PrimeFaces paging requests."""
+
+    def __init__(self, delay=1.0):
+        self.delay = delay
+        self.session = requests.Session()
+        retries = Retry(total=5, backoff_factor=2, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=None)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retries)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = USER_AGENT
+        self.url = None
+        self.form = None
+        self.component = None
+        self.view_state = None
+        self.view_state_name = "javax.faces.ViewState"
+
+    def get(self, url):
+        """Load a result page and remember the data list, its form and the view state for the paging requests."""
+        response = self.session.get(url, timeout=60)
+        response.raise_for_status()
+        self.url = response.url
+        root = parse_html(response.text)
+
+        row = root.find("entities-table-row")
+        component = row.ancestor(lambda node: "id" in node.attrs and (
+            node.has_class("ui-datatable") or node.has_class("ui-datalist"))) if row is not None else None
+        form = component.ancestor(lambda node: node.tag == "form") if component is not None else None
+        state = form.find_all(tag="input") if form is not None else []
+        state = [node for node in state if node.attrs.get("name", "").endswith("faces.ViewState")]
+        if component is not None and form is not None and state:
+            self.component = component.attrs["id"]
+            self.form = form.attrs.get("id")
+            self.view_state_name = state[0].attrs["name"]
+            self.view_state = state[0].attrs.get("value")
+        else:
+            self.component = None
+        return root
+
+    def paginate(self, first, rows):
+        """Send the AJAX request of the paginator and return the parsed rows it renders."""
+        prefix = self.view_state_name.rsplit(".", 1)[0]  # javax.faces or jakarta.faces
+        data = {
+            f"{prefix}.partial.ajax": "true",
+            f"{prefix}.source": self.component,
+            f"{prefix}.partial.execute": self.component,
+            f"{prefix}.partial.render": self.component,
+            f"{prefix}.behavior.event": "page",
+            f"{prefix}.partial.event": "page",
+            f"{self.component}_pagination": "true",
+            f"{self.component}_first": str(first),
+            f"{self.component}_rows": str(rows),
+            f"{self.component}_encodeFeature": "true",
+            self.view_state_name: self.view_state
+        }
+        if self.form:
+            data[self.form] = self.form
+        time.sleep(self.delay)
+        response = self.session.post(self.url, data=data, timeout=60,
+                                     headers={"Faces-Request": "partial/ajax", "X-Requested-With": "XMLHttpRequest"})
+        response.raise_for_status()
+
+        html = []
+        for update in ET.fromstring(response.content).iter("update"):
+            # "javax.faces.ViewState" or, since JSF 2.2, "<view id>:javax.faces.ViewState:<n>"
+            if "faces.ViewState" in update.get("id", ""):
+                self.view_state = update.text
+            elif update.text:
+                html.append(update.text)
+        # rows of a table update come without their <table>, wrap them so the parser keeps them
+        return parse_html("<table>" + "".join(html) + "</table>")
+
+    def page(self, url, page_number):
+        """Root of the parsed result page with the given number."""
+        rows = page_size(url)
+        if self.component is None or self.url is None:
+            root = self.get(page_url(url, page_number))
+            if self.component is None or page_number == 1:
+                # not a PrimeFaces data list (or already the right page), the pn parameter selected the page
+                return root
+        return self.paginate((page_number - 1) * rows, rows)
+
+    def close(self):
+        self.session.close()
+
+
+def scrape_http(url, doctorates, empty_doctorates, allowed_licenses, start_page, end_page, config):
+    """Same output as the Selenium engine, without a browser: pages start_page..end_page - 1 are scraped."""
+    logging.info(f"Scraping results from: {url} over HTTP")
+    session = PpmSession(config.get("HTTP_DELAY", 1.0))
+    rows = page_size(url)
+    url_ids = load_url_ids("doctorates_metadata.csv")
+    known_index = KnownIndex(config.get("KNOWN_INDEX", "known.sqlite"))
+    known_index.seed("file_links.csv")
+    known = known_index.load() if config.get("INCREMENTAL", 0) else None
+    known_pages = 0
+
+    try:
+        for page_id in range(start_page, end_page):
+            start = time.perf_counter()
+            try:
+                entries = parse_entries(session.page(url, page_id), session.url, allowed_licenses)
+            except (requests.RequestException, ET.ParseError) as e:
+                logging.error(f"Error scraping page {page_id}: {e}")
+                METRICS.inc("scraper_errors_total", engine="http")
+                break
+            seconds = time.perf_counter() - start
+            logging.info(f"Found {len(entries)} doctorates on page {page_id}.")
+
+            page_doctorates = []
+            seen = []
+            for entry in entries:
+                title, file_link, license = entry["Title"], entry["File"], entry["License"]
+                if known is not None and entry["URL"] in known and file_link in (None, known[entry["URL"]]):
+                    METRICS.inc("scraper_rejected_total", engine="http", reason="known")
+                    continue
+                seen.append(entry)
+                if file_link and license:
+                    page_doctorates.append(entry)
+                elif license and not file_link:
+                    empty_doctorates += 1
+                    METRICS.inc("scraper_rejected_total", engine="http", reason="no_file")
+                    logging.info(f"Wrong file link for file: {title}")
+                elif file_link and not license:
+                    empty_doctorates += 1
+                    METRICS.inc("scraper_rejected_total", engine="http", reason="license")
+                    logging.info(f"Wrong license for: {title}")
+                else:
+                    empty_doctorates += 1
+                    METRICS.inc("scraper_rejected_total", engine="http", reason="no_file_license")
+                    logging.info(f"No file link and wrong license for: {title}")
+
+            # doctorates already in the CSVs keep their IDs and their rows are updated
+            page_doctorates = assign_ids(page_doctorates, url_ids)
+            for doc in page_doctorates:
+                logging.info(f"Added doctorate {doc['ID']}: {doc['Title']} - {doc['File']}")
+            doctorates.extend(page_doctorates)
+            record_page("http", page_id, seconds, len(seen), len(page_doctorates))
+
+            logging.info(f"Saving page {page_id}")
+            save_doctorates_to_csv(page_doctorates, METADATA_FIELDS, "doctorates_metadata.csv")
+            save_doctorates_to_csv(page_doctorates, FILE_LINK_FIELDS, "file_links.csv")
+            known_index.record(seen)
+            logging.info(f"Saved page {page_id}")
+
+            if len(entries) < rows:
+                logging.info("Reached the last page. No more pages to scrape.")
+                break
+            # new theses are listed first, pages with nothing new mean the rest is known too
+            known_pages = known_pages + 1 if known is not None and not seen else 0
+            if known_pages >= config.get("STOP_AFTER_KNOWN_PAGES", 2):
+                logging.info(f"{known_pages} pages without new theses, stopping at page {page_id}.")
+                break
+    finally:
+        session.close()
+        known_index.close()
+
+    return empty_doctorates
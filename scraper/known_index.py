@@ -0,0 +1,44 @@
+# Persistent index of the theses seen by earlier runs, used by the incremental crawl.
+import csv
+import os
+import sqlite3
+import time
+
+
+class KnownIndex:
+    """SQLite table of thesis URL -> file link and licence (None for theses that were rejected)."""
+
+    def __init__(self, path="known.sqlite"):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS theses (url TEXT PRIMARY KEY, file TEXT, license TEXT, "
+                                "updated REAL)")
+        self.connection.commit()
+
+    def seed(self, file_links_path="file_links.csv"):
+        """Fill an empty index from file_links.csv written by runs from before the index existed."""
+        if self.connection.execute("SELECT 1 FROM theses LIMIT 1").fetchone() is not None:
+            return
+        if not os.path.isfile(file_links_path) or os.path.getsize(file_links_path) == 0:
+            return
+        with open(file_links_path, newline='', encoding='utf-8') as file:
+            self.record(csv.DictReader(file))
+
+    def load(self):
+        """{URL: file link} of every known thesis."""
+        return dict(self.connection.execute("SELECT url, file FROM theses"))
+
+    def record(self, rows):
+        """Insert or update the theses (dicts with URL, File and License, File/License None when missing).
+
+        Rows with "complete" False (the licence tooltip or the file list could not be read) are left out, so a
+        thesis is not taken for rejected because of a failed hover and is looked at again by the next run.
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO theses VALUES (?, ?, ?, ?)",
+                [(row["URL"], row.get("File") or None, row.get("License") or None, now) for row in rows
+                 if row.get("complete", True)])
+
+    def close(self):
+        self.connection.close()
@@ -9,14 +9,72 @@ from selenium.common.exceptions import StaleElementReferenceException, NoSuchEle
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import json
-import re
-import csv
-import os
-ALL_LICENSES = ["CC BY-SA", "CC BY-NC", "CC BY-NC-SA", "CC BY", "CC BY-ND", "CC BY-NC-ND"]
+from common import METRICS, configure_metrics, is_license_allowed
+
+# Seconds to wait for the rows of a new page
+PAGE_TIMEOUT = 60
+
+# Read all rows of a page in one script execution instead of several WebDriver calls per row
+BULK_EXTRACTION = 1
+
+# Browser of this process, set with set_driver() (see crawler.py)
+driver = None
+
+# Title, link, file link and licence tooltip text of every row of the page. PrimeFaces moves tooltips out of the
+# rows, so they are also looked up through the tooltip widgets by the id of the element they belong to.
+BULK_ROWS_SCRIPT = """
+var tooltips = {};
+if (window.PrimeFaces && PrimeFaces.widgets) {
+    Object.keys(PrimeFaces.widgets).forEach(function (name) {
+        var widget = PrimeFaces.widgets[name];
+        if (widget && widget.cfg && widget.cfg.target && widget.jq && widget.jq.length) {
+            tooltips[widget.cfg.target] = widget.jq.text().trim();
+        }
+    });
+}
+return Array.prototype.map.call(document.querySelectorAll('.entities-table-row'), function (row) {
+    var title = row.querySelector('.entity-row-title a');
+    var file = row.querySelector('.fileDownloadLink');
+    var license = null;
+    if (file) {
+        var inRow = row.querySelector('.fileInfoTooltip');
+        license = (inRow && inRow.textContent.trim()) || tooltips[file.id] || file.getAttribute('title') || null;
+    }
+    return {
+        title: title ? title.textContent.replace(/\\s+/g, ' ').trim() : null,
+        url: title ? title.href : null,
+        file: file ? file.href : null,
+        license: license
+    };
+});
+"""
+
+
+def set_driver(new_driver):
+    """Use this browser for the page functions of this module."""
+    global driver
+    driver = new_driver
+
+
+def rows_signature():
+    """Link of the first row, changes when the result list shows another page."""
+    try:
+        rows = driver.find_elements(By.CSS_SELECTOR, ".entities-table-row .entity-row-title a")
+        return rows[0].get_attribute("href") if rows else None
+    except StaleElementReferenceException:
+        return None
+
+
+def wait_for_rows_change(old_signature, timeout=None):
+    """Wait until the result list shows rows other than the ones with the given signature."""
+    WebDriverWait(driver, timeout or PAGE_TIMEOUT).until(
+        lambda d: (signature := rows_signature()) is not None and signature != old_signature)
 
 
 def navigate_to_page(page_number):
     try:
+        old_signature = rows_signature()
+
         # Click the button to activate input
         button = WebDriverWait(driver, 20).until(
             EC.element_to_be_clickable((By.CLASS_NAME, "page-inplace-input-inactive"))
@@ -33,163 +91,103 @@ def navigate_to_page(page_number):
 
         # Enter the new page number
         input_field.send_keys(str(page_number))
-        time.sleep(0.5)
+        WebDriverWait(driver, 10).until(lambda d: input_field.get_attribute("value") == str(page_number))
 
         # Press Enter
         input_field.send_keys(Keys.ENTER)
 
-        # Wait 15 seconds for the page to load
-        time.sleep(20)
+        # Wait for the rows of the new page instead of a fixed time
+        wait_for_rows_change(old_signature)
+        return True
 
     except Exception as e:
         print(f"Error during navigation: {e}")
-
-def normalize_license(text):
-    # Replace -, _, or whitespace with a single space
-    text = re.sub(r"[-_\s]+", " ", text.strip())
-    # Remove extra spaces and normalize to match list
-    return text.upper()
-
-
-def find_license(license_text):
-    # Build regex to find something starting with CC
-    pattern = r"(CC[-_\s]*BY([-_\s]*(NC|ND))?([-_\s]*SA)?([-_\s]*ND)?)"
-    match = re.search(pattern, license_text, re.IGNORECASE)
-    if not match:
-        return None
-
-    found = match.group(0)
-    normalized = normalize_license(found)
-
-    # Try to match normalized against ALL_LICENSES
-    for lic in ALL_LICENSES:
-        if normalize_license(lic) == normalized:
-            return lic  # Return the canonical form
-
-    return None  # No match found
+        return False
 
 
-def is_license_allowed(license_text):
-    license_found = find_license(license_text)
-    if not license_found:
-        return False, None
+def next_page():
+    """Click the "Next" button and wait for the new rows; False on the last page."""
+    next_button = driver.find_element(By.CSS_SELECTOR, ".ui-paginator-next")
+    if "ui-state-disabled" in next_button.get_attribute("class"):
+        return False
+    old_signature = rows_signature()
+    next_button.click()
+    wait_for_rows_change(old_signature)
+    return True
 
-    allowed = license_found in ALLOWED_LICENSES
-    return allowed, license_found
 
+def scrape_current_page(ALLOWED_LICENSES, known=None):
+    """Doctorates with an allowed licence and a file on the page shown in the browser, the number of others and
+    every thesis that was looked at (URL, File, License and whether they could be read), for the known index.
 
-def save_doctorates_to_csv(doctorates, fieldnames, file_path):
-    # Check if file exists and is not empty
-    file_exists = os.path.isfile(file_path)
-    file_empty = not file_exists or os.path.getsize(file_path) == 0
+    Theses in known ({URL: file link}) whose direct file link did not change are skipped without hovering.
+    Raises StaleElementReferenceException if the page changed while it was read, the caller loads it again.
+    """
+    entries = get_entries()
+    rows = get_rows_bulk(len(entries))
+    logging.info(f"Found {len(entries)} doctorates on this page.")
 
-    with open(file_path, mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        if file_empty:
-            writer.writeheader()
-        for doc in doctorates:
-            writer.writerow({key: doc.get(key, "") for key in fieldnames})
-
-    print(f"Metadata saved")
-
-
-def scrape_page(url, doctorates, empty_doctorates, ALLOWED_LICENSES, START_PAGE, END_PAGE):
-    """Scrape all doctorate entries from a given results page, including pagination."""
-    logging.info(f"Scraping results from: {url}")
-    page_id = START_PAGE - 1
-    id = page_id*100
-    driver.get(url)
-    navigate_to_page(START_PAGE)
-
-    processed_entries = set()  # Keep track of already processed URLs
-
-    while True:
+    page_doctorates = []
+    empty_doctorates = 0
+    seen = []
+    for i in range(len(entries)):
         try:
-            page_doctorates = []
-            page_id += 1
-            if page_id >= END_PAGE:
-                logging.info(f"Reached last page specified in config, page: {page_id}")
-                return empty_doctorates
-
-            entries = get_entries()
-            number_of_entries = len(entries)
-            number_of_processed = 0
-            logging.info(f"Found {len(entries)} doctorates on this page.")
-
-            for i in range(len(entries)):
-                try:
-                    id += 1
-
-                    title, doctorate_url = get_title_and_url(entries[i])
-                    file_link, license = get_file_link(entries[i], ALLOWED_LICENSES)
-
-                    if not file_link:
-                        file_link, license = attempt_to_get_file_from_overlay(entries[i], ALLOWED_LICENSES)
-
-                    if doctorate_url in processed_entries:
-                        logging.info(f"Skipping already processed entry: {title}")
-                        number_of_processed += 1
-                        continue  # Avoid duplicates
-
-                    if file_link and license:
-                        page_doctorates.append({
-                            "Title": title,
-                            "URL": doctorate_url,
-                            "License": license,
-                            "ID": id,
-                            "File": file_link
-                        })
-                        doctorates.append(page_doctorates[-1])
-                        processed_entries.add(doctorate_url)
-                        logging.info(f"Added doctorate {len(page_doctorates)-1} from entry {id}: {title} - {file_link}")
-                    elif license and not file_link:
-                        empty_doctorates += 1
-                        logging.info(f"Wrong file link for file: {title}")
-                    elif file_link and not license:
-                        empty_doctorates += 1
-                        logging.info(f"Wrong license for: {title}")
-                    else:
-                        empty_doctorates += 1
-                        logging.info(f"No file link and wrong license for: {title}")
-
-                    number_of_processed += 1
-
-                except (StaleElementReferenceException, NoSuchElementException) as e:
-                    logging.warning(f"Stale element encountered for entry {i}. Skipping this entry.")
-                    break
-
-            if number_of_processed < number_of_entries:
-                # retry stale
-                driver.refresh()
-                time.sleep(2)  # Wait for the page to load
+            if known is not None and is_known(entries[i], rows[i] if rows is not None else None, known):
+                METRICS.inc("scraper_rejected_total", engine="selenium", reason="known")
                 continue
+            if rows is not None:
+                title, doctorate_url, file_link, license, complete = get_row_from_bulk(entries[i], rows[i],
+                                                                                       ALLOWED_LICENSES)
+            else:
+                title, doctorate_url = get_title_and_url(entries[i])
+                file_link, license, complete = get_file_link(entries[i], ALLOWED_LICENSES)
+
+            if not file_link:
+                file_link, license, complete = attempt_to_get_file_from_overlay(entries[i], ALLOWED_LICENSES)
+        except NoSuchElementException:
+            raise StaleElementReferenceException(f"entry {i} is missing")
+
+        seen.append({"URL": doctorate_url, "File": file_link, "License": license, "complete": complete})
+        if file_link and license:
+            page_doctorates.append({"Title": title, "URL": doctorate_url, "License": license, "File": file_link})
+        elif license and not file_link:
+            empty_doctorates += 1
+            METRICS.inc("scraper_rejected_total", engine="selenium", reason="no_file")
+            logging.info(f"Wrong file link for file: {title}")
+        elif file_link and not license:
+            empty_doctorates += 1
+            METRICS.inc("scraper_rejected_total", engine="selenium", reason="license")
+            logging.info(f"Wrong license for: {title}")
+        else:
+            empty_doctorates += 1
+            METRICS.inc("scraper_rejected_total", engine="selenium", reason="no_file_license")
+            logging.info(f"No file link and wrong license for: {title}")
 
-        except Exception as e:
-            logging.error(f"Error scraping page: {e}")
-            break  # Break out of the loop if there's an error
+    return page_doctorates, empty_doctorates, seen
 
-        # Pagination handling
-        try:
-            logging.info(f"Saving page {page_id}")
-            save_doctorates_to_csv(page_doctorates, ["ID", "Title", "URL", "License"], "doctorates_metadata.csv")
-            save_doctorates_to_csv(page_doctorates, ["Title", "URL", "License", "ID", "File"], "file_links.csv")
-            logging.info(f"Saved page {page_id}")
 
-            # Check for "Next" button to navigate to the next page
-            next_button = driver.find_element(By.CSS_SELECTOR, ".ui-paginator-next")
-            if "ui-state-disabled" in next_button.get_attribute("class"):
-                logging.info("Reached the last page. No more pages to scrape.")
-                return empty_doctorates  # No more pages, exit the loop
+def is_known(entry, row, known):
+    """True if the thesis is in the known index and its direct file link (if it has one) did not change."""
+    if row is not None:
+        doctorate_url, file_link = row["url"], row["file"]
+    else:
+        doctorate_url = entry.find_element(By.CSS_SELECTOR, ".entity-row-title a").get_attribute("href")
+        file_elements = entry.find_elements(By.CSS_SELECTOR, ".fileDownloadLink")
+        file_link = file_elements[0].get_attribute("href") if file_elements else None
+    # files listed only in the overlay panel are not compared, opening it is what the index saves
+    return doctorate_url in known and (file_link is None or file_link == known[doctorate_url])
 
-            logging.info("Clicking Next page...")
-            next_button.click()
-            time.sleep(20)  # Wait for next page to load
 
-        except Exception as e:
-            logging.info(f"Reached the last page.")
-            break
+def new_driver(headless):
+    # Configure Selenium options
+    chrome_options = Options()
+    if headless == 1:
+        chrome_options.add_argument("--headless")  # Run headless mode for speed
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
 
-    return empty_doctorates
+    # Initialize WebDriver
+    return webdriver.Chrome(options=chrome_options)
 
 
 def get_entries():
@@ -197,6 +195,33 @@ def get_entries():
     return driver.find_elements(By.CSS_SELECTOR, ".entities-table-row")
 
 
+def get_rows_bulk(number_of_entries):
+    """Data of all rows of the page from one script execution, or None to read the rows one by one."""
+    if not BULK_EXTRACTION:
+        return None
+    try:
+        rows = driver.execute_script(BULK_ROWS_SCRIPT)
+    except Exception as e:
+        logging.warning(f"Bulk extraction failed, reading rows one by one: {e}")
+        return None
+    if len(rows) != number_of_entries or any(not row["title"] for row in rows):
+        logging.warning("Bulk extraction does not match the entries, reading rows one by one.")
+        return None
+    return rows
+
+
+def get_row_from_bulk(entry, row, ALLOWED_LICENSES):
+    """Title, URL, file link, licence and whether it could be read of a row read in bulk; hovers over the file only
+    if its tooltip was empty."""
+    file_link, license, complete = row["file"], None, True
+    if file_link and row["license"]:
+        allowed, license_name = is_license_allowed(row["license"], ALLOWED_LICENSES)
+        license = license_name if allowed else None
+    elif file_link:
+        license, complete = get_license(entry.find_element(By.CSS_SELECTOR, ".fileDownloadLink"), ALLOWED_LICENSES)
+    return row["title"], row["url"], file_link, license, complete
+
+
 def get_title_and_url(entry):
     """Extract title and URL from a given entry."""
     title_elem = entry.find_element(By.CSS_SELECTOR, ".entity-row-title a")
@@ -209,14 +234,14 @@ def get_file_link(entry, ALLOWED_LICENSES):
     """Try to get the file download link from the entry."""
     try:
         file_element = entry.find_element(By.CSS_SELECTOR, ".fileDownloadLink")
-        license = get_license(file_element, ALLOWED_LICENSES)
-        return file_element.get_attribute("href"), license
+        license, complete = get_license(file_element, ALLOWED_LICENSES)
+        return file_element.get_attribute("href"), license, complete
     except:
-        return None, None  # No file available
+        return None, None, True  # No file available
 
 
 def get_license(file_element, ALLOWED_LICENSES):
-    """Try to get the file download link from the entry if license is acceptable."""
+    """Licence of the file if it is acceptable (None otherwise) and whether its tooltip could be read."""
     try:
         # Hover over the file element to trigger the tooltip
         ActionChains(driver).move_to_element(file_element).perform()
@@ -225,26 +250,29 @@ def get_license(file_element, ALLOWED_LICENSES):
         tooltips = driver.find_elements(By.CSS_SELECTOR, ".fileInfoTooltip")
         tooltips = list(filter(lambda element: element.text != '', tooltips))
 
-        if tooltips[0] is None:
+        if not tooltips:
             logging.error(f"Failed to retrieve tooltip.")
-            return None
+            return None, False
 
         tooltip_text = tooltips[-1].text
 
-        allowed, license_name = is_license_allowed(tooltip_text)
+        allowed, license_name = is_license_allowed(tooltip_text, ALLOWED_LICENSES)
         if allowed:
-            return license_name
+            return license_name, True
         else:
-            return None
+            return None, True
 
     except Exception as e:
         # Handle no file, no tooltip, timeout, etc.
-        return None
+        return None, False
 
 
 
 def attempt_to_get_file_from_overlay(entry, ALLOWED_LICENSES):
-    """Attempt to retrieve file link by clicking the copy icon inside a specific entry."""
+    """Attempt to retrieve file link by clicking the copy icon inside a specific entry.
+
+    Returns the link, its licence and whether they could be read (False if the overlay or the tooltip failed).
+    """
     button_selector = "i.fa.fa-copy"
     overlay_selector = "div.multiFilesDownloadOverlayPanel.ui-overlay-visible"
     file_link_selector = "div.filesDownloadPanel a.fileDownloadLink"
@@ -252,7 +280,11 @@ def attempt_to_get_file_from_overlay(entry, ALLOWED_LICENSES):
     try:
         # Find the copy icon inside the given entry
         icon_elem = entry.find_element(By.CSS_SELECTOR, button_selector)
+    except NoSuchElementException:
+        # a row without files
+        return None, None, True
 
+    try:
         time.sleep(1)
         # Click on the icon to open the overlay
         action = webdriver.ActionChains(driver)
@@ -269,15 +301,15 @@ def attempt_to_get_file_from_overlay(entry, ALLOWED_LICENSES):
         file_elems = entry.find_elements(By.CSS_SELECTOR, file_link_selector)
         if file_elems:
             file_element = file_elems[0]
-            license = get_license(file_element, ALLOWED_LICENSES)
-            return file_element.get_attribute("href"), license  # Select the first file
+            license, complete = get_license(file_element, ALLOWED_LICENSES)
+            return file_element.get_attribute("href"), license, complete  # Select the first file
         else:
             logging.warning("No file links found in overlay panel.")
-            return None, None
+            return None, None, True
 
     except Exception as e:
         logging.warning(f"Failed to retrieve file from overlay.")
-        return None, None
+        return None, None, False
 
 
 if __name__ == "__main__":
@@ -299,24 +331,25 @@ if __name__ == "__main__":
         HEADLESS_BROWSER = config["HEADLESS_BROWSER"]
         START_PAGE = config["START_PAGE"]
         END_PAGE = config["END_PAGE"]
-
-    # Configure Selenium options
-    chrome_options = Options()
-    if HEADLESS_BROWSER == 1:
-        chrome_options.add_argument("--headless")  # Run headless mode for speed
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-
-    # Initialize WebDriver
-    driver = webdriver.Chrome(options=chrome_options)
+        ENGINE = config.get("ENGINE", "selenium")
+        BULK_EXTRACTION = config.get("BULK_EXTRACTION", 1)
+        PAGE_TIMEOUT = config.get("PAGE_TIMEOUT", 60)
 
     doctorates = []
     empty_doctorates = 0
+    configure_metrics(config, "scraper")
+
+    if ENGINE == "http":
+        # Browserless engine, see http_scraper.py
+        from http_scraper import scrape_http
 
-    empty_doctorates = scrape_page(URL, doctorates, empty_doctorates, ALLOWED_LICENSES, START_PAGE, END_PAGE)
+        empty_doctorates = scrape_http(URL, doctorates, empty_doctorates, ALLOWED_LICENSES, START_PAGE, END_PAGE, config)
+    else:
+        # Pages are split across WORKERS browsers, see crawler.py
+        from crawler import crawl
 
-    # Close WebDriver
-    driver.quit()
+        empty_doctorates = crawl(URL, doctorates, empty_doctorates, ALLOWED_LICENSES, START_PAGE, END_PAGE, config)
 
     # Output results
-    logging.info(f"Scraping complete. Total doctorates collected: {len(doctorates)}; Doctorates without pdf attached or wrong license: {empty_doctorates}")
\ No newline at end of file
+    logging.info(f"Scraping complete. Total doctorates collected: {len(doctorates)}; Doctorates without pdf attached or wrong license: {empty_doctorates}")
+    METRICS.close()
\ No newline at end of file
@@ -0,0 +1,9 @@
+# The tests import the modules like the scripts do: utils.* from the repository root, the scraper modules from
+# scraper/ (they are run from that directory).
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "scraper")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
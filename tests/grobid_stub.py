@@ -0,0 +1,85 @@
+# Local stand-in for a Grobid server: /api/isalive and /api/processFulltextDocument, with scripted answers.
+import http.server
+import threading
+import time
+
+# Answer of processFulltextDocument; UTF-8 with characters an encoding guess would get wrong
+TEI = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+       '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body><div>'
+       '<p>Zażółć gęślą jaźń – wyniki badania klinicznego.</p>'
+       '</div></body></text></TEI>\n').encode("utf-8")
+
+
+class GrobidStub:
+    """Grobid on 127.0.0.1 answering from a script.
+
+    Every processFulltextDocument request takes the next (status, delay seconds) of answers, 200 once they run out;
+    a 200 carries the TEI, sent with the content_type header. The bodies of the requests are kept in requests.
+    """
+
+    def __init__(self, answers=(), tei=TEI, content_type="application/xml"):
+        self.answers = list(answers)
+        self.tei = tei
+        self.content_type = content_type
+        self.requests = []
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.path == "/api/isalive":
+                    self.answer(200, b"true", "text/plain")
+                else:
+                    self.answer(404, b"", "text/plain")
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                if self.path != "/api/processFulltextDocument":
+                    self.answer(404, b"", "text/plain")
+                    return
+                with stub.lock:
+                    stub.requests.append(body)
+                    status, delay = stub.answers.pop(0) if stub.answers else (200, 0)
+                time.sleep(delay)
+                if status == 200:
+                    self.answer(200, stub.tei, stub.content_type)
+                else:
+                    self.answer(status, f"[GENERAL] error {status}".encode("utf-8"), "text/plain")
+
+            def answer(self, status, body, content_type):
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client gave up waiting (timeout tests)
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    # python tests/grobid_stub.py: a stub answering every document at once, set grobid_server to the printed URL
+    with GrobidStub() as stub:
+        print(f"Grobid stub on {stub.url}", flush=True)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,29 @@
+from utils.artifacts import ArtifactStore
+
+
+def add(store, tmp_path, doc_id, url, content):
+    source = tmp_path / f"{doc_id}-{len(content)}.pdf"
+    source.write_bytes(content)
+    return store.add_pdf(doc_id, f"Praca {doc_id}", url, str(source))
+
+
+def test_lookup_by_id_and_url(tmp_path):
+    store = ArtifactStore({"directory": str(tmp_path / "artifacts")})
+    pdf_hash = add(store, tmp_path, 1, "http://x/1.pdf", b"%PDF-1.4 one")
+    assert store.lookup(1, "http://x/1.pdf") == pdf_hash
+    assert store.lookup(1) == pdf_hash
+    # another ID listing the same file
+    assert store.lookup(2, "http://x/1.pdf") == pdf_hash
+    assert store.lookup(3, "http://x/3.pdf") is None
+    store.close()
+
+
+def test_changed_file_link_is_a_new_download(tmp_path):
+    store = ArtifactStore({"directory": str(tmp_path / "artifacts")})
+    old = add(store, tmp_path, 2, "http://x/1.pdf", b"%PDF-1.4 one")
+    assert store.lookup(2, "http://x/3.pdf") is None
+    new = add(store, tmp_path, 2, "http://x/3.pdf", b"%PDF-1.4 three")
+    assert new != old
+    assert store.lookup(2, "http://x/3.pdf") == new
+    assert store.lookup(2) == new
+    store.close()
@@ -0,0 +1,20 @@
+import json
+
+import benchmarks.run
+import utils.text_filter
+from conftest import ROOT
+
+
+def test_config_reaches_the_pipeline_script(tmp_path, monkeypatch):
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"nlp": {"batch_size": 7}, "prefilter": {"enabled": False},
+                                  "hierarchy": {"enabled": True}}))
+    # the script is imported from the repository root, like the benchmarks are run
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(utils.text_filter, "load_pipeline", lambda path: "pipeline")
+    script = benchmarks.run.load_pipeline_script("model", str(config))
+    calls = []
+    monkeypatch.setattr(script, "filter_documents", lambda *args: calls.append(args) or [""])
+    script.filter_sentences(["Akapit."])
+    nlp, documents, batch_size, n_process, prefilter, tier_stats, cache, hierarchy = calls[0]
+    assert (nlp, batch_size, prefilter["enabled"], hierarchy["enabled"]) == ("pipeline", 7, False, True)
@@ -0,0 +1,18 @@
+from utils.dedup import DedupIndex, text_sources
+
+TEXT = " ".join(f"zdanie {i} opisuje wyniki badania pacjentów leczonych w klinice" for i in range(40))
+
+
+def test_short_texts_are_not_duplicates(tmp_path):
+    texts = tmp_path / "texts"
+    texts.mkdir()
+    for doc_id, text in {"1": TEXT, "2": TEXT + " dodatek", "3": TEXT.replace("zdanie", "akapit"),
+                         "4": "", "5": "", "6": "Streszczenie", "7": "Spis treści"}.items():
+        (texts / f"{doc_id}.txt").write_text(text, encoding="utf-8")
+    index = DedupIndex({"index": str(tmp_path / "dedup.sqlite"), "processes": 1})
+    assert index.add(text_sources(str(texts))) == 7
+    assert index.clusters() == [{"keep": "2", "duplicates": ["1"]}]
+    assert index.keep_list() == ["2", "3", "4", "5", "6", "7"]
+    # nothing changed, nothing is indexed again
+    assert index.add(text_sources(str(texts))) == 0
+    index.close()
@@ -0,0 +1,191 @@
+import http.server
+import json
+import os
+import re
+import threading
+
+import pytest
+
+import utils.downloader
+from utils.downloader import Downloader
+from utils.pdf_check import read_sidecar, sha256_of
+
+CONTENT = b"%PDF-1.4\n" + bytes(range(256)) * 64 + b"\n%%EOF\n"
+SETTINGS = {"requests_per_second": 0, "retries": 4, "backoff": 1.0, "max_backoff": 3.0, "chunk_size": 1024}
+
+
+class FileHandler(http.server.BaseHTTPRequestHandler):
+    """Serves server.content with Range support; server.script lists what the next requests get instead.
+
+    A script entry is an error status, "truncate", "ignore_range" or a function called before the request is served.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        action = server.script.pop(0) if server.script else "ok"
+        if callable(action):
+            action()
+        elif isinstance(action, int):
+            self.send_error(action)
+            return
+        content = server.content
+        match = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if match and action != "ignore_range" and (if_range is None or if_range == server.etag):
+            first = int(match.group(1))
+            if first >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {first}-{len(content) - 1}/{len(content)}")
+            content = content[first:]
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        if server.etag:
+            self.send_header("ETag", server.etag)
+        self.end_headers()
+        if action == "truncate":
+            # the connection drops half way
+            self.wfile.write(content[:len(content) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FileHandler)
+    server.daemon_threads = True
+    server.content, server.etag, server.script, server.requests = CONTENT, '"v1"', [], []
+    server.url = f"http://127.0.0.1:{server.server_port}/doc.pdf"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Backoff delays, without waiting for them."""
+    delays = []
+    monkeypatch.setattr(utils.downloader.time, "sleep", delays.append)
+    return delays
+
+
+def test_download(server, tmp_path, sleeps):
+    destination = str(tmp_path / "doc.pdf")
+    assert Downloader(SETTINGS).download(server.url, destination)
+    with open(destination, "rb") as file:
+        assert file.read() == CONTENT
+    assert not os.path.exists(destination + ".part")
+    assert read_sidecar(destination) == {"url": server.url, "length": len(CONTENT), "etag": '"v1"',
+                                         "sha256": sha256_of(destination)}
+    assert "Range" not in server.requests[0]
+    assert sleeps == []
+
+
+def test_resumes_after_a_dropped_connection(server, tmp_path, sleeps):
+    destination = str(tmp_path / "doc.pdf")
+    server.script = ["truncate"]
+    assert Downloader(SETTINGS).download(server.url, destination)
+    with open(destination, "rb") as file:
+        assert file.read() == CONTENT
+    # what reached the part file before the connection dropped
+    resumed = int(re.match(r"bytes=(\d+)-$", server.requests[1]["Range"]).group(1))
+    assert 0 < resumed <= len(CONTENT) // 2
+    assert server.requests[1]["If-Range"] == '"v1"'
+    assert read_sidecar(destination)["length"] == len(CONTENT)
+    assert len(sleeps) == 1
+
+
+def test_resumes_a_part_file_of_an_earlier_run(server, tmp_path, sleeps):
+    destination = str(tmp_path / "doc.pdf")
+    with open(destination + ".part", "wb") as file:
+        file.write(CONTENT[:1000])
+    assert Downloader(SETTINGS).download(server.url, destination)
+    with open(destination, "rb") as file:
+        assert file.read() == CONTENT
+    assert server.requests[0]["Range"] == "bytes=1000-"
+    # the total of Content-Range, not the 206 body length
+    assert read_sidecar(destination)["length"] == len(CONTENT)
+
+
+def test_part_file_that_is_already_complete(server, tmp_path, sleeps):
+    destination = str(tmp_path / "doc.pdf")
+    with open(destination + ".part", "wb") as file:
+        file.write(CONTENT)
+    assert Downloader(SETTINGS).download(server.url, destination)
+    with open(destination, "rb") as file:
+        assert file.read() == CONTENT
+    assert read_sidecar(destination)["length"] == len(CONTENT)
+
+
+def test_restarts_when_the_server_ignores_range(server, tmp_path, sleeps):
+    destination = str(tmp_path / "doc.pdf")
+    with open(destination + ".part", "wb") as file:
+        file.write(b"garbage")
+    server.script = ["ignore_range"]
+    assert Downloader(SETTINGS).download(server.url, destination)
+    with open(destination, "rb") as file:
+        assert file.read() == CONTENT
+
+
+def test_restarts_when_the_file_changed(server, tmp_path, sleeps):
+    destination = str(tmp_path / "doc.pdf")
+
+    def publish():
+        # a new version of the file replaces the one being downloaded
+        server.content, server.etag = CONTENT.replace(b"1.4", b"1.7"), '"v2"'
+
+    server.script = ["truncate", publish]
+    assert Downloader(SETTINGS).download(server.url, destination)
+    assert server.requests[1]["If-Range"] == '"v1"'
+    with open(destination, "rb") as file:
+        assert file.read() == server.content
+    assert read_sidecar(destination)["etag"] == '"v2"'
+
+
+def test_no_etag(server, tmp_path, sleeps):
+    destination = str(tmp_path / "doc.pdf")
+    server.etag = None
+    assert Downloader(SETTINGS).download(server.url, destination)
+    with open(destination + ".meta.json") as file:
+        assert json.load(file) == {"url": server.url, "length": len(CONTENT), "sha256": sha256_of(destination)}
+
+
+def test_backoff(server, tmp_path, sleeps):
+    destination = str(tmp_path / "doc.pdf")
+    server.script = [503, 503, 503]
+    assert Downloader(SETTINGS).download(server.url, destination)
+    # backoff * 2 ** attempt, capped at max_backoff, with jitter between half and all of it
+    for delay, bound in zip(sleeps, (1.0, 2.0, 3.0)):
+        assert bound / 2 <= delay <= bound
+    assert len(sleeps) == 3 and len(server.requests) == 4
+
+
+def test_gives_up_without_a_destination(server, tmp_path, sleeps):
+    destination = str(tmp_path / "doc.pdf")
+    server.script = ["truncate"] * SETTINGS["retries"]
+    assert not Downloader({**SETTINGS, "retries": 1}).download(server.url, destination)
+    # the rename happens only once the file is complete, the partial data is kept for the next run
+    assert not os.path.exists(destination)
+    assert not os.path.exists(destination + ".meta.json")
+    assert 0 < os.path.getsize(destination + ".part") <= len(CONTENT) // 2
+
+
+def test_error_status(server, tmp_path, sleeps):
+    destination = str(tmp_path / "doc.pdf")
+    server.script = [404] * SETTINGS["retries"]
+    assert not Downloader(SETTINGS).download(server.url, destination)
+    assert not os.path.exists(destination)
+    assert len(sleeps) == SETTINGS["retries"] - 1
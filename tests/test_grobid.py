@@ -0,0 +1,79 @@
+import os
+import time
+
+from grobid_stub import TEI, GrobidStub
+from utils.grobid import GrobidClient
+
+
+def client(stub, **config):
+    return GrobidClient({"grobid_server": stub.url, "timeout": 5, "sleep_time": 0, **config})
+
+
+def make_pdf(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(b"%PDF-1.4\n%%EOF\n")
+    return str(path)
+
+
+def test_is_alive():
+    with GrobidStub() as stub:
+        assert client(stub).is_alive()
+    assert not client(stub).is_alive()
+
+
+def test_writes_the_tei_bytes(tmp_path):
+    tei = str(tmp_path / "doc.grobid.tei.xml")
+    with GrobidStub() as stub:
+        assert client(stub).process(make_pdf(tmp_path), tei)
+    with open(tei, "rb") as file:
+        assert file.read() == TEI
+    assert not os.path.exists(tei + ".part")
+    assert b'name="consolidateHeader"' in stub.requests[0]
+    assert b"%PDF-1.4" in stub.requests[0]
+
+
+def test_text_content_type_without_charset(tmp_path):
+    # decoding the answer would take it for ISO-8859-1
+    tei = str(tmp_path / "doc.grobid.tei.xml")
+    with GrobidStub(content_type="text/xml") as stub:
+        assert client(stub).process(make_pdf(tmp_path), tei)
+    with open(tei, "rb") as file:
+        assert file.read() == TEI
+
+
+def test_retries_while_the_server_is_busy(tmp_path):
+    tei = str(tmp_path / "doc.grobid.tei.xml")
+    with GrobidStub([(503, 0), (503, 0)]) as stub:
+        start = time.perf_counter()
+        assert client(stub, sleep_time=0.2).process(make_pdf(tmp_path), tei)
+        # it waits sleep_time after every 503
+        assert time.perf_counter() - start >= 0.4
+    assert len(stub.requests) == 3
+    assert os.path.exists(tei)
+
+
+def test_gives_up_after_the_retries(tmp_path):
+    tei = str(tmp_path / "doc.grobid.tei.xml")
+    with GrobidStub([(503, 0)] * 5) as stub:
+        assert not client(stub, grobid={"retries": 3}).process(make_pdf(tmp_path), tei)
+    assert len(stub.requests) == 3
+    assert not os.path.exists(tei)
+
+
+def test_retries_after_a_timeout(tmp_path):
+    tei = str(tmp_path / "doc.grobid.tei.xml")
+    with GrobidStub([(200, 1)]) as stub:
+        assert client(stub, timeout=0.2).process(make_pdf(tmp_path), tei)
+    assert len(stub.requests) == 2
+    with open(tei, "rb") as file:
+        assert file.read() == TEI
+
+
+def test_error_status_is_not_retried(tmp_path):
+    tei = str(tmp_path / "doc.grobid.tei.xml")
+    for status in (400, 500):
+        with GrobidStub([(status, 0)]) as stub:
+            assert not client(stub).process(make_pdf(tmp_path), tei)
+        assert len(stub.requests) == 1
+        assert not os.path.exists(tei) and not os.path.exists(tei + ".part")
+
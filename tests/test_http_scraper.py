@@ -0,0 +1,165 @@
+import http.server
+import os
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from http_scraper import PpmSession, get_license, page_size, page_url, parse_entries, parse_html
+from known_index import KnownIndex
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+ALLOWED_LICENSES = ["CC BY-SA", "CC BY-NC", "CC BY-NC-SA", "CC BY"]
+SEARCH = "/search/phd?ps=4&lang=pl&pn=1"
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), "rb") as file:
+        return file.read()
+
+
+@pytest.fixture
+def ppm():
+    """Local PPM: the result page for GET, the paginator answers (pages 2 and 3) for the AJAX POSTs."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), PpmHandler)
+    server.gets, server.posts = [], []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class PpmHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.gets.append(self.path)
+        if self.path.startswith("/plain"):
+            # a result page without the PrimeFaces data list, paged with the pn parameter only
+            page = parse_qs(urlsplit(self.path).query)["pn"][0]
+            html = fixture("ppm_results.html").replace(b"ui-datalist ", b"").replace(b"Czynniki", page.encode())
+            self.answer(html, "text/html;charset=UTF-8")
+        else:
+            self.answer(fixture("ppm_results.html"), "text/html;charset=UTF-8")
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+        self.server.posts.append(({key: values[0] for key, values in form.items()}, dict(self.headers)))
+        first = int(form["searchForm:searchResults_first"][0])
+        self.answer(fixture("ppm_page2.xml" if first == 4 else "ppm_page3.xml"), "text/xml;charset=UTF-8")
+
+    def answer(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_parse_entries():
+    root = parse_html(fixture("ppm_results.html").decode("utf-8"))
+    entries = parse_entries(root, "https://ppm.edu.pl" + SEARCH, ALLOWED_LICENSES)
+    assert entries == [
+        {"Title": "Czynniki ryzyka zakażeń szpitalnych u noworodków",
+         "URL": "https://ppm.edu.pl/info/phd/UMB1a2b3c4d/",
+         "File": "https://ppm.edu.pl/docstore/download/UMB1a2b3c4d/Kowalska_rozprawa.pdf", "License": "CC BY-NC-SA",
+         "complete": True},
+        {"Title": "Ocena jakości życia pacjentów po przeszczepie nerki",
+         "URL": "https://ppm.edu.pl/info/phd/WUM5e6f7a8b/",
+         "File": "https://files.ppm.edu.pl/WUM5e6f7a8b.pdf", "License": "CC BY-SA", "complete": True},
+        # the first file of the overlay panel is taken, its licence is not allowed
+        {"Title": "Farmakokinetyka leków przeciwpadaczkowych",
+         "URL": "https://ppm.edu.pl/info/phd/GUM9c0d1e2f/",
+         "File": "https://ppm.edu.pl/docstore/download/GUM9c0d1e2f/rozprawa.pdf", "License": None,
+         "complete": True},
+        {"Title": "Zastosowanie rezonansu magnetycznego w diagnostyce <stwardnienia rozsianego>",
+         "URL": "https://ppm.edu.pl/info/phd/UMP3a4b5c6d/", "File": None, "License": None, "complete": True}
+    ]
+
+
+def test_get_license():
+    rows = parse_html(fixture("ppm_results.html").decode("utf-8")).find_all("entities-table-row")
+    licenses = [get_license(row, row.find("fileDownloadLink", "a"), ALLOWED_LICENSES) for row in rows[:3]]
+    # tooltip text, then the title attribute when the tooltip is empty; CC BY-ND is not allowed
+    assert licenses == [("CC BY-NC-SA", True), ("CC BY-SA", True), (None, True)]
+    assert get_license(rows[0], rows[0].find("fileDownloadLink", "a"), ["CC BY"]) == (None, True)
+
+
+def test_page_url():
+    url = page_url("https://ppm.edu.pl" + SEARCH, 7)
+    assert parse_qs(urlsplit(url).query) == {"ps": ["4"], "lang": ["pl"], "pn": ["7"]}
+    assert page_size(url) == 4
+    assert page_size("https://ppm.edu.pl/search/phd?lang=pl") == 100
+
+
+def test_first_page_keeps_the_view_state(ppm):
+    session = PpmSession(delay=0)
+    root = session.page(f"http://127.0.0.1:{ppm.server_port}{SEARCH}", 1)
+    assert len(root.find_all("entities-table-row")) == 4
+    assert session.component == "searchForm:searchResults"
+    assert session.form == "searchForm"
+    assert session.view_state_name == "javax.faces.ViewState"
+    assert session.view_state == "-4417593011123456789:2718281828459045235"
+    assert ppm.posts == []
+
+
+def test_paginator_requests(ppm):
+    session = PpmSession(delay=0)
+    url = f"http://127.0.0.1:{ppm.server_port}{SEARCH}"
+    session.page(url, 1)
+
+    page2 = parse_entries(session.page(url, 2), session.url, ALLOWED_LICENSES)
+    assert [(entry["URL"].rsplit("/", 2)[1], entry["License"]) for entry in page2] == [
+        ("UMW7e8f9a0b", "CC BY"), ("UMLd1e2f3a4", None)]
+    assert page2[0]["File"] == f"http://127.0.0.1:{ppm.server_port}/docstore/download/UMW7e8f9a0b/Nowak.pdf"
+    form, headers = ppm.posts[0]
+    assert form["javax.faces.partial.ajax"] == "true"
+    assert form["javax.faces.source"] == "searchForm:searchResults"
+    assert form["searchForm:searchResults_first"] == "4"
+    assert form["searchForm:searchResults_rows"] == "4"
+    assert form["searchForm"] == "searchForm"
+    assert form["javax.faces.ViewState"] == "-4417593011123456789:2718281828459045235"
+    assert headers["Faces-Request"] == "partial/ajax"
+
+    # the view state sent back with page 2 is the one of the next request
+    page3 = parse_entries(session.page(url, 3), session.url, ALLOWED_LICENSES)
+    assert [(entry["Title"], entry["License"], entry["complete"]) for entry in page3] == [
+        ("Rehabilitacja kardiologiczna po zawale serca", "CC BY-NC", True),
+        # no licence text in the page for this file
+        ("Leczenie chirurgiczne wad zastawkowych serca", None, False)]
+    assert ppm.posts[1][0]["searchForm:searchResults_first"] == "8"
+    assert ppm.posts[1][0]["javax.faces.ViewState"] == "-4417593011123456789:3141592653589793238"
+    assert session.view_state == "-4417593011123456789:1618033988749894848"
+    assert len(ppm.gets) == 1
+
+
+def test_resumes_on_a_later_page(ppm):
+    # a run starting on page 2 loads that page's URL first, then pages with the paginator
+    session = PpmSession(delay=0)
+    session.page(f"http://127.0.0.1:{ppm.server_port}{SEARCH}", 2)
+    assert parse_qs(urlsplit(ppm.gets[0]).query)["pn"] == ["2"]
+    assert ppm.posts[0][0]["searchForm:searchResults_first"] == "4"
+
+
+def test_pages_without_a_data_list_use_the_page_parameter(ppm):
+    session = PpmSession(delay=0)
+    url = f"http://127.0.0.1:{ppm.server_port}/plain?ps=4&pn=1"
+    assert session.page(url, 1).find("entity-row-title").text().startswith("1 ryzyka")
+    assert session.component is None
+    assert session.page(url, 2).find("entity-row-title").text().startswith("2 ryzyka")
+    assert ppm.posts == []
+    assert [parse_qs(urlsplit(path).query)["pn"] for path in ppm.gets] == [["1"], ["2"]]
+
+
+def test_rows_without_a_licence_text_are_not_recorded(tmp_path):
+    index = KnownIndex(str(tmp_path / "known.sqlite"))
+    entries = parse_entries(parse_html(fixture("ppm_results.html").decode("utf-8")), "https://ppm.edu.pl/",
+                            ALLOWED_LICENSES)
+    entries[1]["complete"] = False
+    index.record(entries)
+    # rejected theses are known (File None or License None), the one whose licence was not read is not
+    assert set(index.load()) == {entry["URL"] for entry in entries} - {entries[1]["URL"]}
+    index.close()
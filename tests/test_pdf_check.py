@@ -0,0 +1,49 @@
+import json
+import os
+
+from utils.pdf_check import PdfValidator, sha256_of, sidecar_path
+
+PDF = (b"%PDF-1.4\n1 0 obj\n<< /Type /Catalog >>\nendobj\n"
+       b"xref\n0 2\n0000000000 65535 f \n0000000009 00000 n \ntrailer\n<< /Size 2 /Root 1 0 R >>\n"
+       b"startxref\n45\n%%EOF\n")
+
+
+def download(tmp_path, content):
+    """A finished download: the file and the sidecar utils.downloader writes next to it."""
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(content)
+    with open(sidecar_path(str(path)), "w") as file:
+        json.dump({"url": "http://x/doc.pdf", "length": len(content), "sha256": sha256_of(str(path))}, file)
+    return str(path)
+
+
+def test_valid_download(tmp_path):
+    path = download(tmp_path, PDF)
+    validator = PdfValidator(str(tmp_path / "checks.sqlite"))
+    assert validator.is_valid(path)
+    # cached per path, size and mtime
+    assert validator.is_valid(path)
+    validator.close()
+
+
+def test_changed_bytes_of_the_announced_length(tmp_path):
+    path = download(tmp_path, PDF)
+    validator = PdfValidator(str(tmp_path / "checks.sqlite"))
+    assert validator.is_valid(path)
+    # bytes overwritten in place later on: same length, and the header and trailer still look fine
+    with open(path, "r+b") as file:
+        file.seek(20)
+        file.write(b" " * 10)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert not validator.is_valid(path)
+    validator.close()
+
+
+def test_length_mismatch(tmp_path):
+    path = download(tmp_path, PDF)
+    with open(path, "ab") as file:
+        file.write(b"\n")
+    validator = PdfValidator(str(tmp_path / "checks.sqlite"))
+    assert not validator.is_valid(path)
+    validator.close()
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import utils.service
+from conftest import ROOT
+from utils.service import is_running, send
+
+# Worker echoing the requests on the socket of argv[1]; with "tcp" as argv[2] it runs as if there were no AF_UNIX
+WORKER = """
+import socket, sys
+if sys.argv[2] == "tcp":
+    del socket.AF_UNIX
+from utils.service import serve
+serve(lambda request: {"echo": request}, {"socket": sys.argv[1], "timeout": 5})
+"""
+
+
+@pytest.mark.parametrize("transport", ["unix", "tcp"])
+def test_worker(tmp_path, monkeypatch, transport):
+    monkeypatch.setattr(utils.service, "UNIX_SOCKETS", transport == "unix")
+    path = str(tmp_path / "service.sock")
+    settings = {"socket": path, "timeout": 5}
+    worker = subprocess.Popen([sys.executable, "-c", WORKER, path, transport], cwd=ROOT, stdout=subprocess.PIPE)
+    try:
+        assert worker.stdout.readline().startswith(b"Listening on")
+        assert is_running(path)
+        assert send({"text": "Zażółć"}, settings) == {"echo": {"text": "Zażółć"}}
+        assert send({"ping": True}, settings)["served"] == 1
+    finally:
+        worker.terminate()
+        worker.wait(10)
+    # the socket (or port) file is removed when the worker stops
+    assert not os.path.exists(path)
+    assert not is_running(path)
+
+
+def test_import_without_unix_sockets():
+    code = "import socket; del socket.AF_UNIX; import utils.service; print(utils.service.Server.__mro__[2].__name__)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert result.stdout.strip() == "TCPServer", result.stderr
@@ -0,0 +1,14 @@
+import gzip
+
+from grobid_stub import TEI
+from utils.tei import compare
+
+
+def test_compare_reads_the_compressed_tei_of_the_store(tmp_path, capsys):
+    (tmp_path / "doct").mkdir()
+    (tmp_path / "doct" / "doc.grobid.tei.xml").write_bytes(TEI)
+    stored = tmp_path / "artifacts" / "ab" / "abcd"
+    stored.mkdir(parents=True)
+    (stored / "doc.grobid.tei.xml.gz").write_bytes(gzip.compress(TEI))
+    assert compare(str(tmp_path)) == 0
+    assert "Compared 2 files, 0 differ" in capsys.readouterr().out
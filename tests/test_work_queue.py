@@ -0,0 +1,29 @@
+from utils.work_queue import WorkQueue
+
+ROWS = [{"ID": i, "Title": f"Praca {i}", "URL": f"http://x/{i}", "License": "CC BY", "File": f"http://x/{i}.pdf"}
+        for i in (1, 2)]
+
+
+def test_failed_documents_are_retried_up_to_max_attempts(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=2)
+    queue.add(ROWS[:1])
+    assert queue.claim("w")["ID"] == 1
+    queue.fail(1, "w")
+    assert queue.progress()["pending"] == 1
+    assert queue.claim("w")["ID"] == 1
+    queue.fail(1, "w")
+    assert queue.claim("w") is None
+    assert queue.progress()["failed"] == 1
+    queue.close()
+
+
+def test_fail_keeps_a_done_document_done(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"))
+    queue.add(ROWS)
+    queue.claim("w")
+    queue.complete(1, "w")
+    # a later step of the same document raised
+    queue.fail(1, "w")
+    assert queue.progress() == {"pending": 1, "leased": 0, "done": 1, "failed": 0}
+    assert queue.claim("w")["ID"] == 2
+    queue.close()
@@ -1,12 +1,47 @@
 import glob
+import hashlib
 import json
+import os
+import shutil
+from importlib.metadata import version
 from random import Random
 
-import spacy
-from spacy.training import Example
+# Defaults for the "model" section of config.json
+MODEL_CONFIG = {
+    "directory": "models",  # trained pipelines are stored in <directory>/textcat-<hash>
+    "base": "pl_core_news_sm",  # pipeline the text classifier is added to
+    "dataset": "utils/dataset/*.json",
+    "epochs": 8,
+    "batch_start": 4,  # minibatch sizes grow from batch_start to batch_stop by batch_compound per batch
+    "batch_stop": 32,
+    "batch_compound": 1.001,
+    "dropout": 0.0,
+    "seed": 0
+}
 
 
-def training(nlp):
+def model_version(settings=MODEL_CONFIG):
+    """Hash of the training data, the training settings and the spaCy version, the model is rebuilt when it changes."""
+    digest = hashlib.sha256()
+    for jfile in sorted(glob.glob(settings["dataset"])):
+        digest.update(os.path.basename(jfile).encode("utf-8"))
+        with open(jfile, "rb") as file:
+            digest.update(file.read())
+    training_settings = {key: value for key, value in settings.items() if key != "directory"}
+    digest.update(json.dumps(training_settings, sort_keys=True).encode("utf-8"))
+    digest.update(version("spacy").encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def model_path(settings=MODEL_CONFIG):
+    return os.path.join(settings["directory"], f"textcat-{model_version(settings)}")
+
+
+def training(nlp, settings=MODEL_CONFIG):
+    import spacy
+    from spacy.training import Example
+    from spacy.util import compounding, minibatch
+
     mynlp = spacy.blank("pl")
     textcat = mynlp.add_pipe("textcat")
     textcat.add_label("TOC")  # Table of Contents
@@ -14,20 +49,55 @@ def training(nlp):
     textcat.add_label("MNumbers")  # Table of Contents
 
     train_data = []
-    for jfile in glob.glob("utils/dataset/*.json"):
+    for jfile in sorted(glob.glob(settings["dataset"])):
         with open(jfile, 'r', encoding='utf-8') as file:
             train_data.extend(json.load(file))
+    examples = [Example.from_dict(mynlp.make_doc(cell["text"]), {"cats": cell["cats"]}) for cell in train_data]
 
     # Trening
-    optimizer = mynlp.begin_training()
-    for i in range(8):  # epoki
+    random = Random(settings["seed"])
+    optimizer = mynlp.initialize(lambda: examples)
+    for i in range(settings["epochs"]):  # epoki
         losses = {}
-        Random().shuffle(train_data)
-        for cell in train_data:
-            doc = mynlp.make_doc(cell["text"])
-            example = Example.from_dict(doc, {"cats": cell["cats"]})
-            mynlp.update([example], losses=losses, sgd=optimizer)
+        random.shuffle(examples)
+        sizes = compounding(settings["batch_start"], settings["batch_stop"], settings["batch_compound"])
+        for batch in minibatch(examples, size=sizes):
+            mynlp.update(batch, drop=settings["dropout"], losses=losses, sgd=optimizer)
         print(losses)
     nlp.add_pipe("textcat", name="textcat_2", source=mynlp)
 
-    return nlp
\ No newline at end of file
+    return nlp
+
+
+def build_model(settings=MODEL_CONFIG):
+    """Path of the trained pipeline for the current dataset and settings, training it only if it does not exist.
+
+    The pipeline is saved to a temporary directory and renamed into place, so processes starting at the same time
+    never load a half written model; if several of them train, the first rename wins.
+    """
+    path = model_path(settings)
+    if os.path.exists(path):
+        return path
+
+    import spacy
+    from utils.text_filter import register_language_detector
+
+    register_language_detector()
+    print(f"Training the text classifier ({path})")
+    if settings["base"].startswith("blank:"):
+        nlp = spacy.blank(settings["base"][len("blank:"):])
+    else:
+        nlp = spacy.load(settings["base"])
+    nlp.add_pipe("sentencizer")
+    nlp.add_pipe("language_detector", last=True)
+    nlp = training(nlp, settings)
+
+    os.makedirs(settings["directory"], exist_ok=True)
+    temporary = f"{path}.tmp-{os.getpid()}"
+    nlp.to_disk(temporary)
+    try:
+        os.rename(temporary, path)
+    except OSError:
+        # another process saved the same model first
+        shutil.rmtree(temporary, ignore_errors=True)
+    return path
@@ -0,0 +1,218 @@
+# Content-addressed store of the PDFs and of the text extracted from them, keyed by the sha256 of the PDF.
+import contextlib
+import gzip
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from utils.pdf_check import sha256_of
+
+# Defaults for the "artifacts" section of config.json
+ARTIFACT_CONFIG = {
+    "directory": "artifacts",
+    "max_bytes": 0,  # disk budget of the stored files, least recently used ones are evicted above it (0: no limit)
+    "min_age_seconds": 3600,  # files used more recently than this are never evicted (documents in flight)
+    "compress_level": 6  # gzip level of the TEI and text-layer files
+}
+
+# Artifact name -> file name inside the directory of a PDF hash; the text artifacts are stored gzip compressed
+ARTIFACT_FILES = {
+    "pdf": "doc.pdf",
+    "grobid": "doc.grobid.tei.xml.gz",
+    "text_layer": "doc.text_layer.txt.gz"
+}
+
+
+def open_artifact(path, mode="rb"):
+    """Open a stored file, decompressing it transparently."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8" if "t" in mode else None)
+    return open(path, mode, encoding="utf-8" if "t" in mode else None)
+
+
+class ArtifactStore:
+    """Files under <directory>/<hash[:2]>/<hash>/, with a SQLite map of document ID and file URL -> PDF hash.
+
+    The same PDF listed under several IDs or URLs is stored, and processed, once. Every read or write updates
+    the last use of the file, which orders the eviction when the store is above its disk budget.
+    """
+
+    def __init__(self, settings=ARTIFACT_CONFIG):
+        self.settings = {**ARTIFACT_CONFIG, **settings}
+        self.directory = self.settings["directory"]
+        os.makedirs(os.path.join(self.directory, "tmp"), exist_ok=True)
+        self.lock = threading.Lock()
+        self.key_locks = {}  # key -> [lock, threads holding or waiting for it]
+        self.connection = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), timeout=60,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, title TEXT, url TEXT, "
+                                "pdf_hash TEXT)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS documents_url ON documents (url)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS files (pdf_hash TEXT, name TEXT, size INTEGER, "
+                                "used REAL, PRIMARY KEY (pdf_hash, name))")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS files_used ON files (used)")
+        self.connection.commit()
+
+    def path(self, pdf_hash, name):
+        return os.path.join(self.directory, pdf_hash[:2], pdf_hash, ARTIFACT_FILES[name])
+
+    def scratch_path(self, name):
+        """Temporary file in the store's directory (same file system, so put() can rename it).
+
+        The name is prefixed with the process and thread, so workers handling the same PDF never share one.
+        """
+        return os.path.join(self.directory, "tmp", f"{os.getpid()}-{threading.get_ident()}-{name}")
+
+    @contextlib.contextmanager
+    def exclusive(self, key):
+        """Hold the lock of the key (a file URL or a PDF hash) for the block.
+
+        Threads of this process working on the same PDF wait for each other, so a PDF listed under several IDs is
+        downloaded and extracted once and the others find the stored result.
+        """
+        with self.lock:
+            entry = self.key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.key_locks[key]
+
+    def lookup(self, doc_id, url=None):
+        """PDF hash of the document, found by its ID or by the URL of its file, None if it was never stored.
+
+        With a URL, the PDF stored for the ID counts only if it was downloaded from that URL: a document whose file
+        link changed gets the new file downloaded (and add_pdf links the ID to it).
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT url, pdf_hash FROM documents WHERE id = ?",
+                                          (str(doc_id),)).fetchone()
+            if row is not None and url and row[0] != url:
+                row = None
+            if row is None and url:
+                row = self.connection.execute("SELECT url, pdf_hash FROM documents WHERE url = ?", (url,)).fetchone()
+        return row[1] if row else None
+
+    def link(self, doc_id, title, url, pdf_hash):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)",
+                                    (str(doc_id), title, url, pdf_hash))
+
+    def has(self, pdf_hash, name):
+        """True if the file is stored; a file removed by hand is forgotten."""
+        if os.path.exists(self.path(pdf_hash, name)):
+            return True
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM files WHERE pdf_hash = ? AND name = ?", (pdf_hash, name))
+        return False
+
+    def touch(self, pdf_hash, name):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE files SET used = ? WHERE pdf_hash = ? AND name = ?",
+                                    (time.time(), pdf_hash, name))
+
+    def get(self, pdf_hash, name):
+        """Path of the stored file (decompress it with open_artifact), or None if it is not stored."""
+        if not self.has(pdf_hash, name):
+            return None
+        self.touch(pdf_hash, name)
+        return self.path(pdf_hash, name)
+
+    def put(self, pdf_hash, name, source):
+        """Move the file into the store (compressing the text artifacts) and return its stored path."""
+        path = self.path(pdf_hash, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # several threads or processes may store the same PDF at once, the last rename wins
+        part = f"{path}.{os.getpid()}-{threading.get_ident()}.part"
+        if path.endswith(".gz"):
+            # no file name and mtime=0 in the gzip header keep the compressed file, and so its hash in the manifest,
+            # the same for the same content (GzipFile would store the name of the .part file otherwise)
+            level = self.settings["compress_level"]
+            with open(source, "rb") as src, open(part, "wb") as raw, \
+                    gzip.GzipFile(filename="", fileobj=raw, mode="wb", compresslevel=level, mtime=0) as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            os.remove(source)
+        else:
+            shutil.move(source, part)
+        os.replace(part, path)
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                    (pdf_hash, name, os.path.getsize(path), time.time()))
+        return path
+
+    def add_pdf(self, doc_id, title, url, source):
+        """Store a downloaded PDF under its sha256 (once, whatever the number of documents listing it)."""
+        pdf_hash = sha256_of(source)
+        if self.has(pdf_hash, "pdf"):
+            os.remove(source)
+            self.touch(pdf_hash, "pdf")
+        else:
+            self.put(pdf_hash, "pdf", source)
+        self.link(doc_id, title, url, pdf_hash)
+        return pdf_hash
+
+    def size(self):
+        with self.lock:
+            return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+
+    def evict(self):
+        """Remove the least recently used files until the store fits in max_bytes; returns the bytes freed."""
+        budget = self.settings["max_bytes"]
+        if not budget:
+            return 0
+        excess = self.size() - budget
+        freed = 0
+        if excess <= 0:
+            return 0
+        with self.lock:
+            candidates = self.connection.execute(
+                "SELECT pdf_hash, name, size FROM files WHERE used < ? ORDER BY used",
+                (time.time() - self.settings["min_age_seconds"],)).fetchall()
+        for pdf_hash, name, size in candidates:
+            if freed >= excess:
+                break
+            try:
+                os.remove(self.path(pdf_hash, name))
+            except FileNotFoundError:
+                pass
+            with self.lock, self.connection:
+                self.connection.execute("DELETE FROM files WHERE pdf_hash = ? AND name = ?", (pdf_hash, name))
+            freed += size
+        return freed
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    # python -m utils.artifacts [stats | evict | get <ID> <pdf|grobid|text_layer>]
+    import json
+    import sys
+
+    with open("config.json", "r") as f:
+        store = ArtifactStore(json.load(f).get("artifacts", {}))
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "get":
+        pdf_hash = store.lookup(sys.argv[2])
+        path = store.get(pdf_hash, sys.argv[3]) if pdf_hash else None
+        if path is None:
+            sys.exit(f"{sys.argv[3]} of document {sys.argv[2]} is not stored")
+        with open_artifact(path) as file:
+            shutil.copyfileobj(file, sys.stdout.buffer)
+    elif command == "evict":
+        print(f"Evicted {store.evict() / 2 ** 20:.1f} MB, {store.size() / 2 ** 20:.1f} MB stored")
+    else:
+        documents, hashes = store.connection.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT pdf_hash) FROM documents").fetchone()
+        print(f"{documents} documents, {hashes} distinct PDFs, {store.size() / 2 ** 20:.1f} MB stored")
+        for name, count, size in store.connection.execute(
+                "SELECT name, COUNT(*), SUM(size) FROM files GROUP BY name ORDER BY name"):
+            print(f"  {name}: {count} files, {size / 2 ** 20:.1f} MB")
+    store.close()
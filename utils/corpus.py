@@ -0,0 +1,158 @@
+# Sharded, compressed JSONL corpus of the cleaned theses, with an index for random access by ID.
+import glob
+import gzip
+import json
+import os
+import time
+
+# Defaults for the "corpus" section of config.json
+CORPUS_CONFIG = {
+    "directory": "corpus",
+    "max_shard_bytes": 256 * 1024 * 1024  # a new shard is started once the current one is this large
+}
+
+
+def text_stats(text):
+    return {"characters": len(text), "words": len(text.split())}
+
+
+def iter_index(directory):
+    """Entries of every index file in the directory (one index file per writer)."""
+    for index_file in sorted(glob.glob(os.path.join(directory, "index-*.jsonl"))):
+        with open(index_file, "r", encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_index(directory):
+    """{ID: index entry} of the latest record of every document."""
+    index = {}
+    for entry in iter_index(directory):
+        # a re-cleaned document is appended again, the newest record wins
+        if entry["ID"] not in index or entry["time"] >= index[entry["ID"]]["time"]:
+            index[entry["ID"]] = entry
+    return index
+
+
+class CorpusWriter:
+    """Appends documents to size-bounded .jsonl.gz shards.
+
+    Every record is its own gzip member, so a shard is an ordinary gzip file for streaming readers and a single
+    record can be decompressed from its offset. Every writer has its own shards and index file, so workers on
+    several machines can share the directory.
+    """
+
+    def __init__(self, directory=CORPUS_CONFIG["directory"], name="corpus",
+                 max_shard_bytes=CORPUS_CONFIG["max_shard_bytes"]):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.name = name
+        self.max_shard_bytes = max_shard_bytes
+        # text hash of every document already in the corpus, so unchanged documents are not appended again
+        self.known = {doc_id: entry.get("text_hash") for doc_id, entry in read_index(directory).items()}
+        self.shard_number = len(glob.glob(os.path.join(directory, f"{name}-*.jsonl.gz")))
+        self.shard = None
+        self.index = None
+
+    def next_shard(self):
+        if self.shard is not None:
+            self.shard.close()
+        else:
+            self.index = open(os.path.join(self.directory, f"index-{self.name}.jsonl"), "a", encoding="utf-8")
+        self.shard = open(os.path.join(self.directory, f"{self.name}-{self.shard_number:05d}.jsonl.gz"), "ab")
+        self.shard_number += 1
+
+    def append(self, record, text_hash=None):
+        """Append a record (ID, URL, License, Title, text); returns False if the same text is already stored."""
+        doc_id = str(record["ID"])
+        if text_hash is not None and self.known.get(doc_id) == text_hash:
+            return False
+        if self.shard is None or self.shard.tell() >= self.max_shard_bytes:
+            self.next_shard()
+
+        record = {**record, "ID": doc_id, "stats": text_stats(record["text"])}
+        data = gzip.compress((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        offset = self.shard.tell()
+        self.shard.write(data)
+        self.shard.flush()
+        # the index is written after the record, so an entry never points at a partial record
+        self.index.write(json.dumps({"ID": doc_id, "shard": os.path.basename(self.shard.name), "offset": offset,
+                                     "length": len(data), "text_hash": text_hash, "time": time.time()}) + "\n")
+        self.index.flush()
+        self.known[doc_id] = text_hash
+        return True
+
+    def close(self):
+        if self.shard is not None:
+            self.shard.close()
+            self.index.close()
+
+
+def read_entry(directory, entry):
+    with open(os.path.join(directory, entry["shard"]), "rb") as file:
+        file.seek(entry["offset"])
+        return json.loads(gzip.decompress(file.read(entry["length"])))
+
+
+def read_record(directory, doc_id, index=None):
+    """Random access to one document by ID."""
+    index = index if index is not None else read_index(directory)
+    return read_entry(directory, index[str(doc_id)])
+
+
+def export_shard(directory, shard, entries, output_dir):
+    """Write the given records of one shard to output_dir/{ID}.txt, reading the shard front to back."""
+    with open(os.path.join(directory, shard), "rb") as file:
+        for entry in sorted(entries, key=lambda entry: entry["offset"]):
+            file.seek(entry["offset"])
+            record = json.loads(gzip.decompress(file.read(entry["length"])))
+            with open(os.path.join(output_dir, f"{record['ID']}.txt"), "w", encoding="utf-8") as output:
+                output.write(record["text"])
+    return len(entries)
+
+
+def export_texts(directory, output_dir, processes=None):
+    """Write the latest text of every document to output_dir/{ID}.txt, one process per shard."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    os.makedirs(output_dir, exist_ok=True)
+    shards = {}
+    for entry in read_index(directory).values():
+        shards.setdefault(entry["shard"], []).append(entry)
+    with ProcessPoolExecutor(processes) as executor:
+        futures = [executor.submit(export_shard, directory, shard, entries, output_dir)
+                   for shard, entries in shards.items()]
+        return sum(future.result() for future in futures)
+
+
+def import_csv(file_path, writer):
+    """Move an old doctorates_with_text_*.csv (pipe separated) into the corpus."""
+    import pandas as pd
+
+    count = 0
+    for row in pd.read_csv(file_path, delimiter="|").dropna(subset=["Text"]).to_dict("records"):
+        count += writer.append({"ID": row["ID"], "Title": row["Title"], "URL": row["URL"],
+                                "License": row["License"], "text": str(row["Text"])})
+    return count
+
+
+if __name__ == "__main__":
+    # python -m utils.corpus get <ID> | import <doctorates_with_text_*.csv>... [--directory corpus]
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Read documents from the corpus or import old CSV outputs.")
+    parser.add_argument("command", choices=["get", "import"])
+    parser.add_argument("arguments", nargs="+")
+    parser.add_argument("--directory", default=CORPUS_CONFIG["directory"])
+    args = parser.parse_args()
+
+    if args.command == "get":
+        index = read_index(args.directory)
+        for doc_id in args.arguments:
+            print(json.dumps(read_record(args.directory, doc_id, index), ensure_ascii=False))
+    else:
+        corpus = CorpusWriter(args.directory, "imported")
+        for csv_file in args.arguments:
+            print(f"{csv_file}: {import_csv(csv_file, corpus)} documents imported")
+        corpus.close()
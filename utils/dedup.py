@@ -0,0 +1,247 @@
+# Near-duplicate detection of the extracted texts with MinHash signatures and LSH buckets in SQLite.
+import glob
+import hashlib
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Defaults for the "dedup" section of config.json
+DEDUP_CONFIG = {
+    "index": "cache/dedup.sqlite",
+    "shingle_words": 5,  # documents are compared as sets of word n-grams
+    "min_shingles": 10,  # shorter documents are not compared, all empty or tiny texts would look like duplicates
+    "num_perm": 128,  # hash functions per signature, must be bands * rows
+    "bands": 16,  # candidates share all rows of at least one band (16 x 8 rows finds pairs above ~0.7)
+    "threshold": 0.8,  # estimated Jaccard similarity above which two documents are duplicates
+    "processes": None  # processes computing the signatures, defaults to the number of cores
+}
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def permutations(num_perm, seed=1):
+    """Parameters (a, b) of the hash functions (a * x + b) mod p; fixed by the seed so signatures stay comparable."""
+    generator = np.random.RandomState(seed)
+    return (generator.randint(1, 1 << 32, num_perm, dtype=np.uint64),
+            generator.randint(0, 1 << 32, num_perm, dtype=np.uint64))
+
+
+def shingles(text, words=DEDUP_CONFIG["shingle_words"]):
+    tokens = re.findall(r"\w+", text.lower())
+    if len(tokens) < words:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i:i + words]) for i in range(len(tokens) - words + 1)}
+
+
+def minhash(text, settings=DEDUP_CONFIG, text_shingles=None):
+    """MinHash signature (uint32 array of num_perm values) of the word shingles of the text."""
+    if text_shingles is None:
+        text_shingles = shingles(text, settings["shingle_words"])
+    a, b = permutations(settings["num_perm"])
+    hashes = np.array([int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little")
+                       for shingle in text_shingles], dtype=np.uint64)
+    # a * x stays below 2**64 because a and x are 32 bit
+    values = (np.outer(hashes, a) + b) % MERSENNE_PRIME & MAX_HASH
+    return values.min(axis=0).astype(np.uint32)
+
+
+def band_keys(signature, bands):
+    rows = len(signature) // bands
+    return [hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).digest()
+            for band in range(bands)]
+
+
+def similarity(first, second):
+    """Jaccard similarity estimated from two signatures."""
+    return float(np.mean(first == second))
+
+
+def read_text(source):
+    """Text of a {ID}.txt file or of a (corpus directory, index entry) tuple."""
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8") as file:
+            return file.read()
+    from utils.corpus import read_entry
+
+    return read_entry(*source)["text"]
+
+
+def source_id(source):
+    return os.path.splitext(os.path.basename(source))[0] if isinstance(source, str) else source[1]["ID"]
+
+
+def source_version(source):
+    """Changes when the document changes: size and mtime of a file, text hash of a corpus record."""
+    if isinstance(source, str):
+        stat = os.stat(source)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+    return source[1].get("text_hash") or str(source[1]["time"])
+
+
+def signature_job(source, settings):
+    """(ID, version, length, signature) of the document; the signature is None when it has too few shingles."""
+    text = read_text(source)
+    text_shingles = shingles(text, settings["shingle_words"])
+    if len(text_shingles) < settings["min_shingles"]:
+        return source_id(source), source_version(source), len(text), None
+    return source_id(source), source_version(source), len(text), minhash(text, settings, text_shingles).tobytes()
+
+
+class DedupIndex:
+    """Persistent MinHash/LSH index; documents can be added batch by batch as they arrive."""
+
+    def __init__(self, settings=DEDUP_CONFIG):
+        self.settings = {**DEDUP_CONFIG, **settings}
+        if self.settings["num_perm"] % self.settings["bands"]:
+            raise ValueError("num_perm must be a multiple of bands")
+        directory = os.path.dirname(self.settings["index"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(self.settings["index"])
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, version TEXT, "
+                                "length INTEGER, signature BLOB)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS buckets (band INTEGER, key BLOB, id TEXT, "
+                                "PRIMARY KEY (band, key, id)) WITHOUT ROWID")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS buckets_id ON buckets (id)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS pairs (first TEXT, second TEXT, similarity REAL, "
+                                "PRIMARY KEY (first, second)) WITHOUT ROWID")
+        self.connection.commit()
+
+    def versions(self):
+        return dict(self.connection.execute("SELECT id, version FROM documents"))
+
+    def add(self, sources):
+        """Add new or changed documents (paths of {ID}.txt files or (corpus directory, index entry) tuples)."""
+        known = self.versions()
+        pending = [source for source in sources if known.get(source_id(source)) != source_version(source)]
+        if not pending:
+            return 0
+        with ProcessPoolExecutor(self.settings["processes"]) as executor:
+            results = executor.map(signature_job, pending, [self.settings] * len(pending), chunksize=16)
+            count = 0
+            for doc_id, version, length, signature in results:
+                self.insert(doc_id, version, length, signature)
+                count += 1
+                if count % 1000 == 0:
+                    self.connection.commit()
+                    print(f"Dedup: {count}/{len(pending)} signatures")
+        self.connection.commit()
+        return count
+
+    def insert(self, doc_id, version, length, signature):
+        connection = self.connection
+        # a changed document loses its old buckets and pairs
+        connection.execute("DELETE FROM buckets WHERE id = ?", (doc_id,))
+        connection.execute("DELETE FROM pairs WHERE first = ? OR second = ?", (doc_id, doc_id))
+        connection.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)", (doc_id, version, length, signature))
+        if signature is None:
+            # too short to compare, kept without entering the buckets
+            return
+
+        values = np.frombuffer(signature, dtype=np.uint32)
+        candidates = set()
+        for band, key in enumerate(band_keys(values, self.settings["bands"])):
+            candidates.update(row[0] for row in connection.execute(
+                "SELECT id FROM buckets WHERE band = ? AND key = ?", (band, key)))
+            connection.execute("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)", (band, key, doc_id))
+        candidates.discard(doc_id)
+
+        for candidate in candidates:
+            other = connection.execute("SELECT signature FROM documents WHERE id = ?", (candidate,)).fetchone()[0]
+            score = similarity(values, np.frombuffer(other, dtype=np.uint32))
+            if score >= self.settings["threshold"]:
+                first, second = sorted((doc_id, candidate))
+                connection.execute("INSERT OR REPLACE INTO pairs VALUES (?, ?, ?)", (first, second, score))
+
+    def clusters(self):
+        """Groups of near-duplicate documents; the longest document (lowest ID on ties) is kept from each."""
+        parent = {}
+
+        def find(node):
+            while parent.setdefault(node, node) != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for first, second in self.connection.execute("SELECT first, second FROM pairs"):
+            parent[find(first)] = find(second)
+        groups = {}
+        for node in parent:
+            groups.setdefault(find(node), []).append(node)
+
+        lengths = dict(self.connection.execute("SELECT id, length FROM documents"))
+        result = []
+        for members in groups.values():
+            members.sort(key=lambda doc_id: (-lengths.get(doc_id, 0), id_order(doc_id)))
+            result.append({"keep": members[0], "duplicates": members[1:]})
+        return sorted(result, key=lambda cluster: id_order(cluster["keep"]))
+
+    def keep_list(self):
+        """IDs of every indexed document that is not a duplicate of a kept one."""
+        dropped = {doc_id for cluster in self.clusters() for doc_id in cluster["duplicates"]}
+        ids = [row[0] for row in self.connection.execute("SELECT id FROM documents")]
+        return sorted((doc_id for doc_id in ids if doc_id not in dropped), key=id_order)
+
+    def close(self):
+        self.connection.close()
+
+
+def id_order(doc_id):
+    return (0, int(doc_id), "") if doc_id.isdigit() else (1, 0, doc_id)
+
+
+def text_sources(directory):
+    return sorted(glob.glob(os.path.join(directory, "*.txt")))
+
+
+def corpus_sources(directory):
+    from utils.corpus import read_index
+
+    return [(directory, entry) for entry in read_index(directory).values()]
+
+
+if __name__ == "__main__":
+    # python -m utils.dedup [--texts extracted_texts | --corpus corpus]
+    import argparse
+    import csv
+    import json
+
+    parser = argparse.ArgumentParser(description="Find near-duplicate documents and write a keep-list of IDs.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--texts", help="directory of {ID}.txt files written by 3_extract_csv_to_txt_files.py")
+    source.add_argument("--corpus", help="corpus directory written by 2_download_and_process_pdf_files.py")
+    parser.add_argument("--metadata", default="scraper/doctorates_metadata.csv")
+    parser.add_argument("--clusters", default="dedup_clusters.jsonl")
+    parser.add_argument("--keep", default="dedup_keep.csv")
+    args = parser.parse_args()
+
+    with open("config.json", "r") as f:
+        settings = {**DEDUP_CONFIG, **json.load(f).get("dedup", {})}
+    index = DedupIndex(settings)
+    if args.texts:
+        sources = text_sources(args.texts)
+    else:
+        sources = corpus_sources(args.corpus or "corpus")
+    print(f"Dedup: {index.add(sources)} new or changed documents indexed")
+
+    clusters = index.clusters()
+    with open(args.clusters, "w", encoding="utf-8") as file:
+        for cluster in clusters:
+            file.write(json.dumps(cluster) + "\n")
+
+    keep = set(index.keep_list())
+    with open(args.metadata, "r", encoding="utf-8", newline="") as metadata, \
+            open(args.keep, "w", encoding="utf-8", newline="") as output:
+        reader = csv.DictReader(metadata)
+        writer = csv.DictWriter(output, fieldnames=reader.fieldnames)
+        writer.writeheader()
+        writer.writerows(row for row in reader if row["ID"] in keep)
+    duplicates = sum(len(cluster["duplicates"]) for cluster in clusters)
+    print(f"Dedup: {len(clusters)} clusters, {duplicates} duplicates dropped, {len(keep)} documents kept "
+          f"({args.keep}, {args.clusters})")
+    index.close()
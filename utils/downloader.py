@@ -0,0 +1,141 @@
+# Resumable download of the thesis PDFs over pooled keep-alive connections.
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.metrics import METRICS
+from utils.pdf_check import sha256_of, sidecar_path
+
+# Defaults for the "download" section of config.json
+DOWNLOAD_CONFIG = {
+    "requests_per_second": 4.0,  # per host
+    "retries": 5,
+    "backoff": 1.0,  # seconds, doubled after every failed attempt
+    "max_backoff": 60.0,
+    "timeout": 60,
+    "chunk_size": 65536
+}
+
+
+class IncompleteDownload(Exception):
+    pass
+
+
+class RateLimiter:
+    """Spaces out requests to the same host so that at most requests_per_second are started."""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Downloader:
+    """Downloads files over a pooled keep-alive session, resuming partial files with HTTP Range requests.
+
+    Data is written to "<destination>.part" and renamed to the destination only once it is complete.
+    The length of the file announced by the server, its ETag if it sent one and the sha256 of the downloaded
+    bytes are stored next to it (see utils.pdf_check).
+
+    workers is the number of threads calling download at the same time (pipeline.download_workers); the pool keeps
+    that many connections per host, so every thread reuses its own.
+    """
+
+    def __init__(self, settings=DOWNLOAD_CONFIG, session=None, workers=8):
+        self.settings = {**DOWNLOAD_CONFIG, **settings}
+        self.rate_limiter = RateLimiter(self.settings["requests_per_second"])
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def download(self, url, destination):
+        """Download url to destination, retrying with exponential backoff. Returns True on success."""
+        part = destination + ".part"
+        server = {}  # ETag of the file on the server, kept across the attempts
+        for attempt in range(self.settings["retries"]):
+            try:
+                length = self.fetch(url, part, server)
+                METRICS.inc("downloads_total")
+                with open(sidecar_path(destination), "w") as file:
+                    json.dump({"url": url, "length": length, **server, "sha256": sha256_of(part)}, file)
+                os.replace(part, destination)
+                return True
+            except (requests.RequestException, IncompleteDownload, OSError) as e:
+                METRICS.inc("download_errors_total")
+                delay = min(self.settings["backoff"] * 2 ** attempt, self.settings["max_backoff"])
+                print(f"url error ({attempt + 1}/{self.settings['retries']}): {e}")
+                if attempt + 1 < self.settings["retries"]:
+                    time.sleep(delay * random.uniform(0.5, 1.0))
+        return False
+
+    def fetch(self, url, part, server=None):
+        """Download the rest of the file into part and return the size of the whole file announced by the server.
+
+        The size is the Content-Range total or the Content-Length, None if the server sent neither. The ETag of
+        the response is stored in server["etag"]; a resumed download sends it back in If-Range, so the server
+        answers with the whole file if it changed in between.
+        """
+        server = {} if server is None else server
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        # identity encoding, so that Content-Length is the number of bytes written to the file
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if server.get("etag"):
+                headers["If-Range"] = server["etag"]
+        self.rate_limiter.wait(url)
+        with self.session.get(url, headers=headers, stream=True, timeout=self.settings["timeout"]) as response:
+            if response.status_code == 416 and offset:
+                # Nothing left to download if the server reports the size we already have
+                if response.headers.get("Content-Range", "").endswith(f"/{offset}"):
+                    return offset
+                os.remove(part)
+                raise IncompleteDownload(f"range not satisfiable for {url}, restarting")
+            response.raise_for_status()
+            server.pop("etag", None)
+            if response.headers.get("ETag"):
+                server["etag"] = response.headers["ETag"]
+            expected = response.headers.get("Content-Length")
+            if response.status_code == 206:
+                # "bytes <first>-<last>/<total>", the total may be "*" when the server does not know it
+                total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                length = int(total) if total.isdigit() else None
+            else:
+                # The server ignored the Range header (or the file changed), start from scratch
+                offset = 0
+                length = int(expected) if expected is not None else None
+
+            written = 0
+            try:
+                with open(part, "ab" if offset else "wb") as file:
+                    for chunk in response.iter_content(self.settings["chunk_size"]):
+                        file.write(chunk)
+                        written += len(chunk)
+            finally:
+                METRICS.inc("download_bytes_total", written)
+            if expected is not None and written != int(expected):
+                raise IncompleteDownload(f"received {written} of {expected} bytes from {url}")
+            if length is not None and offset + written != length:
+                raise IncompleteDownload(f"have {offset + written} of {length} bytes of {url}")
+            return length
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,92 @@
+# In-process Grobid client sending processFulltextDocument requests over a reused HTTP session.
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.metrics import METRICS
+
+# Defaults for the "grobid" section of config.json; grobid_server, timeout, sleep_time and coordinates
+# are read from the top level of config.json, like grobid_client does
+GROBID_CONFIG = {
+    "concurrency": 10,  # requests in flight (unless pipeline.grobid_workers is set), match it to Grobid's pool size
+    "retries": 10,  # attempts for a document answered with 503 (server busy)
+    "tei_coordinates": False,  # send the "coordinates" elements as teiCoordinates
+    "consolidate_header": False,
+    "consolidate_citations": False
+}
+
+
+class GrobidClient:
+    def __init__(self, config):
+        self.server = config["grobid_server"].rstrip("/")
+        self.timeout = config.get("timeout", 60)
+        self.sleep_time = config.get("sleep_time", 5)
+        self.coordinates = config.get("coordinates", [])
+        self.settings = {**GROBID_CONFIG, **config.get("grobid", {})}
+        self.session = requests.Session()
+        # one connection for every thread of the Grobid stage of the pipeline
+        workers = config.get("pipeline", {}).get("grobid_workers") or self.settings["concurrency"]
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def is_alive(self):
+        try:
+            return self.session.get(f"{self.server}/api/isalive", timeout=self.timeout).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def request_data(self):
+        data = {
+            "consolidateHeader": "1" if self.settings["consolidate_header"] else "0",
+            "consolidateCitations": "1" if self.settings["consolidate_citations"] else "0"
+        }
+        if self.settings["tei_coordinates"]:
+            data["teiCoordinates"] = self.coordinates
+        return data
+
+    def process(self, pdf_path, tei_path):
+        """Send one PDF to processFulltextDocument and write the TEI. Returns True on success.
+
+        Request latency, time spent waiting for a busy server (503) and errors are recorded in utils.metrics.
+        """
+        for attempt in range(self.settings["retries"]):
+            start = time.perf_counter()
+            try:
+                with open(pdf_path, "rb") as pdf:
+                    response = self.session.post(
+                        f"{self.server}/api/processFulltextDocument",
+                        files={"input": (os.path.basename(pdf_path), pdf, "application/pdf")},
+                        data=self.request_data(),
+                        timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"grobid error: {e}")
+                METRICS.inc("grobid_errors_total", reason="request")
+                time.sleep(self.sleep_time)
+                continue
+            METRICS.observe("grobid_request_seconds", time.perf_counter() - start, status=response.status_code)
+
+            if response.status_code == 503:
+                # Grobid's pool is full, wait and send the document again
+                METRICS.inc("grobid_busy_wait_seconds_total", time.perf_counter() - start + self.sleep_time)
+                time.sleep(self.sleep_time)
+                continue
+            if response.status_code != 200:
+                print(f"grobid error {response.status_code} for {pdf_path}: {response.text[:200]}")
+                METRICS.inc("grobid_errors_total", reason=str(response.status_code))
+                return False
+
+            # the bytes as Grobid sent them, response.text would guess the encoding when the header has no charset
+            with open(tei_path + ".part", "wb") as file:
+                file.write(response.content)
+            os.replace(tei_path + ".part", tei_path)
+            return True
+
+        print(f"grobid gave up on {pdf_path} after {self.settings['retries']} attempts")
+        METRICS.inc("grobid_errors_total", reason="retries")
+        return False
+
+    def close(self):
+        self.session.close()
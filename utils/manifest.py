@@ -0,0 +1,69 @@
+# Per-document, per-stage record of what was computed from what, used to recompute only stale work.
+import hashlib
+import inspect
+import os
+import sqlite3
+import threading
+import time
+
+
+def file_hash(path):
+    """sha256 of the file, or None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def code_version(*parts):
+    """Short hash of the source code of modules/functions (and of any extra strings) a stage depends on."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part if isinstance(part, str) else inspect.getsource(part)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class Manifest:
+    """SQLite table of (document, stage) -> input hash, code/model version and output hash."""
+
+    def __init__(self, path="manifest.sqlite"):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS stages ("
+            "document TEXT NOT NULL, stage TEXT NOT NULL, input_hash TEXT, version TEXT, output_hash TEXT, "
+            "updated REAL, PRIMARY KEY (document, stage))")
+        self.connection.commit()
+
+    def get(self, document, stage):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT input_hash, version, output_hash FROM stages WHERE document = ? AND stage = ?",
+                (document, stage)).fetchone()
+        if row is None:
+            return None
+        return {"input_hash": row[0], "version": row[1], "output_hash": row[2]}
+
+    def record(self, document, stage, input_hash, version, output_hash):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO stages (document, stage, input_hash, version, output_hash, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (document, stage, input_hash, version, output_hash, time.time()))
+
+    def is_fresh(self, document, stage, input_hash, version, output_hash=None):
+        """True if the stage was computed from this input with this version (and produced this output)."""
+        record = self.get(document, stage)
+        return (record is not None and record["input_hash"] == input_hash and record["version"] == version and
+                (output_hash is None or record["output_hash"] == output_hash))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,200 @@
+# Counters and latency histograms of the pipeline and the scraper, exported as a Prometheus textfile and JSON lines.
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# Defaults for the "metrics" section of config.json
+METRICS_CONFIG = {
+    "enabled": True,
+    "directory": "metrics",  # <worker>.prom for the Prometheus textfile collector, <worker>.jsonl with events
+    "prometheus": True,
+    "jsonl": True,
+    "export_seconds": 30,  # the textfile is rewritten this often and when the run ends
+    "profile_slow_seconds": 0,  # dump a sampled profile of documents slower than this in a stage (0: off)
+    "profile_interval": 0.01  # seconds between two stack samples of the profiled thread
+}
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Metrics:
+    """Thread-safe registry of counters and histograms; nothing is written until configure() enables it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self.settings = {**METRICS_CONFIG, "enabled": False}
+        self.labels = ()
+        self.worker = None
+        self.exporter = None
+        self.stopped = threading.Event()
+
+    def configure(self, settings, worker, export=True):
+        """Enable the export for this process; worker names the output files and labels every series."""
+        self.settings = {**METRICS_CONFIG, **settings}
+        if worker != self.worker:
+            # a forked worker process starts with a copy of the series of its parent, they are not its own
+            with self.lock:
+                self.counters.clear()
+                self.histograms.clear()
+        self.worker = worker
+        self.labels = (("worker", worker),)
+        if not self.settings["enabled"]:
+            return
+        os.makedirs(self.settings["directory"], exist_ok=True)
+        # the exporter thread of the parent does not run in a forked process
+        if export and self.settings["export_seconds"] and (self.exporter is None or not self.exporter.is_alive()):
+            self.exporter = threading.Thread(target=self.export_loop, name="metrics-exporter", daemon=True)
+            self.exporter.start()
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[(name, label_key(labels))] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[len(LATENCY_BUCKETS)] += 1
+            histogram[-1] += value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def event(self, kind, **fields):
+        """Append one JSON line (a finished document, a scraped page...) to <worker>.jsonl."""
+        if not self.settings["enabled"] or not self.settings["jsonl"]:
+            return
+        line = json.dumps({"time": time.time(), "worker": self.worker, "event": kind, **fields}, ensure_ascii=False)
+        with self.lock, open(self.path("jsonl"), "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+
+    def path(self, extension):
+        return os.path.join(self.settings["directory"], f"{self.worker}.{extension}")
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, list(values)) for key, values in self.histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{format_labels(self.labels + labels)} {value:g}")
+        for (name, labels), values in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, count in zip(LATENCY_BUCKETS, values):
+                lines.append(f"{name}_bucket{format_labels(self.labels + labels + (('le', f'{bound:g}'),))} {count}")
+            lines.append(f"{name}_bucket{format_labels(self.labels + labels + (('le', '+Inf'),))} "
+                         f"{values[len(LATENCY_BUCKETS)]}")
+            lines.append(f"{name}_sum{format_labels(self.labels + labels)} {values[-1]:g}")
+            lines.append(f"{name}_count{format_labels(self.labels + labels)} {values[len(LATENCY_BUCKETS)]}")
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """Rewrite <worker>.prom (atomically, the collector may read it at any time)."""
+        if not self.settings["enabled"] or not self.settings["prometheus"]:
+            return
+        path = self.path("prom")
+        with open(path + ".part", "w", encoding="utf-8") as file:
+            file.write(self.prometheus_text())
+        os.replace(path + ".part", path)
+
+    def export_loop(self):
+        while not self.stopped.wait(self.settings["export_seconds"]):
+            self.export()
+
+    def close(self):
+        self.stopped.set()
+        if self.exporter is not None:
+            self.exporter.join()
+            self.exporter = None
+        self.export()
+
+
+# Registry of this process
+METRICS = Metrics()
+
+
+class SlowProfiler:
+    """Samples the stack of the thread that entered it; if the block was slower than profile_slow_seconds,
+    the samples are written as collapsed stacks (one "frame;frame;frame count" line each, for flame graphs)."""
+
+    def __init__(self, stage, document):
+        self.stage = stage
+        self.document = document
+        self.threshold = METRICS.settings["profile_slow_seconds"]
+        self.samples = Counter()
+        self.stop = threading.Event()
+        self.sampler = None
+
+    def sample(self, thread_id):
+        interval = METRICS.settings["profile_interval"]
+        while not self.stop.wait(interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        if self.threshold and METRICS.settings["enabled"]:
+            self.sampler = threading.Thread(target=self.sample, args=(threading.get_ident(),), daemon=True)
+            self.sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.sampler is None:
+            return False
+        self.stop.set()
+        self.sampler.join()
+        elapsed = time.perf_counter() - self.start
+        if elapsed >= self.threshold and self.samples:
+            directory = os.path.join(METRICS.settings["directory"], "profiles")
+            os.makedirs(directory, exist_ok=True)
+            name = "".join(char if char.isalnum() or char in "-_" else "_" for char in str(self.document))[:100]
+            path = os.path.join(directory, f"{self.stage}-{name}-{int(time.time())}.folded")
+            with open(path, "w", encoding="utf-8") as file:
+                file.writelines(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+            METRICS.inc("slow_documents_total", stage=self.stage)
+            METRICS.event("slow_document", stage=self.stage, document=str(self.document), seconds=elapsed,
+                          profile=path)
+        return False
+
+
+def profile_slow(stage, document):
+    """Context manager dumping a sampled profile of the block when it takes longer than profile_slow_seconds."""
+    return SlowProfiler(stage, document)
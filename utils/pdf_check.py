@@ -0,0 +1,147 @@
+# Fast structural validation of downloaded PDFs, with a full parse only when the structure is inconclusive.
+import hashlib
+import json
+import mmap
+import os
+import re
+import sqlite3
+import threading
+
+
+def sidecar_path(pdf_path):
+    """File written by utils.downloader next to a finished download: the length and ETag sent by the server and the
+    sha256 of the downloaded bytes."""
+    return pdf_path + ".meta.json"
+
+
+def read_sidecar(pdf_path):
+    try:
+        with open(sidecar_path(pdf_path), "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def structural_check(path, expected_length=None):
+    """True/False when the header and trailer decide, None when a full parse is needed.
+
+    Checks the %PDF- header, that the file ends with startxref/%%EOF and that startxref points at an xref
+    table or an object (xref stream). Only the first and last kilobytes and the xref position are read.
+    """
+    size = os.path.getsize(path)
+    if size == 0 or (expected_length is not None and size != expected_length):
+        return False
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data.find(b"%PDF-", 0, 1024) < 0:
+            return False
+        tail = max(0, size - 2048)
+        eof = data.rfind(b"%%EOF", tail)
+        startxref = data.rfind(b"startxref", tail)
+        if eof < 0 or startxref < 0 or startxref > eof:
+            # truncated, or garbage after the trailer
+            return None
+        match = re.match(rb"startxref\s+(\d+)", data[startxref:eof])
+        if not match or int(match.group(1)) >= size:
+            return None
+        offset = int(match.group(1))
+        window = data[offset:offset + 64]
+        if window.lstrip().startswith(b"xref") or re.match(rb"\s*\d+\s+\d+\s+obj", window):
+            return True
+        return None
+
+
+def full_parse(path):
+    from PyPDF2 import PdfReader
+
+    try:
+        with open(path, 'rb') as f:
+            reader = PdfReader(f)
+            _ = reader.pages[0]
+        return True
+    except Exception:
+        return False
+
+
+class PdfValidator:
+    """Validates PDFs and caches the verdict per file hash (and per path/size/mtime, to skip hashing)."""
+
+    def __init__(self, cache_path="cache/pdf_checks.sqlite"):
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(cache_path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, "
+                                "mtime_ns INTEGER, sha256 TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS checks (sha256 TEXT PRIMARY KEY, valid INTEGER)")
+        self.connection.commit()
+
+    def cached(self, sql, parameters):
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchone()
+
+    def store(self, path, stat, digest, valid):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                    (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, digest))
+            self.connection.execute("INSERT OR REPLACE INTO checks VALUES (?, ?)", (digest, int(valid)))
+
+    def is_valid(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+
+        sidecar = read_sidecar(path)
+        if sidecar.get("length") not in (None, stat.st_size):
+            # not the whole file the server announced
+            return False
+        row = self.cached("SELECT sha256, checks.valid FROM files JOIN checks USING (sha256) "
+                          "WHERE path = ? AND size = ? AND mtime_ns = ?",
+                          (os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+        digest = row[0] if row is not None else sha256_of(path)
+        if sidecar.get("sha256") not in (None, digest):
+            # not the bytes that were downloaded, the file was cut or overwritten since
+            return False
+        if row is not None:
+            return bool(row[1])
+
+        row = self.cached("SELECT valid FROM checks WHERE sha256 = ?", (digest,))
+        if row is not None:
+            valid = bool(row[0])
+        else:
+            valid = structural_check(path)
+            if valid is None:
+                valid = full_parse(path)
+        self.store(path, stat, digest, valid)
+        return valid
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    # python -m utils.pdf_check <directory>
+    import sys
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    start = time.perf_counter()
+    validator = PdfValidator()
+    paths = [os.path.join(root, name) for root, _, files in os.walk(sys.argv[1]) for name in files
+             if name.endswith(".pdf")]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(validator.is_valid, paths))
+    for path, valid in zip(paths, results):
+        if not valid:
+            print(f"{path} is not valid")
+    print(f"Validated {len(paths)} PDFs in {time.perf_counter() - start:.2f}s, {results.count(False)} not valid")
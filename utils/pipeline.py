@@ -0,0 +1,111 @@
+# Staged pipeline: every stage has its own workers and a bounded queue in front of it.
+import queue
+import threading
+import time
+from collections import Counter
+
+from utils.metrics import METRICS, profile_slow
+
+STOP = object()
+
+
+class Stage:
+    """One step of the pipeline. function(item) returns the item for the next stage, or None to drop it.
+
+    With profile, items slower than metrics.profile_slow_seconds in this stage get a sampled profile.
+    """
+
+    def __init__(self, name, function, workers=1, queue_size=16, profile=True):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.profile = profile
+
+
+def describe(item):
+    return item.get("title", "") if isinstance(item, dict) else item
+
+
+def run_pipeline(items, stages, on_drop=None):
+    """Push items through the stages and return the items that left the last one (in completion order).
+
+    Items flow to the next stage as soon as they are ready. A full queue blocks the stage in front of it,
+    so the number of items in flight (and memory) is bounded by the queue sizes and worker counts.
+    on_drop(item) is called for items a stage dropped (returned None or raised).
+    The time items wait in front of a stage and spend in it are recorded in utils.metrics; dict items also
+    get the seconds spent in every stage in item["timings"].
+    """
+    queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages] + [queue.Queue()]
+    busy = Counter()  # seconds spent in each stage
+    processed = Counter()
+    lock = threading.Lock()
+
+    def work(index):
+        stage = stages[index]
+        while True:
+            entry = queues[index].get()
+            if entry is STOP:
+                return
+            item, queued = entry
+            start = time.perf_counter()
+            METRICS.observe("pipeline_queue_wait_seconds", start - queued, stage=stage.name)
+            try:
+                if stage.profile:
+                    with profile_slow(stage.name, describe(item)):
+                        result = stage.function(item)
+                else:
+                    result = stage.function(item)
+            except Exception as e:
+                print(f"{stage.name} error: {e}")
+                METRICS.inc("pipeline_errors_total", stage=stage.name)
+                result = None
+            elapsed = time.perf_counter() - start
+            METRICS.observe("pipeline_stage_seconds", elapsed, stage=stage.name)
+            with lock:
+                busy[stage.name] += elapsed
+                processed[stage.name] += 1
+            if result is not None:
+                if isinstance(result, dict):
+                    result.setdefault("timings", {})[stage.name] = elapsed
+                queues[index + 1].put((result, time.perf_counter()))
+            else:
+                METRICS.inc("pipeline_dropped_total", stage=stage.name)
+                if on_drop is not None:
+                    on_drop(item)
+
+    def close(index, threads):
+        # once every worker of a stage has finished, stop the workers of the next stage
+        for thread in threads:
+            thread.join()
+        next_workers = stages[index + 1].workers if index + 1 < len(stages) else 1
+        for _ in range(next_workers):
+            queues[index + 1].put(STOP)
+
+    closers = []
+    for index, stage in enumerate(stages):
+        threads = [threading.Thread(target=work, args=(index,), name=f"{stage.name}-{n}", daemon=True)
+                   for n in range(stage.workers)]
+        for thread in threads:
+            thread.start()
+        closer = threading.Thread(target=close, args=(index, threads), daemon=True)
+        closer.start()
+        closers.append(closer)
+
+    start = time.perf_counter()
+    for item in items:
+        queues[0].put((item, time.perf_counter()))
+    for _ in range(stages[0].workers):
+        queues[0].put(STOP)
+    for closer in closers:
+        closer.join()
+    elapsed = time.perf_counter() - start
+
+    results = []
+    while (entry := queues[-1].get()) is not STOP:
+        results.append(entry[0])
+
+    report = ", ".join(f"{stage.name} {processed[stage.name]} items {busy[stage.name]:.1f}s/{stage.workers} workers"
+                       for stage in stages)
+    print(f"Pipeline finished in {elapsed:.1f}s: {report}")
+    return results
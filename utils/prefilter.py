@@ -0,0 +1,109 @@
+# Cheap character statistics that decide obvious sentences before they reach the spaCy pipeline.
+import re
+from collections import Counter
+
+POLISH_DIACRITICS = set("ąćęłńóśźżĄĆĘŁŃÓŚŹŻ")
+
+# Defaults for the "prefilter" section of config.json
+PREFILTER_CONFIG = {
+    "enabled": True,
+    "min_letters": 3,  # fewer letters than this -> drop (langdetect cannot tell the language anyway)
+    "max_digit_ratio": 0.5,  # more digits than this among non-space characters -> drop (MNumbers)
+    "max_dot_leaders": 1,  # more runs of 4+ dots than this -> drop (TOC)
+    "accept_min_length": 40,  # shorter sentences always go to the model
+    "accept_min_diacritic_ratio": 0.03,  # share of Polish diacritics among letters needed to keep without the model
+    "accept_max_digit_ratio": 0.1,
+    "accept_max_upper_ratio": 0.3  # headings written in capitals go to the model
+}
+
+# Components needed by text_filter.is_kept, everything else is disabled for the ambiguous sentences
+VERDICT_PIPES = ["language_detector", "textcat_2"]
+
+
+def text_stats(text):
+    chars = [c for c in text if not c.isspace()]
+    letters = [c for c in chars if c.isalpha()]
+    return {
+        "length": len(text),
+        "letters": len(letters),
+        "digit_ratio": sum(c.isdigit() for c in chars) / len(chars) if chars else 0.0,
+        "diacritic_ratio": sum(c in POLISH_DIACRITICS for c in letters) / len(letters) if letters else 0.0,
+        "upper_ratio": sum(c.isupper() for c in letters) / len(letters) if letters else 0.0,
+        "dot_leaders": len(re.findall(r'\.{4,}|…{2,}', text)),
+        # chapter numbers such as "5.2." or "4.2.4" are typical for table of contents lines
+        "section_numbers": len(re.findall(r'(?<![\d,])\d+(\.\d+)+\.?(?!\d)|^\d+\.?\s', text))
+    }
+
+
+def quick_verdict(text, settings=PREFILTER_CONFIG):
+    """True/False for obvious sentences, None when the model has to decide."""
+    stats = text_stats(text)
+    if stats["letters"] < settings["min_letters"]:
+        return False
+    if stats["digit_ratio"] > settings["max_digit_ratio"] or stats["dot_leaders"] > settings["max_dot_leaders"]:
+        return False
+    if (stats["length"] >= settings["accept_min_length"] and
+            stats["diacritic_ratio"] >= settings["accept_min_diacritic_ratio"] and
+            stats["digit_ratio"] <= settings["accept_max_digit_ratio"] and
+            stats["upper_ratio"] <= settings["accept_max_upper_ratio"] and
+            stats["dot_leaders"] == 0 and stats["section_numbers"] == 0):
+        return True
+    return None
+
+
+def verdict_pipes(nlp):
+    """Context manager running only the components the verdict needs."""
+    return nlp.select_pipes(enable=[name for name in VERDICT_PIPES if name in nlp.pipe_names])
+
+
+def format_report(stats):
+    paragraphs = {key: count for key, count in stats.items() if key.startswith("paragraph_")}
+    sentences = {key: count for key, count in stats.items() if key not in paragraphs}
+    total = sum(sentences.values())
+    if not total:
+        report = "No sentences classified"
+    else:
+        parts = [f"{tier}: {count} ({count / total:.1%})" for tier, count in sorted(sentences.items())]
+        report = f"Sentences classified: {total}; " + ", ".join(parts)
+    if paragraphs.get("paragraph_model"):
+        report += (f"; paragraphs classified: {paragraphs['paragraph_model']} (kept {paragraphs['paragraph_keep']}, "
+                   f"dropped {paragraphs['paragraph_drop']}, split {paragraphs['paragraph_split']})")
+    return report
+
+
+def compare(nlp, texts, settings=PREFILTER_CONFIG):
+    """Compare the cascade against the full pipeline on the given texts."""
+    from utils.text_filter import classify
+
+    stats = Counter()
+    cascade = classify(nlp, texts, prefilter=settings, stats=stats)
+    full = classify(nlp, texts)
+    mismatches = [(text, old, new) for text, old, new in zip(texts, full, cascade) if old != new]
+    print(format_report(stats))
+    print(f"Agreement with the full pipeline: {1 - len(mismatches) / len(texts):.2%}")
+    for text, old, new in mismatches:
+        print(f"  full={old} cascade={new}: {text[:120]}")
+    return mismatches
+
+
+if __name__ == "__main__":
+    # python -m utils.prefilter [model path] [text files...]
+    # The default model is the one built from the current dataset by utils.Labeling_text.build_model.
+    # Without text files the labelled sentences from utils/dataset/*.json are used.
+    import glob
+    import json
+    import sys
+
+    import utils.text_filter
+    from utils.Labeling_text import MODEL_CONFIG, build_model
+
+    nlp = utils.text_filter.load_pipeline(sys.argv[1] if len(sys.argv) > 1 else build_model(MODEL_CONFIG))
+    texts = []
+    for text_file in sys.argv[2:]:
+        with open(text_file, "r", encoding="utf-8") as file:
+            texts.extend(utils.text_filter.split_sentences(file.read().splitlines()))
+    if not texts:
+        for jfile in glob.glob("utils/dataset/*.json"):
+            with open(jfile, "r", encoding="utf-8") as file:
+                texts.extend(cell["text"] for cell in json.load(file))
+    compare(nlp, texts)
@@ -0,0 +1,175 @@
+# Resident worker: 2_download_and_process_pdf_files.py --serve keeps the pipeline loaded and cleans documents sent
+# over a local socket, so single documents and short batches do not pay for the imports and the model load.
+import json
+import os
+import signal
+import socket
+import socketserver
+import time
+
+# Defaults for the "service" section of config.json
+SERVICE_CONFIG = {
+    "socket": "cache/service.sock",  # Unix socket the worker listens on (a file with its TCP port without AF_UNIX)
+    "timeout": 900  # seconds the client waits for the answer (a PDF may have to go through Grobid)
+}
+
+
+# Windows has no Unix sockets: the worker listens on a localhost TCP port there and writes it to the socket file
+UNIX_SOCKETS = hasattr(socket, "AF_UNIX")
+
+
+def connect(path, timeout=None):
+    """Connected socket to the worker listening on path."""
+    if UNIX_SOCKETS:
+        family, address = socket.AF_UNIX, path
+    else:
+        with open(path, "r") as file:
+            family, address = socket.AF_INET, ("127.0.0.1", int(file.read()))
+    connection = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        connection.settimeout(timeout)
+        connection.connect(address)
+    except OSError:
+        connection.close()
+        raise
+    return connection
+
+
+def send(message, settings=SERVICE_CONFIG):
+    """Send one request (a JSON object) to the worker and return its answer."""
+    with connect(settings["socket"], settings["timeout"]) as connection:
+        connection.sendall(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+        with connection.makefile("rb") as answers:
+            line = answers.readline()
+    if not line:
+        raise ConnectionError(f"the worker at {settings['socket']} closed the connection")
+    return json.loads(line)
+
+
+def is_running(path):
+    try:
+        with connect(path):
+            return True
+    except (OSError, ValueError):
+        return False
+
+
+if UNIX_SOCKETS:
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+else:
+    class Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+        daemon_threads = True
+
+
+def interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(handle, settings=SERVICE_CONFIG):
+    """Answer requests with handle(request) -> answer until interrupted (Ctrl+C or SIGTERM).
+
+    Requests and answers are JSON objects, one per line; a connection may send several requests. Every connection
+    has its own thread, so a PDF waiting for Grobid does not hold up the others.
+    """
+    path = settings["socket"]
+    if is_running(path):
+        raise RuntimeError(f"a worker is already listening on {path}")
+    if os.path.exists(path):
+        # left behind by a worker that was killed
+        os.remove(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    started = time.time()
+    served = 0
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            nonlocal served
+            for line in self.rfile:
+                try:
+                    request = json.loads(line)
+                    if request.get("ping"):
+                        answer = {"pid": os.getpid(), "uptime": time.time() - started, "served": served}
+                    else:
+                        answer = handle(request)
+                        served += 1
+                except Exception as e:
+                    answer = {"error": f"{type(e).__name__}: {e}"}
+                self.wfile.write(json.dumps(answer, ensure_ascii=False).encode("utf-8") + b"\n")
+                self.wfile.flush()
+
+    signal.signal(signal.SIGTERM, interrupt)
+    with Server(path if UNIX_SOCKETS else ("127.0.0.1", 0), Handler) as server:
+        if not UNIX_SOCKETS:
+            with open(path, "w") as file:
+                file.write(str(server.server_address[1]))
+        print(f"Listening on {path}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(path)
+    print(f"Worker stopped after {served} documents")
+
+
+def request_for(path):
+    """Request of a file: PDFs are extracted (text layer or Grobid), TEI files parsed, anything else is raw text."""
+    path = os.path.abspath(path)
+    if path.lower().endswith(".pdf"):
+        return {"pdf": path}
+    if ".xml" in os.path.basename(path):
+        return {"tei": path}
+    with open(path, "r", encoding="utf-8") as file:
+        return {"text": file.read(), "name": os.path.basename(path)}
+
+
+if __name__ == "__main__":
+    # python -m utils.service <PDF, TEI or text files | -> [--output folder] | --ping
+    # Start the worker first: python 2_download_and_process_pdf_files.py --serve
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Clean documents with the resident worker.")
+    parser.add_argument("paths", nargs="*", help="PDF, TEI (*.tei.xml, *.tei.xml.gz) or text files, - reads stdin")
+    parser.add_argument("--output", help="write <name>.txt files to this folder instead of printing the text")
+    parser.add_argument("--ping", action="store_true", help="only check that the worker is up")
+    parser.add_argument("--socket", help="socket of the worker, by default service.socket of config.json")
+    args = parser.parse_args()
+
+    settings = dict(SERVICE_CONFIG)
+    if os.path.exists("config.json"):
+        with open("config.json", "r") as f:
+            settings.update(json.load(f).get("service", {}))
+    if args.socket:
+        settings["socket"] = args.socket
+    if not is_running(settings["socket"]):
+        sys.exit(f"No worker at {settings['socket']}, start one with: python 2_download_and_process_pdf_files.py "
+                 "--serve")
+
+    if args.ping:
+        start = time.perf_counter()
+        answer = send({"ping": True}, settings)
+        print(f"Worker {answer['pid']} up for {answer['uptime']:.0f}s, {answer['served']} documents served, "
+              f"answered in {(time.perf_counter() - start) * 1000:.1f} ms")
+        sys.exit(0)
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    failed = 0
+    for path in args.paths:
+        start = time.perf_counter()
+        message = {"text": sys.stdin.read(), "name": "stdin"} if path == "-" else request_for(path)
+        answer = send(message, settings)
+        if "error" in answer:
+            print(f"{path}: {answer['error']}", file=sys.stderr)
+            failed += 1
+            continue
+        print(f"{path}: {answer['route']}, {answer['sentences']} sentences, {len(answer['text'])} characters in "
+              f"{time.perf_counter() - start:.2f}s", file=sys.stderr)
+        if args.output:
+            name = os.path.basename(path).split(".")[0] if path != "-" else "stdin"
+            with open(os.path.join(args.output, f"{name}.txt"), "w", encoding="utf-8") as file:
+                file.write(answer["text"])
+        else:
+            print(answer["text"])
+    sys.exit(1 if failed else 0)
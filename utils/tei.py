@@ -0,0 +1,133 @@
+# Extraction of paragraph text from the TEI XML files produced by Grobid.
+import re
+import xml.etree.ElementTree as ET
+
+# Subtrees whose text is never part of a paragraph
+DROPPED_TAGS = {"ref", "table", "figure"}
+
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def element_text(elem):
+    """Text of the element without the text of dropped subtrees (their tails are kept)."""
+    parts = [elem.text or ""]
+    for child in elem:
+        if local_name(child.tag) not in DROPPED_TAGS:
+            parts.append(element_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def iter_paragraphs(file):
+    """Yield the clean text of every <p> of a TEI file, walking it once with iterparse.
+
+    Paragraphs inside tables and figures are skipped, and so is the rest of a <div> from a paragraph starting
+    with "Tabela" (a table caption Grobid did not recognise as a table). Finished elements are removed from
+    the tree, so memory use does not grow with the size of the file.
+    """
+    stack = []
+    dropped_depth = 0  # number of open dropped elements
+    paragraph_depth = 0  # number of open <p> elements
+    skipped_divs = set()  # ids of divs whose remaining paragraphs are table content
+    for event, elem in ET.iterparse(file, events=("start", "end")):
+        name = local_name(elem.tag)
+        if event == "start":
+            stack.append(elem)
+            if name in DROPPED_TAGS:
+                dropped_depth += 1
+            elif name == "p":
+                paragraph_depth += 1
+            continue
+
+        stack.pop()
+        if name in DROPPED_TAGS:
+            dropped_depth -= 1
+        elif name == "p":
+            paragraph_depth -= 1
+        if paragraph_depth:
+            # kept until the enclosing <p> ends
+            continue
+
+        if name == "p" and not dropped_depth:
+            div = next((parent for parent in reversed(stack) if local_name(parent.tag) == "div"), None)
+            if id(div) not in skipped_divs:
+                text = element_text(elem).strip()
+                if text.startswith("Tabela") and div is not None:
+                    skipped_divs.add(id(div))
+                else:
+                    yield text
+        elif name == "div":
+            skipped_divs.discard(id(elem))
+
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+
+def regex_paragraphs(file_path):
+    """Paragraphs extracted with the regular expressions used before iter_paragraphs, kept for comparison."""
+    from utils.artifacts import open_artifact
+
+    with open_artifact(file_path, "rt") as file:
+        content = file.read()
+
+    # remove all citations and references in <ref> tags (and whitespaces in front of them)
+    content = re.sub(r'<ref[^>]*/>', '', content, flags=re.S)
+    content = re.sub(r'<ref[^>]*>.*?</ref>', '', content, flags=re.S)
+    content = re.sub(r'<p[^>]*>Tabela.*?/div>', '</div>>', content, flags=re.S)
+
+    # Step 1: Extract only the <p> content
+    p_matches = re.findall(r'<p>(.*?)</p>', content, re.S)
+
+    # Step 2: Remove any remaining XML tags inside the paragraphs
+    return [re.sub(r'<[^>]+>', '', p).strip() for p in p_matches]
+
+
+def compare(folder, max_diff_lines=20):
+    """Diff the paragraphs of iter_paragraphs against regex_paragraphs for every TEI file in the folder.
+
+    Compressed files of the artifact store (*.tei.xml.gz) are read as well.
+    """
+    import difflib
+    import glob
+    import os
+    import time
+
+    from utils.artifacts import open_artifact
+
+    files = sorted(glob.glob(os.path.join(folder, "**", "*.tei.xml*"), recursive=True))
+    old_time = new_time = 0.0
+    different = 0
+    for file_path in files:
+        start = time.perf_counter()
+        old = regex_paragraphs(file_path)
+        old_time += time.perf_counter() - start
+        start = time.perf_counter()
+        with open_artifact(file_path) as file:
+            new = list(iter_paragraphs(file))
+        new_time += time.perf_counter() - start
+
+        if old == new:
+            continue
+        different += 1
+        print(f"{file_path}: regex {len(old)} paragraphs, streaming {len(new)} paragraphs")
+        diff = list(difflib.unified_diff(old, new, "regex", "streaming", lineterm="", n=0))
+        for line in diff[:max_diff_lines]:
+            print(f"  {line[:160]}")
+        if len(diff) > max_diff_lines:
+            print(f"  ... {len(diff) - max_diff_lines} more lines")
+
+    print(f"Compared {len(files)} files, {different} differ; regex {old_time:.2f}s, streaming {new_time:.2f}s")
+    return different
+
+
+if __name__ == "__main__":
+    # python -m utils.tei compare <folder with *.tei.xml or *.tei.xml.gz files, e.g. artifacts>
+    import sys
+
+    if len(sys.argv) != 3 or sys.argv[1] != "compare":
+        print("Usage: python -m utils.tei compare <folder>")
+        sys.exit(1)
+    compare(sys.argv[2])
@@ -0,0 +1,275 @@
+# Sentence classification used to clean the text extracted from the theses.
+import re
+
+from langdetect import DetectorFactory, detect_langs
+from langdetect.lang_detect_exception import LangDetectException
+
+from utils.prefilter import quick_verdict, verdict_pipes
+
+# langdetect is randomised by default, fix the seed so that the same sentence always gets the same verdict
+DetectorFactory.seed = 0
+
+# Defaults for the "hierarchy" section of config.json
+HIERARCHY_CONFIG = {
+    "enabled": False,  # classify whole paragraphs first, and only the sentences of the unclear ones
+    "min_sentences": 2,  # shorter paragraphs go straight to the sentence pass
+    "keep_threshold": 0.9,  # a clearly Polish paragraph is kept whole when its "Other" score is at least this
+    "drop_threshold": 0.1,  # a paragraph is dropped whole when its "Other" score is at most this (TOC, numbers)
+    "language_confidence": 0.99  # langdetect probability needed to call a paragraph clearly Polish or foreign
+}
+
+# Sentence ends: punctuation followed by a space and something that can start a sentence
+SENTENCE_END = re.compile(r'(?<=[.!?…])\s+(?=[„"(\[A-ZĄĆĘŁŃÓŚŹŻ])')
+# Pieces that do not end a sentence: abbreviations ("np.", "tab."), initials ("J.") and list numbers ("2.")
+ABBREVIATIONS = ["al", "art", "cyt", "dot", "dr", "godz", "hab", "im", "inż", "itd", "itp", "lek", "mgr", "m.in", "nr",
+                 "np", "ok", "pkt", "por", "poz", "prof", "rozdz", "ryc", "rys", "str", "tab", "tj", "tzn", "tzw", "ul",
+                 "ust", "wg", "zob"]
+NOT_SENTENCE_END = re.compile(r'(^|\s)(' + "|".join(re.escape(a) for a in ABBREVIATIONS) + r')\.$|'
+                              r'(^|\s)[A-ZĄĆĘŁŃÓŚŹŻ]\.$|^\d+(\.\d+)*\.$', re.IGNORECASE)
+
+
+class EagerLanguageDetector:
+    """Language detector that stores the result in doc.user_data, so it survives nlp.pipe(n_process > 1).
+
+    Unlike spacy_langdetect it does not need sentence boundaries, so it also works in the slimmed pipeline.
+    """
+
+    def __call__(self, doc):
+        doc.user_data["language"] = detect_language(doc.text)
+        return doc
+
+
+def create_language_detector(nlp, name):
+    return EagerLanguageDetector()
+
+
+def register_language_detector():
+    """Register the language_detector factory; spaCy is imported here, so importing this module (and the scripts
+    importing it) stays cheap until a pipeline is needed."""
+    from spacy.language import Language
+
+    if not Language.has_factory("language_detector"):
+        Language.factory("language_detector", func=create_language_detector)
+
+
+def load_pipeline(path):
+    """spacy.load the trained pipeline (its last pipe is the language_detector)."""
+    import spacy
+
+    register_language_detector()
+    return spacy.load(path)
+
+
+def detect_language(text):
+    try:
+        return str(detect_langs(text)[0].lang)
+    except LangDetectException:
+        return "UNKNOWN"
+
+
+def is_kept(doc):
+    """Verdict for a single processed sentence: Polish text that is not a TOC or a list of numbers."""
+    language = doc.user_data.get("language") or detect_language(doc.text)
+    return language == "pl" and doc.cats["Other"] > 0.40
+
+
+def split_sentences(paragraphs):
+    return (" ".join(paragraphs)).split(". ")
+
+
+def paragraph_sentences(paragraph):
+    """Sentences of one paragraph, keeping their punctuation; abbreviations and numbers do not end a sentence."""
+    sentences = []
+    for piece in SENTENCE_END.split(paragraph.strip()):
+        if sentences and NOT_SENTENCE_END.search(sentences[-1]):
+            sentences[-1] += " " + piece
+        elif piece:
+            sentences.append(piece)
+    return sentences
+
+
+def join_sentences(sentences, verdicts):
+    return "".join([f"{s}. " for s, keep in zip(sentences, verdicts) if keep])
+
+
+def classify(nlp, texts, batch_size=256, n_process=1, prefilter=None, stats=None, cache=None):
+    """Run all texts through nlp.pipe and return one keep/drop verdict per text.
+
+    With prefilter settings (see utils.prefilter) obvious texts are decided without the model and the rest
+    goes through the slimmed pipeline. stats (a Counter) receives the number of texts decided by each tier.
+    With a VerdictCache (see utils.verdict_cache) texts seen before are not classified again.
+    """
+    if cache is None:
+        return classify_uncached(nlp, texts, batch_size, n_process, prefilter, stats)
+
+    cached = cache.get_many(texts)
+    missing = [i for i in range(len(texts)) if i not in cached]
+    if stats is not None:
+        stats["cache"] += len(cached)
+    # Repeated sentences inside the batch are classified once
+    unique = list(dict.fromkeys(texts[i] for i in missing))
+    new_verdicts = dict(zip(unique, classify_uncached(nlp, unique, batch_size, n_process, prefilter, stats)))
+    cache.put_many(unique, [new_verdicts[text] for text in unique])
+    return [cached[i] if i in cached else new_verdicts[texts[i]] for i in range(len(texts))]
+
+
+def classify_uncached(nlp, texts, batch_size=256, n_process=1, prefilter=None, stats=None):
+    if not prefilter or not prefilter.get("enabled", True):
+        verdicts = [is_kept(doc) for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process)]
+        if stats is not None:
+            stats["model"] += len(verdicts)
+        return verdicts
+
+    verdicts = [quick_verdict(text, prefilter) for text in texts]
+    ambiguous = [i for i, verdict in enumerate(verdicts) if verdict is None]
+    if stats is not None:
+        stats["prefilter_keep"] += verdicts.count(True)
+        stats["prefilter_drop"] += verdicts.count(False)
+        stats["model"] += len(ambiguous)
+
+    with verdict_pipes(nlp):
+        docs = nlp.pipe([texts[i] for i in ambiguous], batch_size=batch_size, n_process=n_process)
+        for i, doc in zip(ambiguous, docs):
+            verdicts[i] = is_kept(doc)
+    return verdicts
+
+
+def polish_probability(text):
+    try:
+        return next((language.prob for language in detect_langs(text) if language.lang == "pl"), 0.0)
+    except LangDetectException:
+        return 0.0
+
+
+def paragraph_verdicts(nlp, paragraphs, settings, batch_size=256, n_process=1, stats=None):
+    """True to keep a paragraph whole, False to drop it whole, None to classify its sentences."""
+    verdicts = [None] * len(paragraphs)
+    scored = [i for i, paragraph in enumerate(paragraphs)
+              if len(paragraph_sentences(paragraph)) >= settings["min_sentences"]]
+    # the language is detected here with its probability, so the pipeline only needs the text classifier
+    with nlp.select_pipes(enable=[name for name in ["textcat_2"] if name in nlp.pipe_names]):
+        docs = nlp.pipe([paragraphs[i] for i in scored], batch_size=batch_size, n_process=n_process)
+        for i, doc in zip(scored, docs):
+            other = doc.cats["Other"]
+            if other <= settings["drop_threshold"]:
+                verdicts[i] = False
+                continue
+            polish = polish_probability(paragraphs[i])
+            if polish <= 1 - settings["language_confidence"]:
+                verdicts[i] = False
+            elif polish >= settings["language_confidence"] and other >= settings["keep_threshold"]:
+                verdicts[i] = True
+    if stats is not None:
+        stats["paragraph_model"] += len(scored)
+        stats["paragraph_keep"] += verdicts.count(True)
+        stats["paragraph_drop"] += verdicts.count(False)
+        stats["paragraph_split"] += verdicts.count(None)
+    return verdicts
+
+
+def filter_documents_hierarchical(nlp, documents, batch_size=256, n_process=1, prefilter=None, stats=None,
+                                  cache=None, hierarchy=HIERARCHY_CONFIG):
+    """Filter many documents paragraph first; only paragraphs that are neither clearly kept nor clearly dropped
+    are split into sentences, which are classified like in filter_documents."""
+    documents = [list(paragraphs) for paragraphs in documents]
+    flat = [paragraph for paragraphs in documents for paragraph in paragraphs]
+    verdicts = paragraph_verdicts(nlp, flat, hierarchy, batch_size, n_process, stats)
+
+    split = {i: paragraph_sentences(flat[i]) for i, verdict in enumerate(verdicts) if verdict is None}
+    sentences = [sentence for paragraph in split.values() for sentence in paragraph]
+    sentence_verdicts = iter(classify(nlp, sentences, batch_size=batch_size, n_process=n_process,
+                                      prefilter=prefilter, stats=stats, cache=cache))
+
+    kept = []
+    for i, paragraph in enumerate(flat):
+        if verdicts[i] is None:
+            kept.append(" ".join(s for s in split[i] if next(sentence_verdicts)))
+        else:
+            kept.append(paragraph if verdicts[i] else "")
+
+    filtered = []
+    start = 0
+    for paragraphs in documents:
+        end = start + len(paragraphs)
+        filtered.append(" ".join(text for text in kept[start:end] if text))
+        start = end
+    return filtered
+
+
+def filter_documents(nlp, documents, batch_size=256, n_process=1, prefilter=None, stats=None, cache=None,
+                     hierarchy=None):
+    """Filter the sentences of many documents (lists of paragraphs) with a single nlp.pipe call.
+
+    With hierarchy settings whose "enabled" is set, filter_documents_hierarchical is used instead.
+    """
+    if hierarchy and hierarchy.get("enabled"):
+        return filter_documents_hierarchical(nlp, documents, batch_size, n_process, prefilter, stats, cache,
+                                             hierarchy)
+    sentences = [split_sentences(paragraphs) for paragraphs in documents]
+    flat = [s for doc_sentences in sentences for s in doc_sentences]
+    verdicts = classify(nlp, flat, batch_size=batch_size, n_process=n_process, prefilter=prefilter, stats=stats,
+                        cache=cache)
+
+    filtered = []
+    start = 0
+    for doc_sentences in sentences:
+        end = start + len(doc_sentences)
+        filtered.append(join_sentences(doc_sentences, verdicts[start:end]))
+        start = end
+    return filtered
+
+
+def word_similarity(first, second):
+    """Jaccard similarity of the word sets of two texts."""
+    first, second = set(first.split()), set(second.split())
+    return len(first & second) / len(first | second) if first | second else 1.0
+
+
+def compare_hierarchy(nlp, documents, settings=HIERARCHY_CONFIG):
+    """Compare the paragraph first filter against the sentence only one on the given documents."""
+    import time
+    from collections import Counter
+
+    from utils.prefilter import format_report
+
+    results = {}
+    for name, hierarchy in [("sentences", None), ("hierarchy", {**settings, "enabled": True})]:
+        stats = Counter()
+        start = time.perf_counter()
+        results[name] = filter_documents(nlp, documents, stats=stats, hierarchy=hierarchy)
+        print(f"{name}: {time.perf_counter() - start:.2f}s, {format_report(stats)}")
+    for i, (sentences, hierarchy) in enumerate(zip(results["sentences"], results["hierarchy"])):
+        print(f"  document {i}: {len(sentences)} -> {len(hierarchy)} characters, "
+              f"word similarity {word_similarity(sentences, hierarchy):.2%}")
+    return results
+
+
+if __name__ == "__main__":
+    # python -m utils.text_filter <TEI files or folders> [--model path]
+    import argparse
+    import glob
+    import json
+    import os
+
+    from utils.Labeling_text import MODEL_CONFIG, build_model
+    from utils.artifacts import open_artifact
+    from utils.tei import iter_paragraphs
+
+    parser = argparse.ArgumentParser(description="Compare the paragraph first filter with the sentence only one.")
+    parser.add_argument("paths", nargs="+", help="TEI files or folders with *.tei.xml(.gz) files")
+    parser.add_argument("--model", help="trained pipeline, by default the one built from the current dataset")
+    args = parser.parse_args()
+
+    with open("config.json", "r") as f:
+        config = json.load(f)
+    settings = {**HIERARCHY_CONFIG, **config.get("hierarchy", {})}
+    nlp = load_pipeline(args.model or build_model({**MODEL_CONFIG, **config.get("model", {})}))
+    files = []
+    for path in args.paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "**", "*.tei.xml*"), recursive=True))
+                     if os.path.isdir(path) else [path])
+    documents = []
+    for file in files:
+        with open_artifact(file) as tei:
+            documents.append(list(iter_paragraphs(tei)))
+    compare_hierarchy(nlp, documents, settings)
@@ -0,0 +1,176 @@
+# Text-layer fast path: born-digital PDFs with a clean text layer are extracted locally instead of by Grobid.
+import gzip
+import os
+import re
+import statistics
+from collections import Counter
+
+# Defaults for the "text_layer" section of config.json
+TEXT_LAYER_CONFIG = {
+    "enabled": True,  # route born-digital PDFs past Grobid
+    "sample_pages": 6,  # pages whose text is scored before the whole document is extracted
+    "min_chars_per_page": 800,  # scans and image-only pages have (almost) no text layer
+    "max_bad_char_ratio": 0.002,  # replacement, control, private use characters and "(cid:N)" per character
+    "max_hyphen_ratio": 0.25,  # share of lines ending with a hyphenated word (repaired, but many means narrow columns)
+    "max_gap_ratio": 0.05,  # share of lines with a wide gap inside, two columns read as one line
+    "max_split_word_ratio": 0.08,  # share of one-letter tokens that are not Polish words (letter-spaced or torn text)
+    "min_diacritic_ratio": 0.005  # Polish diacritics among letters, lower means a broken font encoding
+}
+
+POLISH_DIACRITICS = set("ąćęłńóśźżĄĆĘŁŃÓŚŹŻ")
+SINGLE_LETTER_WORDS = set("aiouwzAIOUWZ")
+BAD_CHARACTER = re.compile(r"[\ufffd\ue000-\uf8ff\x00-\x08\x0b\x0c\x0e-\x1f]|\(cid:\d+\)")
+HYPHENATED = re.compile(r"\w[-­]$")
+GAP = re.compile(r"\S {3,}\S")
+PAGE_NUMBER = re.compile(r"^\W*\d+\W*$")
+SENTENCE_END = re.compile(r"[.!?:…]['\"”)]*$")
+# Headings after which the rest of the document is the bibliography (Grobid drops it as well)
+BIBLIOGRAPHY = re.compile(r"^(\d+(\.\d+)*\.?\s*)?(piśmiennictwo|bibliografia|literatura|spis literatury|"
+                          r"spis piśmiennictwa|references|bibliography)$", re.IGNORECASE)
+
+
+def sample_indices(page_count, sample_pages):
+    """Pages spread evenly over the body of the document, skipping the title pages and the end matter."""
+    if page_count <= sample_pages:
+        return list(range(page_count))
+    first, last = page_count // 10, page_count - 1 - page_count // 10
+    step = (last - first) / max(1, sample_pages - 1)
+    return sorted({first + round(i * step) for i in range(sample_pages)})
+
+
+def quality(pages, settings=TEXT_LAYER_CONFIG):
+    """Quality metrics of the text of the sampled pages and their score.
+
+    The score is the smallest headroom left below the limits of the settings (1 = perfect, <= 0 = a limit is
+    exceeded), so a positive score means the document can skip Grobid.
+    """
+    text = "\n".join(pages)
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    letters = [char for char in text if char.isalpha()]
+    tokens = re.findall(r"\w+", text)
+    single = [token for token in tokens if len(token) == 1 and token.isalpha()]
+    metrics = {
+        "chars_per_page": len(text) / max(1, len(pages)),
+        "bad_char_ratio": len(BAD_CHARACTER.findall(text)) / max(1, len(text)),
+        "hyphen_ratio": sum(1 for line in lines if HYPHENATED.search(line)) / max(1, len(lines)),
+        "gap_ratio": sum(1 for line in lines if GAP.search(line)) / max(1, len(lines)),
+        "split_word_ratio": sum(1 for token in single if token not in SINGLE_LETTER_WORDS) / max(1, len(tokens)),
+        "diacritic_ratio": sum(1 for char in letters if char in POLISH_DIACRITICS) / max(1, len(letters))
+    }
+    headroom = [
+        1 - settings["min_chars_per_page"] / max(1.0, metrics["chars_per_page"]),
+        1 - metrics["bad_char_ratio"] / settings["max_bad_char_ratio"],
+        1 - metrics["hyphen_ratio"] / settings["max_hyphen_ratio"],
+        1 - metrics["gap_ratio"] / settings["max_gap_ratio"],
+        1 - metrics["split_word_ratio"] / settings["max_split_word_ratio"],
+        1 - settings["min_diacritic_ratio"] / max(1e-9, metrics["diacritic_ratio"])
+    ]
+    metrics["score"] = max(-1.0, min(headroom))
+    return metrics
+
+
+def page_lines(pages):
+    """Lines of every page without the headers and footers repeated on many pages and without page numbers."""
+    pages = [[line.strip() for line in page.splitlines() if line.strip()] for page in pages]
+    repeated = Counter(key for lines in pages for key in {re.sub(r"\d+", "#", line) for line in lines})
+    threshold = max(3, len(pages) // 2)
+    return [[line for line in lines
+             if not PAGE_NUMBER.match(line) and repeated[re.sub(r"\d+", "#", line)] < threshold]
+            for lines in pages]
+
+
+def paragraphs_from_pages(pages):
+    """Rebuild the paragraphs from the lines of the pages, joining hyphenated words.
+
+    A paragraph ends at a line that ends a sentence and is clearly shorter than a full line; the
+    bibliography is cut off like Grobid does.
+    """
+    lines = [line for lines in page_lines(pages) for line in lines]
+    if not lines:
+        return []
+    full_line = statistics.median(len(line) for line in lines)
+    paragraphs = []
+    current = ""
+    for index, line in enumerate(lines):
+        if BIBLIOGRAPHY.match(line) and index > len(lines) // 2:
+            break
+        if current.endswith(("-", "­")) and current[-2:-1].isalpha() and line[:1].islower():
+            current = current[:-1] + line
+        else:
+            current = f"{current} {line}" if current else line
+        if SENTENCE_END.search(line) and len(line) < 0.8 * full_line:
+            paragraphs.append(current)
+            current = ""
+    if current:
+        paragraphs.append(current)
+    return paragraphs
+
+
+def extract_pages(reader, indices):
+    pages = []
+    for index in indices:
+        try:
+            pages.append(reader.pages[index].extract_text() or "")
+        except Exception:
+            # a page the extractor cannot read counts as a page without text
+            pages.append("")
+    return pages
+
+
+def route_pdf(pdf_path, output_path, settings=TEXT_LAYER_CONFIG):
+    """Score the text layer on a sample of pages and, if it is good, write the paragraphs to output_path.
+
+    Returns ("text_layer" or "grobid", metrics); output_path has one paragraph per line.
+    """
+    from PyPDF2 import PdfReader
+
+    try:
+        reader = PdfReader(pdf_path)
+        page_count = len(reader.pages)
+    except Exception as e:
+        return "grobid", {"error": str(e)}
+    sample = sample_indices(page_count, settings["sample_pages"])
+    metrics = quality(extract_pages(reader, sample), settings)
+    if metrics["score"] <= 0:
+        return "grobid", metrics
+
+    paragraphs = paragraphs_from_pages(extract_pages(reader, range(page_count)))
+    with open(output_path + ".part", "w", encoding="utf-8") as file:
+        for paragraph in paragraphs:
+            file.write(paragraph.replace("\n", " ") + "\n")
+    os.replace(output_path + ".part", output_path)
+    return "text_layer", metrics
+
+
+def read_paragraphs(path):
+    """Stream the paragraphs written by route_pdf (gzip compressed once they are in the artifact store)."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield line
+
+
+if __name__ == "__main__":
+    # python -m utils.text_layer <PDF files or folders>
+    # Prints the route and the quality metrics of every PDF without writing anything.
+    import glob
+    import json
+    import sys
+    import tempfile
+
+    with open("config.json", "r") as f:
+        settings = {**TEXT_LAYER_CONFIG, **json.load(f).get("text_layer", {})}
+    paths = []
+    for path in sys.argv[1:]:
+        paths.extend(sorted(glob.glob(os.path.join(path, "**", "*.pdf"), recursive=True))
+                     if os.path.isdir(path) else [path])
+    routes = Counter()
+    with tempfile.TemporaryDirectory() as directory:
+        for path in paths:
+            route, metrics = route_pdf(path, os.path.join(directory, "paragraphs.txt"), settings)
+            routes[route] += 1
+            print(f"{route:10} {path} " + ", ".join(f"{key}={value:.3f}" if isinstance(value, float) else
+                                                    f"{key}={value}" for key, value in metrics.items()))
+    print(f"{len(paths)} PDFs: " + ", ".join(f"{route} {count}" for route, count in sorted(routes.items())))
@@ -0,0 +1,115 @@
+# On-disk cache of sentence verdicts shared by all batch processes on a machine.
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Defaults for the "cache" section of config.json
+CACHE_CONFIG = {
+    "enabled": True,
+    "path": "cache/verdicts.sqlite",
+    "max_entries": 5000000  # least recently used verdicts above this bound are evicted
+}
+
+
+def model_fingerprint(model_path="./spacy", settings=None):
+    """Hash of every file of the saved pipeline (and of the settings that change the verdict)."""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(model_path):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, model_path).replace(os.sep, "/").encode("utf-8"))
+            with open(path, "rb") as file:
+                for chunk in iter(lambda: file.read(1 << 20), b""):
+                    digest.update(chunk)
+    if settings is not None:
+        digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def normalize(text):
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def sentence_key(text):
+    return hashlib.blake2b(normalize(text).encode("utf-8"), digest_size=16).digest()
+
+
+class VerdictCache:
+    """normalized sentence hash -> keep/drop verdict, stored in SQLite and scoped to one model fingerprint."""
+
+    def __init__(self, path, fingerprint, max_entries=CACHE_CONFIG["max_entries"]):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        # WAL lets many batch processes read while one of them writes; the threads of a process (the clean stage
+        # without NLP processes, the resident worker) share the connection under the lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "fingerprint TEXT NOT NULL, key BLOB NOT NULL, verdict INTEGER NOT NULL, last_used INTEGER NOT NULL, "
+            "PRIMARY KEY (fingerprint, key)) WITHOUT ROWID")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts (last_used)")
+        self.connection.commit()
+
+    def get_many(self, texts):
+        """Return {index: verdict} for the texts that are already cached."""
+        keys = [sentence_key(text) for text in texts]
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.connection.execute(
+                    f"SELECT key, verdict FROM verdicts WHERE fingerprint = ? AND key IN ({placeholders})",
+                    [self.fingerprint, *chunk]).fetchall()
+                found.update((key, bool(verdict)) for key, verdict in rows)
+
+            if found:
+                now = int(time.time())
+                with self.connection:
+                    self.connection.executemany(
+                        "UPDATE verdicts SET last_used = ? WHERE fingerprint = ? AND key = ?",
+                        [(now, self.fingerprint, key) for key in found])
+        return {i: found[key] for i, key in enumerate(keys) if key in found}
+
+    def put_many(self, texts, verdicts):
+        now = int(time.time())
+        with self.lock:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO verdicts (fingerprint, key, verdict, last_used) VALUES (?, ?, ?, ?)",
+                    [(self.fingerprint, sentence_key(text), int(verdict), now)
+                     for text, verdict in zip(texts, verdicts)])
+            self.evict()
+
+    def evict(self):
+        """Drop the least recently used verdicts (of any fingerprint) down to 90% of max_entries (hold the lock)."""
+        count = self.connection.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM verdicts WHERE (fingerprint, key) IN "
+                "(SELECT fingerprint, key FROM verdicts ORDER BY last_used LIMIT ?)",
+                [count - int(self.max_entries * 0.9)])
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def open_cache(settings, model_path="./spacy", verdict_settings=None):
+    """VerdictCache for the "cache" section of config.json, or None when it is disabled."""
+    if not settings.get("enabled", True):
+        return None
+    return VerdictCache(settings["path"], model_fingerprint(model_path, verdict_settings), settings["max_entries"])
@@ -0,0 +1,165 @@
+# Lease-based work queue of documents, shared by any number of worker processes or machines.
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Defaults for the "queue" section of config.json
+QUEUE_CONFIG = {
+    "lease_seconds": 600,  # a document is given back to the queue if its worker stops sending heartbeats
+    "heartbeat_seconds": 60,
+    "max_attempts": 3,  # failed documents are retried until this many attempts
+    "max_claimed": None,  # documents a worker holds at once, defaults to the workers of all its pipeline stages
+    "poll_seconds": 10  # how often a worker with nothing to claim checks whether leased documents came back
+}
+
+COLUMNS = ["ID", "Title", "URL", "License", "File"]
+
+
+def worker_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """Documents stored in SQLite with a status (pending, leased, done, failed) and a lease per claim.
+
+    The default rollback journal (not WAL) keeps the file usable from several machines on shared storage.
+    """
+
+    def __init__(self, path, lease_seconds=QUEUE_CONFIG["lease_seconds"], max_attempts=QUEUE_CONFIG["max_attempts"]):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=120, isolation_level=None, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "id INTEGER PRIMARY KEY, title TEXT, url TEXT, license TEXT, file TEXT, "
+            "status TEXT NOT NULL DEFAULT 'pending', worker TEXT, lease_expires REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, updated REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, id)")
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers never claim the same document
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def add(self, rows):
+        """Add documents (dicts with the file_links.csv columns); documents already in the queue are kept."""
+        with self.transaction() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO tasks (id, title, url, license, file, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                [(int(row["ID"]), row["Title"], row["URL"], row["License"], row["File"], time.time())
+                 for row in rows])
+
+    def claim(self, worker):
+        """Lease the next pending document to the worker, or return None when nothing is left to do."""
+        now = time.time()
+        with self.transaction() as connection:
+            # leases of crashed workers expire and go back to the queue
+            connection.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, worker = NULL, "
+                "updated = ? WHERE status = 'leased' AND lease_expires < ?",
+                (self.max_attempts, now, now))
+            row = connection.execute(
+                "UPDATE tasks SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated = ? WHERE id = (SELECT id FROM tasks WHERE status = 'pending' ORDER BY id LIMIT 1) "
+                "RETURNING id, title, url, license, file",
+                (worker, now + self.lease_seconds, now)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(COLUMNS, row))
+
+    def heartbeat(self, worker):
+        """Extend the leases of every document held by the worker."""
+        now = time.time()
+        with self.transaction() as connection:
+            connection.execute("UPDATE tasks SET lease_expires = ?, updated = ? WHERE status = 'leased' AND worker = ?",
+                               (now + self.lease_seconds, now, worker))
+
+    def complete(self, task_id, worker):
+        with self.transaction() as connection:
+            connection.execute("UPDATE tasks SET status = 'done', updated = ? WHERE id = ? AND worker = ?",
+                               (time.time(), task_id, worker))
+
+    def fail(self, task_id, worker):
+        """Give the document back to the queue, or mark it failed after max_attempts; a done document stays done."""
+        with self.transaction() as connection:
+            connection.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, worker = NULL, "
+                "updated = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (self.max_attempts, time.time(), task_id, worker))
+
+    def rows(self):
+        """All documents in the queue, whatever their status."""
+        with self.lock:
+            rows = self.connection.execute("SELECT id, title, url, license, file FROM tasks ORDER BY id").fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def progress(self):
+        """Number of documents per status; expired leases are counted as pending."""
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT CASE WHEN status = 'leased' AND lease_expires < ? THEN 'pending' ELSE status END AS state, "
+                "COUNT(*) FROM tasks GROUP BY state", (time.time(),)).fetchall()
+        counts.update(rows)
+        return counts
+
+    def close(self):
+        self.connection.close()
+
+
+class Heartbeat:
+    """Background thread renewing the worker's leases while it is processing documents."""
+
+    def __init__(self, queue, worker, interval=QUEUE_CONFIG["heartbeat_seconds"]):
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(queue, worker, interval), daemon=True)
+
+    def run(self, queue, worker, interval):
+        while not self.stopped.wait(interval):
+            try:
+                queue.heartbeat(worker)
+            except sqlite3.Error as e:
+                print(f"heartbeat error: {e}")
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def format_progress(counts):
+    total = sum(counts.values())
+    finished = counts["done"] + counts["failed"]
+    percent = finished / total if total else 1.0
+    return (f"Queue: {finished}/{total} finished ({percent:.1%}), done {counts['done']}, failed {counts['failed']}, "
+            f"leased {counts['leased']}, pending {counts['pending']}")
+
+
+if __name__ == "__main__":
+    # python -m utils.work_queue <queue.sqlite> [--watch seconds]
+    import sys
+
+    if len(sys.argv) not in (2, 4):
+        print("Usage: python -m utils.work_queue <queue.sqlite> [--watch seconds]")
+        sys.exit(1)
+    work_queue = WorkQueue(sys.argv[1])
+    while True:
+        counts = work_queue.progress()
+        print(format_progress(counts))
+        if len(sys.argv) == 2 or counts["pending"] + counts["leased"] == 0:
+            break
+        time.sleep(float(sys.argv[3]))